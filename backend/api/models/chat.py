@@ -5,9 +5,9 @@ For use with FastAPI endpoints
 
 from datetime import datetime
 from enum import Enum
-from typing import Optional, List
+from typing import Dict, Optional, List
 from uuid import UUID
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
 
 # ============================================================================
@@ -47,8 +47,25 @@ class SendMessageRequest(BaseModel):
 
 
 class MarkAsReadRequest(BaseModel):
-    """Request payload for marking messages as read"""
-    message_ids: List[UUID] = Field(..., min_length=1)
+    """
+    Request payload for marking messages as read
+
+    Either message_ids, or conversation_id with up_to (a message cursor) or
+    up_to_timestamp to mark everything received up to that point.
+    """
+    message_ids: Optional[List[UUID]] = Field(None, min_length=1)
+    conversation_id: Optional[UUID] = None
+    up_to: Optional[str] = Field(None, description="Cursor of the newest message seen (prev_cursor of the newest page)")
+    up_to_timestamp: Optional[datetime] = None
+
+    @model_validator(mode="after")
+    def check_mode(self):
+        if self.message_ids is not None:
+            if self.conversation_id or self.up_to or self.up_to_timestamp:
+                raise ValueError("Use either message_ids or conversation_id with up_to/up_to_timestamp")
+        elif self.conversation_id is None or (self.up_to is None) == (self.up_to_timestamp is None):
+            raise ValueError("conversation_id requires exactly one of up_to or up_to_timestamp")
+        return self
 
     class Config:
         json_schema_extra = {
@@ -73,6 +90,29 @@ class UpdateConversationRequest(BaseModel):
         }
 
 
+class PresignUploadRequest(BaseModel):
+    """Request payload for a presigned direct-to-S3 upload"""
+    filename: str = Field(..., min_length=1, max_length=255)
+    content_type: str
+    file_size: int = Field(..., gt=0, description="Exact size in bytes")
+    method: str = Field("POST", pattern="^(POST|PUT)$")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "filename": "photo.jpg",
+                "content_type": "image/jpeg",
+                "file_size": 1024000,
+                "method": "POST"
+            }
+        }
+
+
+class CompleteUploadRequest(BaseModel):
+    """Request payload for finalizing a presigned upload"""
+    key: str = Field(..., min_length=1)
+
+
 class TypingIndicatorRequest(BaseModel):
     """Request payload for typing indicator"""
     conversation_id: UUID
@@ -151,6 +191,10 @@ class ConversationResponse(BaseModel):
     # Unread count
     unread_count: int = 0
 
+    # Read watermarks: everything received up to these times has been read
+    last_read_at: Optional[datetime] = None
+    other_last_read_at: Optional[datetime] = None
+
     class Config:
         from_attributes = True
 
@@ -158,18 +202,44 @@ class ConversationResponse(BaseModel):
 class ConversationsListResponse(BaseModel):
     """Response schema for list of conversations"""
     data: List[ConversationResponse]
-    total: int
+    total: Optional[int] = None  # Only computed when requested
     page: int = 1
     page_size: int = 20
+    has_more: bool = False
+    next_cursor: Optional[str] = None  # Pass as ?cursor= to get the next page
 
 
 class MessagesListResponse(BaseModel):
     """Response schema for list of messages"""
     data: List[MessageResponse]
-    total: int
+    total: Optional[int] = None  # Not computed: use has_more and the cursors
     page: int = 1
     page_size: int = 50
+    has_more: bool = False  # More messages in the direction being paged
+    next_cursor: Optional[str] = None  # Pass as ?before= to load older messages
+    prev_cursor: Optional[str] = None  # Pass as ?after= to load newer messages
+
+
+class MessageSearchHit(MessageResponse):
+    """Message matching a search, with the matched text in context"""
+    snippet: str  # HTML-escaped, matches wrapped in <mark>...</mark>
+
+
+class MessageSearchResponse(BaseModel):
+    """Search results (newest first)"""
+    data: List[MessageSearchHit]
     has_more: bool = False
+    next_cursor: Optional[str] = None  # Pass as ?before= to get older results
+
+
+class SyncResponse(BaseModel):
+    """Response schema for delta sync: what changed for the user since a token"""
+    messages: List[MessageResponse] = []  # New or updated (status, thumbnail) messages
+    deleted_message_ids: List[UUID] = []
+    conversations: List[ConversationResponse] = []  # New activity, settings, unread counts
+    deleted_conversation_ids: List[UUID] = []
+    token: str  # Pass as ?since= on the next sync
+    has_more: bool = False  # Sync again right away with the new token
 
 
 class UnreadCountResponse(BaseModel):
@@ -196,6 +266,28 @@ class UploadResponse(BaseModel):
         }
 
 
+class PresignedUploadResponse(BaseModel):
+    """Response schema for a presigned upload"""
+    key: str
+    method: str
+    upload_url: str
+    fields: Dict[str, str] = Field(default_factory=dict)  # Form fields for POST
+    headers: Dict[str, str] = Field(default_factory=dict)  # Required headers for PUT
+    expires_in: int
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "key": "chat/123/2025/10/550e8400-e29b-41d4-a716-446655440000.jpg",
+                "method": "POST",
+                "upload_url": "https://growzone-chat.s3.amazonaws.com/",
+                "fields": {"key": "chat/123/...", "Content-Type": "image/jpeg", "policy": "...", "x-amz-signature": "..."},
+                "headers": {},
+                "expires_in": 300
+            }
+        }
+
+
 # ============================================================================
 # WEBSOCKET SCHEMAS
 # ============================================================================
@@ -216,6 +308,7 @@ class WebSocketEvent(str, Enum):
     USER_ONLINE = "userOnline"
     USER_OFFLINE = "userOffline"
     PONG = "pong"
+    RESYNC = "resync"  # Events were dropped: catch up through GET /chat/sync
 
 
 class WebSocketMessage(BaseModel):
@@ -237,9 +330,9 @@ class WebSocketEventPayload(BaseModel):
 """
 Example SQLAlchemy models (adapt to your existing models):
 
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Computed, Integer, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID
+from sqlalchemy.orm import deferred, relationship
 import uuid
 
 class Conversation(Base):
@@ -262,6 +355,17 @@ class Conversation(Base):
     participant2_archived = Column(Boolean, default=False)
     participant2_deleted_at = Column(DateTime)
 
+    # Unread counters (maintained on write, see migration 005)
+    participant1_unread_count = Column(Integer, nullable=False, default=0)
+    participant2_unread_count = Column(Integer, nullable=False, default=0)
+
+    # Read watermarks (see migration 008)
+    participant1_last_read_at = Column(DateTime)
+    participant2_last_read_at = Column(DateTime)
+
+    # Set by trigger on every write (see migration 009)
+    changed_at = Column(DateTime)
+
     # Relationships
     messages = relationship("Message", back_populates="conversation")
 
@@ -269,6 +373,8 @@ class Conversation(Base):
 class Message(Base):
     __tablename__ = "messages"
 
+    # Partitioned by month of created_at since migration 011: the table's
+    # primary key is (id, created_at); id alone stays the ORM identity
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     conversation_id = Column(UUID(as_uuid=True), ForeignKey("conversations.id"), nullable=False)
     sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -280,9 +386,9 @@ class Message(Base):
     media_thumbnail_url = Column(Text)
     audio_duration = Column(Integer)
 
-    reply_to_id = Column(UUID(as_uuid=True), ForeignKey("messages.id"))
+    reply_to_id = Column(UUID(as_uuid=True))  # No foreign key on a partitioned table
 
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     sent_at = Column(DateTime)
     delivered_at = Column(DateTime)
     read_at = Column(DateTime)
@@ -290,6 +396,16 @@ class Message(Base):
     sender_deleted_at = Column(DateTime)
     recipient_deleted_at = Column(DateTime)
 
+    # Set by trigger on every write (see migration 009)
+    changed_at = Column(DateTime)
+
+    # Generated full-text search document (see migration 010); deferred so
+    # message pages do not load it
+    search_vector = deferred(Column(
+        TSVECTOR,
+        Computed("to_tsvector('chat_portuguese'::regconfig, COALESCE(text_content, ''))", persisted=True)
+    ))
+
     # Relationships
     conversation = relationship("Conversation", back_populates="messages")
     sender = relationship("User", foreign_keys=[sender_id])
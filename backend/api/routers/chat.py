@@ -1,15 +1,21 @@
 """
 Chat Router - FastAPI Endpoints
 Add to your Social API: app.include_router(chat_router, prefix="/api/v1")
+and, for Prometheus, app.include_router(metrics_router) (routers/metrics.py)
 """
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_, func
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import or_, and_, func, literal, select, tuple_, union_all, update
+from typing import AsyncIterator, List, Optional
+from collections import Counter
 from uuid import UUID
 from datetime import datetime, timedelta
+import asyncio
 import boto3
+import uuid
 from botocore.exceptions import ClientError
 import os
 
@@ -21,75 +27,241 @@ from ..models.chat import (
     ConversationResponse,
     ConversationsListResponse,
     MessagesListResponse,
+    MessageSearchResponse,
     UnreadCountResponse,
+    SyncResponse,
     UploadResponse,
+    PresignUploadRequest,
+    PresignedUploadResponse,
+    CompleteUploadRequest,
     UserInfo,
     ContentType,
+    WebSocketEvent,
+)
+from ..database import get_db, read_router
+from ..services.compact import negotiate_compact, render_compact
+from ..services.conversations import (
+    conversation_ids,
+    conversation_participants,
+    get_or_create_conversation_id,
+    get_participants,
+)
+from ..services.cursors import encode_cursor, decode_cursor
+from ..services.etags import (
+    etag_matches,
+    make_etag,
+    not_modified,
+    page_users,
+    profile_version,
+    set_etag,
+    stable_version,
+    user_version,
+)
+from ..services.events import EVENTS_BRIDGE_URL, PostgresEventBridge, event_hub
+from ..services.feature_flags import require_feature
+from ..services.inbox import build_inbox_rows
+from ..services.media_processing import (
+    LocalStorage,
+    MediaProcessor,
+    S3Storage,
+    get_ready_thumbnail,
+)
+from ..services.media_upload import UploadRejected, stream_multipart_upload
+from ..services.metrics import REGISTRY, UPLOAD_S3_SECONDS, MetricsRoute, gauges
+from ..services.outbox import (
+    OUTBOX_ENABLED,
+    OutboxDispatcher,
+    enqueue_event,
+    websocket_gateway,
+)
+from ..services.read_receipts import mark_read_up_to, read_watermarks
+from ..services.replicas import LSN_COOKIE
+from ..services.search import search_messages
+from ..services.serializers import (
+    FAST_SERIALIZATION,
+    MESSAGE_FIELDS,
+    conversations_page_adapter,
+    message_row,
+    messages_page_adapter,
+    render_page,
+    to_message_response,
+)
+from ..services.sync import decode_sync_token, initial_sync_token, load_changes
+from ..services.typing import typing_store
+from ..services.user_loader import UserLoader, get_user_loader
+from ..services.unread import (
+    add_unread,
+    remove_unread,
+    clear_unread,
+    conversation_unread_count,
+    get_user_unread_totals,
 )
 
 # Import your existing dependencies
-# from ..dependencies import get_db, get_current_user
+# from ..dependencies import get_current_user
 # from ..models import User, Conversation, Message
 
 
-router = APIRouter(prefix="/chat", tags=["chat"])
+router = APIRouter(prefix="/chat", tags=["chat"], route_class=MetricsRoute)
 
 # AWS S3 Configuration
 S3_BUCKET = os.getenv("CHAT_S3_BUCKET", "growzone-chat-media")
 S3_REGION = os.getenv("AWS_REGION", "us-east-1")
-s3_client = boto3.client("s3", region_name=S3_REGION)
+# Optional S3-compatible endpoint (e.g. MinIO from local-test/docker-compose.yml)
+S3_ENDPOINT_URL = os.getenv("CHAT_S3_ENDPOINT_URL") or None
+# Lifetime of presigned upload URLs, in seconds
+S3_PRESIGN_EXPIRES = int(os.getenv("CHAT_S3_PRESIGN_EXPIRES", "300"))
+s3_client = boto3.client("s3", region_name=S3_REGION, endpoint_url=S3_ENDPOINT_URL)
+
+# Media upload rules
+ALLOWED_MEDIA_TYPES = ["image/jpeg", "image/png", "image/gif", "image/webp",
+                       "video/mp4", "video/quicktime", "audio/mpeg", "audio/m4a", "audio/wav"]
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
+MAX_VIDEO_AUDIO_SIZE = 50 * 1024 * 1024
+
+# Background thumbnails / WebP variants / video posters.
+# Set CHAT_MEDIA_LOCAL_DIR to process files from a local directory instead of S3.
+MEDIA_LOCAL_DIR = os.getenv("CHAT_MEDIA_LOCAL_DIR")
+
+# SSE / long-poll channel: keepalive interval and max long-poll wait, in seconds
+EVENTS_KEEPALIVE = float(os.getenv("CHAT_EVENTS_KEEPALIVE", "15"))
+EVENTS_MAX_WAIT = float(os.getenv("CHAT_EVENTS_MAX_WAIT", "55"))
+
+
+# ============================================================================
+# DATABASE SESSIONS
+# ============================================================================
+
+async def get_read_db(
+    request: Request,
+    current_user: User = Depends(get_current_user)
+) -> AsyncIterator[AsyncSession]:
+    """Read-only endpoints: a replica that has the user's last commit (chat_lsn cookie), else the primary"""
+    async with read_router.session(current_user.id, request.cookies.get(LSN_COOKIE)) as db:
+        yield db
+
+
+async def get_write_db(
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+) -> AsyncSession:
+    """Primary session; its commits set the chat_lsn cookie so the user's reads wait for them on any worker"""
+    read_router.track_writes(db, (current_user.id,), response)
+    return db
+
+
+def get_read_user_loader(db: AsyncSession = Depends(get_read_db)) -> UserLoader:
+    """UserLoader sharing the read-only session"""
+    return UserLoader(db)
 
 
 # ============================================================================
 # UTILITY FUNCTIONS
 # ============================================================================
 
-def get_or_create_conversation(
-    db: Session,
-    user1_id: int,
-    user2_id: int
-) -> "Conversation":
-    """Get existing conversation or create new one"""
-    # Ensure ordering
-    p1_id = min(user1_id, user2_id)
-    p2_id = max(user1_id, user2_id)
-
-    # Try to get existing
-    conversation = db.query(Conversation).filter(
-        Conversation.participant1_id == p1_id,
-        Conversation.participant2_id == p2_id
-    ).first()
-
-    if conversation:
-        return conversation
-
-    # Create new
-    conversation = Conversation(
-        participant1_id=p1_id,
-        participant2_id=p2_id
+def get_max_media_size(content_type: str) -> int:
+    """Max upload size: 10MB for images, 50MB for video/audio"""
+    return MAX_IMAGE_SIZE if content_type.startswith("image/") else MAX_VIDEO_AUDIO_SIZE
+
+
+def build_media_key(user_id: int, filename: str) -> str:
+    """S3 key for a user's upload: chat/{user_id}/{YYYY/MM}/{uuid}.{ext}"""
+    file_ext = filename.split(".")[-1] if "." in filename else "bin"
+    return f"chat/{user_id}/{datetime.utcnow().strftime('%Y/%m')}/{uuid.uuid4()}.{file_ext}"
+
+
+def get_media_url(key: str) -> str:
+    """Public URL of an uploaded object"""
+    if S3_ENDPOINT_URL:
+        return f"{S3_ENDPOINT_URL.rstrip('/')}/{S3_BUCKET}/{key}"
+    return f"https://{S3_BUCKET}.s3.{S3_REGION}.amazonaws.com/{key}"
+
+
+media_processor = MediaProcessor(
+    LocalStorage(MEDIA_LOCAL_DIR, os.getenv("CHAT_MEDIA_LOCAL_BASE_URL", ""))
+    if MEDIA_LOCAL_DIR
+    else S3Storage(s3_client, S3_BUCKET, get_media_url)
+)
+router.add_event_handler("startup", media_processor.start)
+router.add_event_handler("shutdown", media_processor.stop)
+
+# Cross-worker fan-out for GET /chat/events (see services/events.py)
+if EVENTS_BRIDGE_URL:
+    event_bridge = PostgresEventBridge(event_hub, EVENTS_BRIDGE_URL)
+    router.add_event_handler("startup", event_bridge.start)
+    router.add_event_handler("shutdown", event_bridge.stop)
+
+# Replica lag checks for get_read_db (no-op without DATABASE_REPLICA_URLS)
+if read_router.replicas:
+    router.add_event_handler("startup", read_router.start)
+    router.add_event_handler("shutdown", read_router.stop)
+
+# WebSocket delivery of the events committed to chat_outbox (see services/outbox.py)
+if OUTBOX_ENABLED:
+    outbox_dispatcher = OutboxDispatcher(websocket_gateway)
+    router.add_event_handler("startup", outbox_dispatcher.start)
+    router.add_event_handler("shutdown", outbox_dispatcher.stop)
+    REGISTRY.register_collector(
+        gauges("chat_outbox", "Chat outbox backlog, lag and deliveries (see OutboxDispatcher.stats)",
+               outbox_dispatcher.stats)
     )
-    db.add(conversation)
-    db.commit()
-    db.refresh(conversation)
-    return conversation
 
 
-def get_user_conversations_query(db: Session, user_id: int):
-    """Get base query for user's conversations"""
-    return db.query(Conversation).filter(
-        or_(
-            and_(
-                Conversation.participant1_id == user_id,
-                Conversation.participant1_deleted_at == None
-            ),
-            and_(
-                Conversation.participant2_id == user_id,
-                Conversation.participant2_deleted_at == None
-            )
+def get_user_conversations_filter(user_id: int):
+    """Get the WHERE clause selecting a user's (not deleted) conversations"""
+    return or_(
+        and_(
+            Conversation.participant1_id == user_id,
+            Conversation.participant1_deleted_at == None
+        ),
+        and_(
+            Conversation.participant2_id == user_id,
+            Conversation.participant2_deleted_at == None
         )
     )
 
 
+async def get_user_conversations_keyset(
+    db: AsyncSession,
+    user_id: int,
+    limit: int,
+    after: Optional[tuple] = None
+) -> List["Conversation"]:
+    """
+    Get a page of the user's conversations ordered by (updated_at, id) DESC.
+
+    Each participant side is read as its own LIMITed range scan on
+    idx_conversation_p1_updated_id / idx_conversation_p2_updated_id and the two
+    legs are merged, so the cost does not grow with how deep the page is.
+    """
+    legs = []
+    for participant_id, deleted_at in (
+        (Conversation.participant1_id, Conversation.participant1_deleted_at),
+        (Conversation.participant2_id, Conversation.participant2_deleted_at),
+    ):
+        leg = select(Conversation.id, Conversation.updated_at).where(
+            participant_id == user_id,
+            deleted_at == None
+        )
+        if after is not None:
+            leg = leg.where(tuple_(Conversation.updated_at, Conversation.id) < tuple_(*after))
+        legs.append(
+            leg.order_by(Conversation.updated_at.desc(), Conversation.id.desc()).limit(limit)
+        )
+
+    page_ids = union_all(*[leg.subquery().select() for leg in legs]).subquery("page_ids")
+
+    return (await db.execute(
+        select(Conversation).join(
+            page_ids, Conversation.id == page_ids.c.id
+        ).order_by(
+            Conversation.updated_at.desc(),
+            Conversation.id.desc()
+        ).limit(limit)
+    )).scalars().all()
+
+
 def get_other_user_id(conversation: "Conversation", current_user_id: int) -> int:
     """Get the other participant's ID"""
     if conversation.participant1_id == current_user_id:
@@ -118,88 +290,132 @@ def get_user_settings(conversation: "Conversation", user_id: int) -> dict:
 
 @router.get("/conversations", response_model=ConversationsListResponse)
 async def get_conversations(
+    request: Request,
+    response: Response,
     page: int = 1,
     page_size: int = 20,
+    cursor: Optional[str] = None,
+    include_total: Optional[bool] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db),
+    users: UserLoader = Depends(get_read_user_loader)
 ):
     """
     Get all conversations for the current user
 
-    - **page**: Page number (default: 1)
+    - **page**: Page number (default: 1, ignored when cursor is set)
     - **page_size**: Items per page (default: 20, max: 100)
+    - **cursor**: Opaque cursor from a previous response's next_cursor
+    - **include_total**: Compute the exact total (default: only without cursor)
+
+    Supports If-None-Match: returns 304 when nothing in the inbox, nor the
+    profiles shown on the page, changed.
+    Send Accept: application/vnd.growzone.compact+json (or +msgpack) for the
+    columnar encoding (see services/compact.py).
     """
     if page_size > 100:
         page_size = 100
 
-    offset = (page - 1) * page_size
+    compact_type = negotiate_compact(request)
+    version = await user_version(db, current_user.id)
+
+    # Conditional GET before any page query: the version covers the inbox,
+    # and the other users' profiles embedded in the page (which it does not
+    # cover) are validated from the loader, mostly served from its cache
+    page_key = make_etag(
+        "conversations", current_user.id, request.url.query, compact_type, version
+    ) if version else None
+    if page_key:
+        other_user_ids = page_users.get(page_key)
+        if other_user_ids is not None:
+            other_users = await users.load_many(other_user_ids)
+            etag = make_etag(page_key, profile_version(other_users.get(user_id) for user_id in other_user_ids))
+            if etag_matches(request, etag):
+                return not_modified(etag)
+
+    if include_total is None:
+        include_total = cursor is None
 
     # Get conversations
-    query = get_user_conversations_query(db, current_user.id)
-    total = query.count()
-
-    conversations = query.order_by(
-        Conversation.updated_at.desc()
-    ).offset(offset).limit(page_size).all()
-
-    # Build response with additional data
-    result = []
-    for conv in conversations:
-        # Get other user
-        other_user_id = get_other_user_id(conv, current_user.id)
-        other_user = db.query(User).filter(User.id == other_user_id).first()
-
-        # Get last message
-        last_message = db.query(Message).filter(
-            Message.conversation_id == conv.id
-        ).order_by(Message.created_at.desc()).first()
-
-        # Count unread messages
-        unread_count = db.query(Message).filter(
-            Message.conversation_id == conv.id,
-            Message.recipient_id == current_user.id,
-            Message.read_at == None,
-            Message.recipient_deleted_at == None
-        ).count()
-
-        # Get user settings
-        settings = get_user_settings(conv, current_user.id)
-
-        result.append(ConversationResponse(
-            id=conv.id,
-            participant1_id=conv.participant1_id,
-            participant2_id=conv.participant2_id,
-            created_at=conv.created_at,
-            updated_at=conv.updated_at,
-            last_message_at=conv.last_message_at,
-            is_pinned=settings["is_pinned"],
-            is_muted=settings["is_muted"],
-            is_archived=settings["is_archived"],
-            last_message=MessageResponse.from_orm(last_message) if last_message else None,
-            other_user=UserInfo(
-                id=other_user.id,
-                username=other_user.username,
-                name=other_user.name,
-                avatar_url=other_user.image.image if other_user.image else None,
-                is_online=False,  # TODO: Get from Redis/WebSocket
-                last_seen=None,  # TODO: Get from users table
-            ) if other_user else None,
-            unread_count=unread_count
+    user_filter = get_user_conversations_filter(current_user.id)
+    total = None
+    if include_total:
+        total = (await db.execute(
+            select(func.count()).select_from(Conversation).where(user_filter)
+        )).scalar_one()
+
+    # Fetch one extra row to know whether another page exists
+    if cursor:
+        # Keyset pagination: page 500 costs the same as page 1
+        try:
+            after = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        conversations = await get_user_conversations_keyset(
+            db, current_user.id, page_size + 1, after
+        )
+    else:
+        conversations = (await db.execute(
+            select(Conversation).where(user_filter).order_by(
+                Conversation.updated_at.desc(),
+                Conversation.id.desc()
+            ).offset((page - 1) * page_size).limit(page_size + 1)
+        )).scalars().all()
+
+    has_more = len(conversations) > page_size
+    conversations = conversations[:page_size]
+
+    # Hydrate last message, unread count and other user for the whole page
+    rows = await build_inbox_rows(db, conversations, current_user.id, users)
+
+    etag = None
+    if page_key:
+        page_users.set(page_key, (
+            conv.participant2_id if conv.participant1_id == current_user.id else conv.participant1_id
+            for conv in conversations
         ))
-
-    return ConversationsListResponse(
-        data=result,
+        etag = make_etag(page_key, profile_version(row["other_user"] for row in rows))
+        # A first request on this worker (or after eviction) still gets its 304
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+    next_cursor = None
+    if has_more:
+        last = conversations[-1]
+        next_cursor = encode_cursor(last.updated_at, last.id)
+
+    result = dict(
+        data=rows,
         total=total,
         page=page,
-        page_size=page_size
+        page_size=page_size,
+        has_more=has_more,
+        next_cursor=next_cursor
     )
+    if compact_type:
+        compact_response = render_compact(compact_type, result)
+        set_etag(compact_response, etag)
+        return compact_response
+    if FAST_SERIALIZATION:
+        fast_response = render_page(conversations_page_adapter, result)
+        fast_response.headers["Vary"] = "Accept"
+        set_etag(fast_response, etag)
+        return fast_response
+
+    response.headers["Vary"] = "Accept"
+    set_etag(response, etag)
+    return ConversationsListResponse(**result)
 
 
 @router.post("/conversations", response_model=ConversationResponse)
 async def create_conversation(
     recipient_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_write_db),
+    users: UserLoader = Depends(get_user_loader)
 ):
     """
     Create a new conversation with a user
@@ -213,7 +429,7 @@ async def create_conversation(
         )
 
     # Check if recipient exists
-    recipient = db.query(User).filter(User.id == recipient_id).first()
+    recipient = await users.load(recipient_id)
     if not recipient:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -221,10 +437,13 @@ async def create_conversation(
         )
 
     # Get or create conversation
-    conversation = get_or_create_conversation(db, current_user.id, recipient_id)
+    conversation_id = await get_or_create_conversation_id(db, current_user.id, recipient_id)
+    conversation = await db.get(Conversation, conversation_id)
+    await db.commit()
 
     # Get user settings
     settings = get_user_settings(conversation, current_user.id)
+    last_read_at, other_last_read_at = read_watermarks(conversation, current_user.id)
 
     return ConversationResponse(
         id=conversation.id,
@@ -236,28 +455,24 @@ async def create_conversation(
         is_pinned=settings["is_pinned"],
         is_muted=settings["is_muted"],
         is_archived=settings["is_archived"],
-        other_user=UserInfo(
-            id=recipient.id,
-            username=recipient.username,
-            name=recipient.name,
-            avatar_url=recipient.image.image if recipient.image else None,
-            is_online=False,
-            last_seen=None,
-        ),
-        unread_count=0
+        other_user=recipient,
+        unread_count=conversation_unread_count(conversation, current_user.id),
+        last_read_at=last_read_at,
+        other_last_read_at=other_last_read_at
     )
 
 
 @router.get("/conversations/{conversation_id}", response_model=ConversationResponse)
 async def get_conversation(
     conversation_id: UUID,
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    users: UserLoader = Depends(get_user_loader)
 ):
-    """Get a specific conversation"""
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id
-    ).first()
+    """Get a specific conversation (supports If-None-Match)"""
+    conversation = await db.get(Conversation, conversation_id)
 
     if not conversation:
         raise HTTPException(
@@ -273,12 +488,24 @@ async def get_conversation(
         )
 
     # Get other user
-    other_user_id = get_other_user_id(conversation, current_user.id)
-    other_user = db.query(User).filter(User.id == other_user_id).first()
+    other_user = await users.load(get_other_user_id(conversation, current_user.id))
+
+    # Settings, counters and watermarks all live on the row: changed_at
+    # versions them; the embedded profile is compared by its fields
+    etag = None
+    if stable_version(conversation.changed_at):
+        etag = make_etag(
+            "conversation", current_user.id, conversation.id, conversation.changed_at,
+            profile_version([other_user])
+        )
+        if etag_matches(request, etag):
+            return not_modified(etag)
 
     # Get user settings
     settings = get_user_settings(conversation, current_user.id)
+    last_read_at, other_last_read_at = read_watermarks(conversation, current_user.id)
 
+    set_etag(response, etag)
     return ConversationResponse(
         id=conversation.id,
         participant1_id=conversation.participant1_id,
@@ -289,15 +516,10 @@ async def get_conversation(
         is_pinned=settings["is_pinned"],
         is_muted=settings["is_muted"],
         is_archived=settings["is_archived"],
-        other_user=UserInfo(
-            id=other_user.id,
-            username=other_user.username,
-            name=other_user.name,
-            avatar_url=other_user.image.image if other_user.image else None,
-            is_online=False,
-            last_seen=None,
-        ) if other_user else None,
-        unread_count=0  # TODO: Calculate
+        other_user=other_user,
+        unread_count=conversation_unread_count(conversation, current_user.id),
+        last_read_at=last_read_at,
+        other_last_read_at=other_last_read_at
     )
 
 
@@ -306,14 +528,13 @@ async def update_conversation(
     conversation_id: UUID,
     payload: UpdateConversationRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_write_db),
+    users: UserLoader = Depends(get_user_loader)
 ):
     """
     Update conversation settings (pin, mute, archive)
     """
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id
-    ).first()
+    conversation = await db.get(Conversation, conversation_id)
 
     if not conversation:
         raise HTTPException(
@@ -349,15 +570,15 @@ async def update_conversation(
         else:
             conversation.participant2_archived = payload.archived
 
-    db.commit()
-    db.refresh(conversation)
+    await db.commit()
+    await db.refresh(conversation)
 
     # Get updated settings
     settings = get_user_settings(conversation, current_user.id)
+    last_read_at, other_last_read_at = read_watermarks(conversation, current_user.id)
 
     # Get other user
-    other_user_id = get_other_user_id(conversation, current_user.id)
-    other_user = db.query(User).filter(User.id == other_user_id).first()
+    other_user = await users.load(get_other_user_id(conversation, current_user.id))
 
     return ConversationResponse(
         id=conversation.id,
@@ -369,15 +590,10 @@ async def update_conversation(
         is_pinned=settings["is_pinned"],
         is_muted=settings["is_muted"],
         is_archived=settings["is_archived"],
-        other_user=UserInfo(
-            id=other_user.id,
-            username=other_user.username,
-            name=other_user.name,
-            avatar_url=other_user.image.image if other_user.image else None,
-            is_online=False,
-            last_seen=None,
-        ) if other_user else None,
-        unread_count=0
+        other_user=other_user,
+        unread_count=conversation_unread_count(conversation, current_user.id),
+        last_read_at=last_read_at,
+        other_last_read_at=other_last_read_at
     )
 
 
@@ -385,14 +601,12 @@ async def update_conversation(
 async def delete_conversation(
     conversation_id: UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_write_db)
 ):
     """
     Delete conversation (soft delete for current user)
     """
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id
-    ).first()
+    conversation = await db.get(Conversation, conversation_id)
 
     if not conversation:
         raise HTTPException(
@@ -413,7 +627,10 @@ async def delete_conversation(
     else:
         conversation.participant2_deleted_at = datetime.utcnow()
 
-    db.commit()
+    # Deleted conversations no longer count towards the unread badge
+    await clear_unread(db, conversation.id, current_user.id)
+
+    await db.commit()
 
 
 # ============================================================================
@@ -423,26 +640,39 @@ async def delete_conversation(
 @router.get("/conversations/{conversation_id}/messages", response_model=MessagesListResponse)
 async def get_messages(
     conversation_id: UUID,
+    request: Request,
+    response: Response,
     page: int = 1,
     page_size: int = 50,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
     before_id: Optional[UUID] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get messages for a conversation (paginated, newest first)
 
-    - **page**: Page number
+    - **page**: Page number (informational only)
     - **page_size**: Messages per page (max: 100)
-    - **before_id**: Get messages before this message ID (for infinite scroll)
+    - **before**: Cursor (next_cursor) to load messages older than it
+    - **after**: Cursor (prev_cursor) to load messages newer than it
+    - **before_id**: Deprecated, use before. Get messages before this message ID
+
+    Supports If-None-Match: returns 304 when none of the user's messages changed.
+    Accepts the compact columnar encoding like GET /conversations.
     """
     if page_size > 100:
         page_size = 100
 
+    if before and after:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either before or after, not both"
+        )
+
     # Verify conversation access
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id
-    ).first()
+    conversation = await db.get(Conversation, conversation_id)
 
     if not conversation:
         raise HTTPException(
@@ -456,8 +686,16 @@ async def get_messages(
             detail="Not authorized to access this conversation"
         )
 
+    compact_type = negotiate_compact(request)
+    version = await user_version(db, current_user.id)
+    etag = make_etag(
+        "messages", current_user.id, conversation_id, request.url.query, compact_type, version
+    ) if version else None
+    if etag and etag_matches(request, etag):
+        return not_modified(etag)
+
     # Build query
-    query = db.query(Message).filter(
+    query = select(Message).where(
         Message.conversation_id == conversation_id,
         or_(
             and_(
@@ -471,32 +709,95 @@ async def get_messages(
         )
     )
 
-    # Handle cursor-based pagination
-    if before_id:
-        before_message = db.query(Message).filter(Message.id == before_id).first()
-        if before_message:
-            query = query.filter(Message.created_at < before_message.created_at)
-
-    total = query.count()
-    messages = query.order_by(Message.created_at.desc()).limit(page_size).all()
-
-    # Check if there are more messages
-    has_more = total > page_size
+    # Keyset pagination on (created_at, id): ties on created_at are never
+    # skipped or duplicated and the cost does not depend on history length.
+    # The plain created_at bound is what prunes monthly partitions (migration
+    # 011); the row comparison alone does not. literal() keeps the cursor's
+    # timezone-aware type, like the tuple does.
+    position = tuple_(Message.created_at, Message.id)
+    try:
+        if after:
+            after_at, after_id = decode_cursor(after)
+            query = query.where(
+                position > tuple_(after_at, after_id),
+                Message.created_at >= literal(after_at)
+            )
+        elif before:
+            before_at, before_message_id = decode_cursor(before)
+            query = query.where(
+                position < tuple_(before_at, before_message_id),
+                Message.created_at <= literal(before_at)
+            )
+        elif before_id:
+            anchor_created_at = (await db.execute(
+                select(Message.created_at).where(
+                    Message.id == before_id,
+                    Message.conversation_id == conversation_id
+                )
+            )).scalar()
+            if anchor_created_at is None:
+                # An empty page would read as "no older history"
+                raise ValueError("before_id is not a message of this conversation")
+            query = query.where(
+                position < tuple_(anchor_created_at, before_id),
+                Message.created_at <= literal(anchor_created_at)
+            )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
 
-    return MessagesListResponse(
-        data=[MessageResponse.from_orm(msg) for msg in messages],
-        total=total,
+    if after:
+        # Walk forward from the cursor, then return newest first like every page
+        query = query.order_by(Message.created_at.asc(), Message.id.asc())
+    else:
+        query = query.order_by(Message.created_at.desc(), Message.id.desc())
+
+    # Fetch one extra row to know whether another page exists
+    messages = list((await db.execute(query.limit(page_size + 1))).scalars().all())
+    has_more = len(messages) > page_size
+    messages = messages[:page_size]
+    if after:
+        messages.reverse()
+
+    next_cursor = prev_cursor = None
+    if messages:
+        next_cursor = encode_cursor(messages[-1].created_at, messages[-1].id)
+        prev_cursor = encode_cursor(messages[0].created_at, messages[0].id)
+
+    result = dict(
+        data=messages,
+        total=None,
         page=page,
         page_size=page_size,
-        has_more=has_more
+        has_more=has_more,
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor
     )
+    if compact_type:
+        # Columns straight from the ORM rows, without a dict per message
+        compact_response = render_compact(compact_type, result, fields=MESSAGE_FIELDS)
+        set_etag(compact_response, etag)
+        return compact_response
+    result["data"] = [message_row(msg) for msg in messages]
+    if FAST_SERIALIZATION:
+        fast_response = render_page(messages_page_adapter, result)
+        fast_response.headers["Vary"] = "Accept"
+        set_etag(fast_response, etag)
+        return fast_response
+
+    response.headers["Vary"] = "Accept"
+    set_etag(response, etag)
+    return MessagesListResponse(**result)
 
 
 @router.post("/messages", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
 async def send_message(
     payload: SendMessageRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_write_db),
+    users: UserLoader = Depends(get_user_loader)
 ):
     """
     Send a new message
@@ -508,84 +809,188 @@ async def send_message(
             detail="Cannot send message to yourself"
         )
 
-    recipient = db.query(User).filter(User.id == payload.recipient_id).first()
+    recipient = await users.load(payload.recipient_id)
     if not recipient:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Recipient not found"
         )
 
-    # Get or create conversation
-    conversation = get_or_create_conversation(db, current_user.id, payload.recipient_id)
+    # Get or create conversation (cached id, no query in the steady state)
+    conversation_id = await get_or_create_conversation_id(db, current_user.id, payload.recipient_id)
+
+    # Media processed before the message was sent already has a thumbnail
+    # (one still being saved is filled in after commit, see get_ready_thumbnail)
+    media_thumbnail_url = payload.media_thumbnail_url
+    if payload.media_url and not media_thumbnail_url:
+        media_thumbnail_url = await get_ready_thumbnail(db, payload.media_url)
 
     # Create message
     message = Message(
-        conversation_id=conversation.id,
+        conversation_id=conversation_id,
         sender_id=current_user.id,
         recipient_id=payload.recipient_id,
         content_type=payload.content_type.value,
         text_content=payload.text_content,
         media_url=payload.media_url,
-        media_thumbnail_url=payload.media_thumbnail_url,
+        media_thumbnail_url=media_thumbnail_url,
         audio_duration=payload.audio_duration,
         reply_to_id=payload.reply_to_id,
         sent_at=datetime.utcnow()
     )
 
     db.add(message)
-    db.commit()
-    db.refresh(message)
 
-    # TODO: Send WebSocket notification to recipient
-    # await send_websocket_notification(payload.recipient_id, {
-    #     "type": "newMessage",
-    #     "data": MessageResponse.from_orm(message).dict()
-    # })
+    try:
+        await db.flush()
+    except IntegrityError:
+        # A cached id whose conversation no longer exists must not stick around
+        await db.rollback()
+        conversation_ids.invalidate(current_user.id, payload.recipient_id)
+        conversation_participants.invalidate(conversation_id)
+        raise
+
+    # Recipients who deleted the conversation do not get a badge for it
+    await add_unread(db, conversation_id, payload.recipient_id, unless_deleted=True)
+
+    # Server defaults (created_at, changed_at) as they will be committed
+    await db.refresh(message)
+    response = to_message_response(message)
+    event_data = response.model_dump(mode="json")
+
+    # The recipient fetches the message on the event: keep their reads on the primary too
+    read_router.track_writes(db, (payload.recipient_id,))
+
+    # WebSocket delivery, committed with the message
+    await enqueue_event(
+        db, (payload.recipient_id, current_user.id), WebSocketEvent.NEW_MESSAGE, event_data, conversation_id
+    )
+
+    await db.commit()
+
+    # Recipient and the sender's other devices on the SSE / long-poll channel
+    event_hub.publish(
+        (payload.recipient_id, current_user.id),
+        WebSocketEvent.NEW_MESSAGE,
+        event_data
+    )
 
-    return MessageResponse.from_orm(message)
+    return response
 
 
 @router.post("/messages/read", status_code=status.HTTP_204_NO_CONTENT)
 async def mark_messages_as_read(
     payload: MarkAsReadRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_write_db)
 ):
     """
     Mark messages as read
+
+    - By id: **message_ids**
+    - Up to a point: **conversation_id** with **up_to** (message cursor) or
+      **up_to_timestamp**; also advances the conversation's read watermark
     """
+    if payload.conversation_id is not None:
+        if payload.up_to:
+            try:
+                up_to_at, up_to_id = decode_cursor(payload.up_to)
+            except ValueError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=str(e)
+                )
+        else:
+            up_to_at, up_to_id = payload.up_to_timestamp, None
+
+        read = await mark_read_up_to(db, payload.conversation_id, current_user.id, up_to_at, up_to_id)
+        if read is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Conversation not found"
+            )
+
+        if read.marked:
+            event_data = {
+                "conversationId": str(payload.conversation_id),
+                "status": "read",
+                "readBy": current_user.id,
+                "readUpTo": read.last_read_at.isoformat()
+            }
+            await enqueue_event(
+                db, (read.other_user_id,), WebSocketEvent.MESSAGE_STATUS, event_data, payload.conversation_id
+            )
+
+        await db.commit()
+
+        if read.marked:
+            event_hub.publish((read.other_user_id,), WebSocketEvent.MESSAGE_STATUS, event_data)
+        return
+
     # Update messages
-    db.query(Message).filter(
-        Message.id.in_(payload.message_ids),
-        Message.recipient_id == current_user.id,
-        Message.read_at == None
-    ).update(
-        {Message.read_at: datetime.utcnow()},
-        synchronize_session=False
+    read_at = datetime.utcnow()
+    updated = (await db.execute(
+        update(Message).where(
+            Message.id.in_(payload.message_ids),
+            Message.recipient_id == current_user.id,
+            Message.read_at == None
+        ).values(
+            read_at=read_at
+        ).returning(
+            Message.id,
+            Message.sender_id,
+            Message.conversation_id,
+            Message.recipient_deleted_at
+        ).execution_options(synchronize_session=False)
+    )).all()
+
+    # Decrement unread counters by what actually changed, per conversation
+    read_per_conversation = Counter(
+        conversation_id for _, _, conversation_id, recipient_deleted_at in updated
+        if recipient_deleted_at is None
     )
+    for conversation_id, count in read_per_conversation.items():
+        await remove_unread(db, conversation_id, current_user.id, count)
+
+    # One status event per sender; ordered with its conversation when the
+    # messages all belong to one (the usual case)
+    read_by_sender = {}
+    conversations_by_sender = {}
+    for message_id, sender_id, conversation_id, _ in updated:
+        read_by_sender.setdefault(sender_id, []).append(str(message_id))
+        conversations_by_sender.setdefault(sender_id, set()).add(conversation_id)
+    events = [
+        (sender_id, {
+            "messageIds": message_ids,
+            "status": "read",
+            "readBy": current_user.id,
+            "readAt": read_at.isoformat()
+        })
+        for sender_id, message_ids in read_by_sender.items()
+    ]
+    for sender_id, event_data in events:
+        conversations = conversations_by_sender[sender_id]
+        await enqueue_event(
+            db, (sender_id,), WebSocketEvent.MESSAGE_STATUS, event_data,
+            next(iter(conversations)) if len(conversations) == 1 else None
+        )
 
-    db.commit()
+    await db.commit()
 
-    # TODO: Send WebSocket notification to senders
-    # for message_id in payload.message_ids:
-    #     message = db.query(Message).filter(Message.id == message_id).first()
-    #     if message:
-    #         await send_websocket_notification(message.sender_id, {
-    #             "type": "messageStatus",
-    #             "data": {"messageId": str(message.id), "status": "read"}
-    #         })
+    for sender_id, event_data in events:
+        event_hub.publish((sender_id,), WebSocketEvent.MESSAGE_STATUS, event_data)
 
 
 @router.delete("/messages/{message_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_message(
     message_id: UUID,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_write_db)
 ):
     """
     Delete message (soft delete for current user)
     """
-    message = db.query(Message).filter(Message.id == message_id).first()
+    message = await db.get(Message, message_id)
 
     if not message:
         raise HTTPException(
@@ -597,6 +1002,8 @@ async def delete_message(
     if message.sender_id == current_user.id:
         message.sender_deleted_at = datetime.utcnow()
     elif message.recipient_id == current_user.id:
+        if message.read_at is None and message.recipient_deleted_at is None:
+            await remove_unread(db, message.conversation_id, current_user.id, 1)
         message.recipient_deleted_at = datetime.utcnow()
     else:
         raise HTTPException(
@@ -604,35 +1011,177 @@ async def delete_message(
             detail="Not authorized to delete this message"
         )
 
-    db.commit()
+    await db.commit()
 
 
 @router.get("/unread-count", response_model=UnreadCountResponse)
 async def get_unread_count(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get total unread message count for current user
+
+    Reads the counters maintained on write (single primary-key lookup).
+    Supports If-None-Match.
     """
-    total_unread = db.query(Message).filter(
-        Message.recipient_id == current_user.id,
-        Message.read_at == None,
-        Message.recipient_deleted_at == None
-    ).count()
-
-    # Count conversations with unread messages
-    conversations_with_unread = db.query(
-        func.count(func.distinct(Message.conversation_id))
-    ).filter(
-        Message.recipient_id == current_user.id,
-        Message.read_at == None,
-        Message.recipient_deleted_at == None
-    ).scalar()
+    total_unread, conversations_with_unread = await get_user_unread_totals(db, current_user.id)
+
+    etag = make_etag("unread", current_user.id, total_unread, conversations_with_unread)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
 
     return UnreadCountResponse(
         total_unread=total_unread,
-        conversations_with_unread=conversations_with_unread or 0
+        conversations_with_unread=conversations_with_unread
+    )
+
+
+# ============================================================================
+# SEARCH ENDPOINT
+# ============================================================================
+
+@router.get("/search", response_model=MessageSearchResponse)
+async def search(
+    q: str,
+    conversation_id: Optional[UUID] = None,
+    before: Optional[str] = None,
+    page_size: int = 20,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Full-text search over the current user's messages (newest first)
+
+    - **q**: Search text; supports "exact phrase", or, and -excluded words.
+      Portuguese stemming applies, so "regar" also finds "regando"
+    - **conversation_id**: Only search this conversation
+    - **before**: Cursor (next_cursor) to get older results
+    - **page_size**: Results per page (max: 50)
+    """
+    q = q.strip()
+    if not q or len(q) > 200:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Search text must have between 1 and 200 characters"
+        )
+
+    if conversation_id is not None:
+        conversation = await db.get(Conversation, conversation_id)
+
+        if not conversation:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Conversation not found"
+            )
+
+        if current_user.id not in [conversation.participant1_id, conversation.participant2_id]:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not authorized to access this conversation"
+            )
+
+    try:
+        position = decode_cursor(before) if before else None
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    return await search_messages(
+        db, current_user.id, q,
+        conversation_id=conversation_id,
+        before=position,
+        limit=max(1, min(page_size, 50))
+    )
+
+
+# ============================================================================
+# SYNC ENDPOINT (polling fallback when chat_websocket_enabled is off)
+# ============================================================================
+
+@router.get("/sync", response_model=SyncResponse)
+async def sync(
+    since: Optional[str] = None,
+    limit: int = 200,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    users: UserLoader = Depends(get_user_loader)
+):
+    """
+    Get what changed for the current user since a sync token
+
+    - **since**: Token from the previous sync. Omit it to get a starting token,
+      then load the inbox and message pages as usual
+    - **limit**: Max rows per change stream (max: 500); has_more means sync again
+    """
+    if since is None:
+        return SyncResponse(token=initial_sync_token())
+
+    try:
+        positions = decode_sync_token(since)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    return await load_changes(db, current_user.id, positions, users, limit=max(1, min(limit, 500)))
+
+
+# ============================================================================
+# EVENTS ENDPOINT (SSE / long-poll fallback when WebSocket is unavailable)
+# ============================================================================
+
+async def stream_user_events(request: Request, user_id: int):
+    """Server-Sent Events stream of a user's events, with comment keepalives"""
+    with event_hub.subscribe(user_id) as waiter:
+        yield "retry: 3000\n\n"
+        while not await request.is_disconnected():
+            events = await waiter.next_batch(EVENTS_KEEPALIVE)
+            if not events:
+                yield ": keepalive\n\n"
+                continue
+            yield "".join(f"data: {event}\n\n" for event in events)
+
+
+@router.get("/events")
+async def get_events(
+    request: Request,
+    timeout: float = 25,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Receive chat events (newMessage, messageStatus, typing) without WebSocket
+
+    - With **Accept: text/event-stream**: an SSE stream, one `data:` line per event
+    - Otherwise long-poll: returns `{"events": [...]}` as soon as there are
+      events, or empty after **timeout** seconds
+
+    Events use the WebSocket format (`{"type", "data"}`). Nothing is kept while
+    no request is open and a `resync` event means events were dropped: catch
+    up with GET /chat/sync after connecting and on resync. Holds no database
+    connection while waiting.
+    """
+    if "text/event-stream" in request.headers.get("accept", ""):
+        return StreamingResponse(
+            stream_user_events(request, current_user.id),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    with event_hub.subscribe(current_user.id) as waiter:
+        events = await waiter.next_batch(min(max(timeout, 0), EVENTS_MAX_WAIT))
+
+    # Events are already JSON: splice them instead of re-encoding
+    return Response(
+        content='{"events":[' + ",".join(events) + "]}",
+        media_type="application/json",
+        headers={"Cache-Control": "no-cache"}
     )
 
 
@@ -640,76 +1189,230 @@ async def get_unread_count(
 # MEDIA UPLOAD ENDPOINT
 # ============================================================================
 
-@router.post("/upload", response_model=UploadResponse)
+@router.post(
+    "/upload",
+    response_model=UploadResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {"file": {"type": "string", "format": "binary"}},
+                        "required": ["file"],
+                    }
+                }
+            },
+        }
+    },
+    dependencies=[Depends(require_feature("chat_media_upload_enabled"))],
+)
 async def upload_media(
-    file: UploadFile = File(...),
+    request: Request,
     current_user: User = Depends(get_current_user),
 ):
     """
     Upload media file (image/video/audio) to S3
 
+    The multipart body is streamed to S3 in parts as it arrives, so memory
+    per upload stays at about one part (CHAT_S3_PART_SIZE) whatever the file
+    size, and oversized files are rejected as soon as they cross the limit.
+
     Returns S3 URL to use in send_message
     """
-    # Validate file type
-    allowed_types = ["image/jpeg", "image/png", "image/gif", "image/webp",
-                     "video/mp4", "video/quicktime", "audio/mpeg", "audio/m4a", "audio/wav"]
+    # Reject early when the declared body is already over the largest limit
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_VIDEO_AUDIO_SIZE + 64 * 1024:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File too large. Max size: {MAX_VIDEO_AUDIO_SIZE / (1024*1024)}MB"
+        )
 
-    if file.content_type not in allowed_types:
+    try:
+        uploaded = await stream_multipart_upload(
+            request,
+            s3_client,
+            bucket=S3_BUCKET,
+            field_name="file",
+            allowed_types=ALLOWED_MEDIA_TYPES,
+            max_size_for=get_max_media_size,
+            key_for=lambda filename, content_type: build_media_key(current_user.id, filename),
+            metadata={
+                "user_id": str(current_user.id),
+                "uploaded_at": datetime.utcnow().isoformat()
+            },
+        )
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except ClientError as e:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"File type {file.content_type} not allowed"
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to upload file: {str(e)}"
         )
 
-    # Validate file size (max 10MB for images, 50MB for video/audio)
-    max_size = 10 * 1024 * 1024 if file.content_type.startswith("image/") else 50 * 1024 * 1024
+    UPLOAD_S3_SECONDS.observe(uploaded.s3_seconds)
+
+    # Thumbnail is rendered in the background and filled on the message
+    url = get_media_url(uploaded.key)
+    media_processor.submit(uploaded.key, url, uploaded.content_type)
+
+    return UploadResponse(
+        url=url,
+        thumbnail_url=None,
+        file_size=uploaded.size,
+        mime_type=uploaded.content_type
+    )
 
-    file_content = await file.read()
-    file_size = len(file_content)
 
-    if file_size > max_size:
+@router.post(
+    "/upload/presign",
+    response_model=PresignedUploadResponse,
+    dependencies=[Depends(require_feature("chat_media_upload_enabled"))],
+)
+async def presign_upload(
+    payload: PresignUploadRequest,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Get a presigned URL to upload media directly to S3
+
+    The client sends the file to upload_url (POST with fields as form data,
+    or PUT with headers), then calls /upload/complete with the key.
+    POST policies enforce type and size limits on the S3 side; PUT URLs sign
+    the exact Content-Type and Content-Length.
+    """
+    if payload.content_type not in ALLOWED_MEDIA_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"File type {payload.content_type} not allowed"
+        )
+
+    max_size = get_max_media_size(payload.content_type)
+    if payload.file_size > max_size:
         raise HTTPException(
             status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
             detail=f"File too large. Max size: {max_size / (1024*1024)}MB"
         )
 
-    # Generate unique filename
-    import uuid
-    from datetime import datetime
-    file_ext = file.filename.split(".")[-1] if "." in file.filename else "bin"
-    unique_filename = f"chat/{current_user.id}/{datetime.utcnow().strftime('%Y/%m')}/{uuid.uuid4()}.{file_ext}"
+    key = build_media_key(current_user.id, payload.filename)
+    metadata = {
+        "x-amz-meta-user_id": str(current_user.id),
+        "x-amz-meta-uploaded_at": datetime.utcnow().isoformat(),
+    }
 
     try:
-        # Upload to S3
-        s3_client.put_object(
-            Bucket=S3_BUCKET,
-            Key=unique_filename,
-            Body=file_content,
-            ContentType=file.content_type,
-            Metadata={
-                "user_id": str(current_user.id),
-                "uploaded_at": datetime.utcnow().isoformat()
-            }
+        if payload.method == "POST":
+            presigned = await asyncio.to_thread(
+                s3_client.generate_presigned_post,
+                Bucket=S3_BUCKET,
+                Key=key,
+                Fields={"Content-Type": payload.content_type, **metadata},
+                Conditions=[
+                    {"Content-Type": payload.content_type},
+                    ["content-length-range", 1, max_size],
+                    *[{name: value} for name, value in metadata.items()],
+                ],
+                ExpiresIn=S3_PRESIGN_EXPIRES,
+            )
+            return PresignedUploadResponse(
+                key=key,
+                method="POST",
+                upload_url=presigned["url"],
+                fields=presigned["fields"],
+                expires_in=S3_PRESIGN_EXPIRES,
+            )
+
+        upload_url = await asyncio.to_thread(
+            s3_client.generate_presigned_url,
+            "put_object",
+            Params={
+                "Bucket": S3_BUCKET,
+                "Key": key,
+                "ContentType": payload.content_type,
+                "ContentLength": payload.file_size,
+                "Metadata": {name[len("x-amz-meta-"):]: value for name, value in metadata.items()},
+            },
+            ExpiresIn=S3_PRESIGN_EXPIRES,
+        )
+        return PresignedUploadResponse(
+            key=key,
+            method="PUT",
+            upload_url=upload_url,
+            headers={
+                "Content-Type": payload.content_type,
+                "Content-Length": str(payload.file_size),
+                **metadata,
+            },
+            expires_in=S3_PRESIGN_EXPIRES,
+        )
+    except ClientError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to presign upload: {str(e)}"
         )
 
-        # Generate URL
-        url = f"https://{S3_BUCKET}.s3.{S3_REGION}.amazonaws.com/{unique_filename}"
 
-        # TODO: Generate thumbnail for images/videos
-        thumbnail_url = None
+@router.post(
+    "/upload/complete",
+    response_model=UploadResponse,
+    dependencies=[Depends(require_feature("chat_media_upload_enabled"))],
+)
+async def complete_upload(
+    payload: CompleteUploadRequest,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Finalize a presigned upload
 
-        return UploadResponse(
-            url=url,
-            thumbnail_url=thumbnail_url,
-            file_size=file_size,
-            mime_type=file.content_type
+    Verifies the object exists under the user's prefix and still satisfies the
+    type and size rules (invalid objects are deleted), then returns the URL
+    to use in send_message
+    """
+    if not payload.key.startswith(f"chat/{current_user.id}/") or ".." in payload.key:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to finalize this upload"
         )
 
+    try:
+        head = await asyncio.to_thread(s3_client.head_object, Bucket=S3_BUCKET, Key=payload.key)
     except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Upload not found"
+            )
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to upload file: {str(e)}"
+            detail=f"Failed to verify upload: {str(e)}"
         )
 
+    content_type = head.get("ContentType", "")
+    file_size = head.get("ContentLength", 0)
+
+    error = None
+    if content_type not in ALLOWED_MEDIA_TYPES:
+        error = (status.HTTP_400_BAD_REQUEST, f"File type {content_type} not allowed")
+    elif file_size > get_max_media_size(content_type):
+        max_size = get_max_media_size(content_type)
+        error = (status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, f"File too large. Max size: {max_size / (1024*1024)}MB")
+
+    if error:
+        await asyncio.to_thread(s3_client.delete_object, Bucket=S3_BUCKET, Key=payload.key)
+        raise HTTPException(status_code=error[0], detail=error[1])
+
+    # Thumbnail is rendered in the background and filled on the message
+    url = get_media_url(payload.key)
+    media_processor.submit(payload.key, url, content_type)
+
+    return UploadResponse(
+        url=url,
+        thumbnail_url=None,
+        file_size=file_size,
+        mime_type=content_type
+    )
+
 
 # ============================================================================
 # TYPING INDICATOR ENDPOINT (Optional - can use WebSocket instead)
@@ -720,39 +1423,33 @@ async def send_typing_indicator(
     conversation_id: UUID,
     is_typing: bool,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Send typing indicator
 
-    Usually handled via WebSocket, but can use REST as fallback
+    Usually handled via WebSocket, but can use REST as fallback. Kept in
+    memory (services/typing.py), never written to the database: repeated
+    start / stop inside the debounce window are coalesced and only changes
+    reach the other participant (SSE / long-poll, and WebSocket when
+    CHAT_WS_ENDPOINT_URL is set).
     """
-    # Verify conversation access
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id
-    ).first()
+    # Verify conversation access (cached participants, no query on hits)
+    participants = await get_participants(db, conversation_id)
 
-    if not conversation:
+    if participants is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Conversation not found"
         )
 
-    if current_user.id not in [conversation.participant1_id, conversation.participant2_id]:
+    if current_user.id not in participants:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized"
         )
 
-    # TODO: Broadcast via WebSocket
-    # other_user_id = get_other_user_id(conversation, current_user.id)
-    # await send_websocket_notification(other_user_id, {
-    #     "type": "typing",
-    #     "data": {
-    #         "conversationId": str(conversation_id),
-    #         "userId": current_user.id,
-    #         "isTyping": is_typing
-    #     }
-    # })
+    other_user_id = participants[1] if participants[0] == current_user.id else participants[0]
+    typing_store.set(conversation_id, current_user.id, (other_user_id,), is_typing)
 
     return None
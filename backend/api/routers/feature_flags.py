@@ -9,6 +9,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 import json
 
+from ..services.metrics import MetricsRoute
 from ..models.feature_flags import (
     FeatureFlag,
     FeatureFlagCreate,
@@ -22,7 +23,7 @@ from ..models.feature_flags import (
 # from ..database import get_db
 # from ..auth import get_current_user
 
-router = APIRouter(prefix="/api/v1/feature-flags", tags=["feature-flags"])
+router = APIRouter(prefix="/api/v1/feature-flags", tags=["feature-flags"], route_class=MetricsRoute)
 
 
 # =====================================================
@@ -0,0 +1,23 @@
+"""
+Metrics Router
+Prometheus scrape endpoint for the in-process metrics (services/metrics.py)
+
+Include it at the app root, next to the API routers:
+    app.include_router(metrics_router)
+"""
+
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from ..services.metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """
+    Latency histograms by route and status, DB time per request, S3 time per
+    upload and the connection pool gauges, in Prometheus text format
+    """
+    return Response(content=REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
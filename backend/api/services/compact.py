@@ -0,0 +1,153 @@
+"""
+Compact Wire Format
+Columnar list pages negotiated through the Accept header
+"""
+
+import json
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from operator import attrgetter
+from typing import Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from fastapi import Request
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+from .serializers import json_default, orjson
+
+try:
+    import msgpack
+except ImportError:  # Only the JSON flavour is offered
+    msgpack = None
+
+
+COMPACT_JSON = "application/vnd.growzone.compact+json"
+COMPACT_MSGPACK = "application/vnd.growzone.compact+msgpack"
+_MSGPACK_ALIASES = ("application/msgpack", "application/x-msgpack")
+
+COMPACT_FORMAT = "columnar-v1"
+
+
+def negotiate_compact(request: Request) -> Optional[str]:
+    """
+    Pick a compact media type from the Accept header, or None for plain JSON.
+
+    Clients opt in explicitly; */* and application/json keep the default body.
+    """
+    accept = request.headers.get("accept")
+    if not accept:
+        return None
+    for item in accept.split(","):
+        media_type, *params = [part.strip().lower() for part in item.split(";")]
+        if "q=0" in params or "q=0.0" in params:
+            continue
+        if media_type == COMPACT_JSON:
+            return COMPACT_JSON
+        if msgpack is not None and (media_type == COMPACT_MSGPACK or media_type in _MSGPACK_ALIASES):
+            return COMPACT_MSGPACK
+    return None
+
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_UTC = _EPOCH.replace(tzinfo=timezone.utc)
+_MILLISECOND = timedelta(milliseconds=1)
+
+
+def _epoch_ms(value: datetime) -> int:
+    """Exact epoch milliseconds (naive timestamps are UTC, like the database's)"""
+    return (value - (_EPOCH if value.tzinfo is None else _EPOCH_UTC)) // _MILLISECOND
+
+
+def _scalar(value):
+    if isinstance(value, datetime):
+        return _epoch_ms(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+
+def _add_columns(values: list, name: str, constants: dict, columns: dict) -> None:
+    """
+    Encode one column, picking the conversion once from its first non-null value.
+
+    Nested objects (last_message, other_user) become dotted columns; when the
+    object is null all of its columns are null.
+    """
+    sample = next((value for value in values if value is not None), None)
+    if isinstance(sample, (dict, BaseModel)):
+        rows = [value.__dict__ if isinstance(value, BaseModel) else value for value in values]
+        keys = sample.__dict__ if isinstance(sample, BaseModel) else sample
+        for key in keys:
+            _add_columns(
+                [None if row is None else row.get(key) for row in rows],
+                f"{name}.{key}", constants, columns
+            )
+        return
+
+    # Cheap reject first: ids and timestamps differ end to end
+    first = values[0]
+    if values[-1] == first and values.count(first) == len(values):
+        constants[name] = _scalar(first)
+        return
+
+    if isinstance(sample, datetime):
+        epoch = _EPOCH if sample.tzinfo is None else _EPOCH_UTC
+        values = [None if value is None else (value - epoch) // _MILLISECOND for value in values]
+    elif isinstance(sample, Enum):
+        values = [None if value is None else value.value for value in values]
+    elif isinstance(sample, UUID):
+        # Once per column rather than through the encoder's default hook,
+        # which asyncpg's UUID subclass (and the stdlib json) always takes
+        values = [None if value is None else str(value) for value in values]
+    columns[name] = values
+
+
+def to_columns(rows: list, fields: Optional[Sequence[str]] = None) -> Tuple[Dict[str, object], Dict[str, list]]:
+    """
+    Split rows of the same shape into (constants, columns).
+
+    Rows are dicts, or objects (ORM rows) read through the attribute names in
+    fields, which skips building a dict per row only to transpose it.
+    Columns whose value is the same on every row (conversation_id on a message
+    page, a null media_thumbnail_url, ...) are sent once in constants.
+    """
+    constants, columns = {}, {}
+    if fields is None:
+        for name in rows[0]:
+            _add_columns([row[name] for row in rows], name, constants, columns)
+    else:
+        for name in fields:
+            _add_columns(list(map(attrgetter(name), rows)), name, constants, columns)
+    return constants, columns
+
+
+def render_compact(
+    media_type: str,
+    page: dict,
+    rows_key: str = "data",
+    fields: Optional[Sequence[str]] = None
+) -> Response:
+    """
+    Encode a list page as columnar JSON or MessagePack.
+
+    Shape: the page's scalar fields (total, has_more, cursors, ...) plus
+    format, count, const (hoisted columns) and columns (one array per field,
+    in row order). Timestamps are epoch milliseconds; use the cursors, not the
+    timestamps, to page or mark as read. With fields, the rows are objects
+    (see to_columns).
+    """
+    rows = page[rows_key]
+    constants, columns = to_columns(rows, fields) if rows else ({}, {})
+    body = {key: _scalar(value) for key, value in page.items() if key != rows_key}
+    body.update(format=COMPACT_FORMAT, count=len(rows), const=constants, columns=columns)
+
+    if media_type == COMPACT_MSGPACK:
+        content = msgpack.packb(body, default=str, use_bin_type=True)
+    elif orjson is not None:
+        content = orjson.dumps(body, default=json_default)
+    else:
+        content = json.dumps(body, default=str, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return Response(content=content, media_type=media_type, headers={"Vary": "Accept"})
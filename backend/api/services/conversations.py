@@ -0,0 +1,166 @@
+"""
+Conversation Lookup
+Atomic get-or-create of the conversation between two users, with process-local
+id and participant caches
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+CONVERSATION_CACHE_SIZE = int(os.getenv("CHAT_CONVERSATION_CACHE_SIZE", "50000"))
+
+
+def participant_pair(user1_id: int, user2_id: int) -> Tuple[int, int]:
+    """Order a pair the way conversations store it (participant1_id < participant2_id)"""
+    return (user1_id, user2_id) if user1_id < user2_id else (user2_id, user1_id)
+
+
+class ConversationIdCache:
+    """
+    Bounded, thread-safe LRU of (participant1_id, participant2_id) -> conversation id.
+
+    Conversation ids never change and conversations are only soft-deleted, so
+    entries need no TTL; invalidate() covers rows removed by a user cascade.
+    """
+
+    def __init__(self, max_size: int = CONVERSATION_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple[int, int], UUID]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user1_id: int, user2_id: int) -> Optional[UUID]:
+        key = participant_pair(user1_id, user2_id)
+        with self._lock:
+            conversation_id = self._entries.get(key)
+            if conversation_id is not None:
+                self._entries.move_to_end(key)
+            return conversation_id
+
+    def set(self, user1_id: int, user2_id: int, conversation_id: UUID) -> None:
+        key = participant_pair(user1_id, user2_id)
+        with self._lock:
+            self._entries[key] = conversation_id
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user1_id: int, user2_id: int) -> None:
+        with self._lock:
+            self._entries.pop(participant_pair(user1_id, user2_id), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class ConversationParticipantsCache:
+    """
+    Bounded, thread-safe LRU of conversation id -> (participant1_id, participant2_id).
+
+    Participants of a conversation never change, so like ConversationIdCache
+    entries need no TTL.
+    """
+
+    def __init__(self, max_size: int = CONVERSATION_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[UUID, Tuple[int, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id: UUID) -> Optional[Tuple[int, int]]:
+        with self._lock:
+            participants = self._entries.get(conversation_id)
+            if participants is not None:
+                self._entries.move_to_end(conversation_id)
+            return participants
+
+    def set(self, conversation_id: UUID, user1_id: int, user2_id: int) -> None:
+        with self._lock:
+            self._entries[conversation_id] = participant_pair(user1_id, user2_id)
+            self._entries.move_to_end(conversation_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, conversation_id: UUID) -> None:
+        with self._lock:
+            self._entries.pop(conversation_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# Process-wide caches shared by every request on this worker
+conversation_ids = ConversationIdCache()
+conversation_participants = ConversationParticipantsCache()
+
+
+async def get_or_create_conversation_id(
+    db: AsyncSession,
+    user1_id: int,
+    user2_id: int
+) -> UUID:
+    """
+    Get the id of the conversation between two users, creating it if needed.
+
+    Cache hits cost no query. Misses are a single call to the
+    get_or_create_conversation SQL function (INSERT ... ON CONFLICT), which is
+    safe when both users send their first message at the same time. A newly
+    created row becomes visible to others when the caller commits, and the
+    id is cached only then: a rolled back insert must not stay in the cache.
+    """
+    conversation_id = conversation_ids.get(user1_id, user2_id)
+    if conversation_id is not None:
+        return conversation_id
+
+    conversation_id = (await db.execute(
+        text("SELECT get_or_create_conversation(:user1_id, :user2_id)"),
+        {"user1_id": user1_id, "user2_id": user2_id}
+    )).scalar_one()
+
+    if not isinstance(conversation_id, UUID):
+        conversation_id = UUID(str(conversation_id))
+    _cache_after_commit(db, conversation_id, user1_id, user2_id)
+    return conversation_id
+
+
+def _cache_after_commit(db: AsyncSession, conversation_id: UUID, user1_id: int, user2_id: int) -> None:
+    """Cache the id once db commits; a rollback first discards it"""
+    pending = [True]
+
+    def _committed(session) -> None:
+        if pending:
+            conversation_ids.set(user1_id, user2_id, conversation_id)
+            conversation_participants.set(conversation_id, user1_id, user2_id)
+
+    def _rolled_back(session) -> None:
+        pending.clear()
+
+    event.listen(db.sync_session, "after_commit", _committed, once=True)
+    event.listen(db.sync_session, "after_rollback", _rolled_back, once=True)
+
+
+async def get_participants(db: AsyncSession, conversation_id: UUID) -> Optional[Tuple[int, int]]:
+    """
+    (participant1_id, participant2_id) of a conversation, None if it does not
+    exist. Cache hits cost no query (and no connection).
+    """
+    participants = conversation_participants.get(conversation_id)
+    if participants is not None:
+        return participants
+
+    row = (await db.execute(
+        text("SELECT participant1_id, participant2_id FROM conversations WHERE id = :conversation_id"),
+        {"conversation_id": conversation_id}
+    )).first()
+    if row is None:
+        return None
+
+    conversation_participants.set(conversation_id, row[0], row[1])
+    return participant_pair(row[0], row[1])
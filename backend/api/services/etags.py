@@ -0,0 +1,151 @@
+"""
+Conditional GET
+Weak ETags for the chat read endpoints, derived from cheap version probes
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Iterable, Optional, Tuple
+
+from fastapi import Request, Response, status
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.chat import UserInfo
+from .sync import SYNC_OVERLAP
+
+
+ETAG_PAGE_CACHE_SIZE = int(os.getenv("CHAT_ETAG_PAGE_CACHE_SIZE", "10000"))
+
+# Newest change to anything the user can see: one backward probe per
+# (user, changed_at, id) index from migration 009, independent of history size
+_USER_VERSION_SQL = text("""
+    SELECT
+        GREATEST(
+            (SELECT MAX(changed_at) FROM conversations WHERE participant1_id = :user_id),
+            (SELECT MAX(changed_at) FROM conversations WHERE participant2_id = :user_id),
+            (SELECT MAX(changed_at) FROM messages WHERE sender_id = :user_id),
+            (SELECT MAX(changed_at) FROM messages WHERE recipient_id = :user_id)
+        ),
+        clock_timestamp()
+""")
+
+
+def make_etag(*parts) -> str:
+    """Weak ETag over the given parts (the response is semantically, not byte-for-byte, stable)"""
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Weak comparison against the If-None-Match header"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={"ETag": etag, "Cache-Control": "private, no-cache"}
+    )
+
+
+def stable_version(changed_at: Optional[datetime], now: Optional[datetime] = None) -> bool:
+    """
+    Whether a version is old enough to validate on.
+
+    changed_at is stamped before commit, so a change still in flight can later
+    appear with an older stamp than the current maximum. Versions newer than
+    the sync overlap window get no ETag and are always served in full.
+    """
+    if changed_at is None:
+        return True
+    if changed_at.tzinfo is None:
+        changed_at = changed_at.replace(tzinfo=timezone.utc)
+    now = now or datetime.now(timezone.utc)
+    return now - changed_at >= SYNC_OVERLAP
+
+
+async def user_version(db: AsyncSession, user_id: int) -> Optional[datetime]:
+    """
+    Newest changed_at among the user's conversations and messages.
+
+    Returns None while that change is too recent to validate on (see
+    stable_version), and datetime.min for users with no chat activity.
+    """
+    changed_at, now = (await db.execute(_USER_VERSION_SQL, {"user_id": user_id})).one()
+    if changed_at is None:
+        return datetime.min
+    return changed_at if stable_version(changed_at, now) else None
+
+
+def profile_version(users: Iterable[Optional[UserInfo]]) -> tuple:
+    """
+    ETag part for embedded UserInfo.
+
+    Profiles live in the users table, outside the changed_at versions, so
+    responses that embed them validate on the profile fields they show.
+    """
+    return tuple(
+        (user.id, user.username, user.name, user.avatar_url) if user is not None else None
+        for user in users
+    )
+
+
+class PageUsersCache:
+    """
+    Bounded, thread-safe LRU of version validator -> user ids embedded in that page.
+
+    Keys include the user's version, so an unchanged version means the same
+    page with the same participants; a conditional GET can then validate the
+    profiles from the (cached) loader without running the page query. Entries
+    of older versions are never hit again and age out of the LRU.
+    """
+
+    def __init__(self, max_size: int = ETAG_PAGE_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[int, ...]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[int, ...]]:
+        with self._lock:
+            user_ids = self._entries.get(key)
+            if user_ids is not None:
+                self._entries.move_to_end(key)
+            return user_ids
+
+    def set(self, key: str, user_ids: Iterable[int]) -> None:
+        with self._lock:
+            self._entries[key] = tuple(user_ids)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# Process-wide: a miss (other worker, evicted) only costs the full request
+page_users = PageUsersCache()
+
+
+def set_etag(response: Response, etag: Optional[str]) -> None:
+    """Attach a validator to a 200 response (no-op when the version is not stable)"""
+    if etag is not None:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "private, no-cache"
@@ -0,0 +1,200 @@
+"""
+Chat Events
+Per-user event fan-out for the SSE / long-poll fallback channel
+"""
+
+import asyncio
+import json
+import logging
+import os
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+from ..models.chat import WebSocketEvent
+
+logger = logging.getLogger(__name__)
+
+
+# Events buffered per waiter; a client that falls further behind gets a
+# single resync event instead and catches up through GET /chat/sync
+EVENT_BUFFER_SIZE = int(os.getenv("CHAT_EVENT_BUFFER_SIZE", "64"))
+
+# Set to a PostgreSQL URL to fan events out across workers with LISTEN/NOTIFY.
+# Without it, events only reach waiters held by the worker that published them.
+EVENTS_BRIDGE_URL = os.getenv("CHAT_EVENTS_BRIDGE_URL")
+
+# NOTIFY payloads are limited to 8000 bytes
+_NOTIFY_PAYLOAD_LIMIT = 7900
+
+RESYNC_EVENT = json.dumps({"type": WebSocketEvent.RESYNC.value, "data": {}})
+
+
+def encode_event(event_type: WebSocketEvent, data: dict) -> str:
+    """Serialize an event once; the same string is shared by every waiter"""
+    return json.dumps({"type": event_type.value, "data": data}, default=str, ensure_ascii=False)
+
+
+class Waiter:
+    """One connected client: a bounded buffer of encoded events and a wakeup flag"""
+
+    __slots__ = ("events", "wakeup", "overflowed")
+
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE):
+        self.events: deque = deque(maxlen=buffer_size)
+        self.wakeup = asyncio.Event()
+        self.overflowed = False
+
+    def push(self, event: str) -> None:
+        if self.overflowed:
+            return
+        if len(self.events) == self.events.maxlen:
+            # Dropping events silently would leave the client out of sync
+            self.events.clear()
+            self.overflowed = True
+        else:
+            self.events.append(event)
+        self.wakeup.set()
+
+    async def next_batch(self, timeout: float) -> List[str]:
+        """Wait up to timeout seconds for events and take everything buffered"""
+        if not self.events and not self.overflowed:
+            # A timer handle instead of wait_for(): no extra task per idle waiter
+            timer = asyncio.get_running_loop().call_later(timeout, self.wakeup.set)
+            try:
+                await self.wakeup.wait()
+            finally:
+                timer.cancel()
+        self.wakeup.clear()
+
+        if self.overflowed:
+            self.overflowed = False
+            return [RESYNC_EVENT]
+        batch = list(self.events)
+        self.events.clear()
+        return batch
+
+
+class EventHub:
+    """
+    Process-local registry of waiters by user id.
+
+    Idle waiters cost an asyncio.Event and an empty deque; nothing polls.
+    publish() must be called after the handler commits, so clients never see
+    an event for data they cannot read yet.
+    """
+
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.bridge: Optional["PostgresEventBridge"] = None
+        self._waiters: Dict[int, Set[Waiter]] = {}
+
+    @contextmanager
+    def subscribe(self, user_id: int) -> Iterator[Waiter]:
+        waiter = Waiter(self.buffer_size)
+        self._waiters.setdefault(user_id, set()).add(waiter)
+        try:
+            yield waiter
+        finally:
+            waiters = self._waiters.get(user_id)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[user_id]
+
+    def deliver(self, user_ids: Iterable[int], event: str) -> None:
+        """Hand an encoded event to this worker's waiters"""
+        for user_id in user_ids:
+            for waiter in self._waiters.get(user_id, ()):
+                waiter.push(event)
+
+    def publish(self, user_ids: Iterable[int], event_type: WebSocketEvent, data: dict) -> None:
+        """Send an event to every connected client of user_ids (never blocks)"""
+        user_ids = list(user_ids)
+        event = encode_event(event_type, data)
+        self.deliver(user_ids, event)
+        if self.bridge is not None:
+            self.bridge.forward(user_ids, event)
+
+    @property
+    def waiter_count(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+
+class PostgresEventBridge:
+    """
+    Relays events between workers over one LISTEN/NOTIFY connection per worker.
+
+    Each worker delivers its own events locally and ignores their echo.
+    Events are sent in order by a single task; when the connection is down
+    they are dropped and clients recover through GET /chat/sync.
+    """
+
+    CHANNEL = "chat_events"
+
+    def __init__(self, hub: EventHub, dsn: str, queue_size: int = 10000):
+        self.hub = hub
+        self.dsn = dsn.replace("postgresql+asyncpg://", "postgresql://", 1)
+        self.origin = uuid.uuid4().hex
+        self._outbox: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self.hub.bridge = self
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self.hub.bridge = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def forward(self, user_ids: List[int], event: str) -> None:
+        payload = json.dumps({"o": self.origin, "u": user_ids, "e": event})
+        if len(payload.encode("utf-8")) > _NOTIFY_PAYLOAD_LIMIT:
+            payload = json.dumps({"o": self.origin, "u": user_ids, "e": RESYNC_EVENT})
+        try:
+            self._outbox.put_nowait(payload)
+        except asyncio.QueueFull:
+            logger.warning("Chat event bridge backlog full, dropping event")
+
+    def _on_notify(self, connection, pid, channel, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        if message.get("o") != self.origin:
+            self.hub.deliver(message.get("u", ()), message.get("e", RESYNC_EVENT))
+
+    async def _run(self) -> None:
+        import asyncpg
+
+        delay = 1.0
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                await connection.add_listener(self.CHANNEL, self._on_notify)
+                delay = 1.0
+                while True:
+                    payload = await self._outbox.get()
+                    await connection.execute("SELECT pg_notify($1, $2)", self.CHANNEL, payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Chat event bridge connection failed, retrying in %.0fs", delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+            finally:
+                if connection is not None:
+                    await connection.close()
+
+
+# Process-wide hub shared by every request on this worker
+event_hub = EventHub()
@@ -0,0 +1,112 @@
+"""
+Feature Flag Checks
+Server-side enforcement of feature_flags (see migrations/002_feature_flags.sql)
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi import Depends, HTTPException, status
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import SessionLocal
+
+# Import your existing dependencies
+# from ..dependencies import get_current_user
+
+
+# Seconds a flag decision is reused before asking the database again
+FEATURE_FLAG_CACHE_TTL = float(os.getenv("FEATURE_FLAG_CACHE_TTL", "30"))
+# Cached (flag, user) decisions per worker
+FEATURE_FLAG_CACHE_SIZE = int(os.getenv("FEATURE_FLAG_CACHE_SIZE", "10000"))
+
+
+class FlagDecisionCache:
+    """Bounded, thread-safe LRU of (flag_key, user_id) -> enabled with a time-to-live per entry"""
+
+    def __init__(self, max_size: int = FEATURE_FLAG_CACHE_SIZE, ttl: float = FEATURE_FLAG_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, Optional[int]], Tuple[float, bool]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, flag_key: str, user_id: Optional[int]) -> Optional[bool]:
+        key = (flag_key, user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, enabled = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return enabled
+
+    def set(self, flag_key: str, user_id: Optional[int], enabled: bool) -> None:
+        key = (flag_key, user_id)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, enabled)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# Process-wide cache shared by every request on this worker
+flag_decisions = FlagDecisionCache()
+
+
+async def is_feature_enabled(
+    flag_key: str,
+    user_id: Optional[int] = None,
+    db: Optional[AsyncSession] = None
+) -> bool:
+    """
+    Check a flag for a user through is_feature_enabled(), cached briefly.
+
+    Without db, a cache miss runs in its own short-lived session, so the
+    caller holds no connection afterwards.
+    """
+    enabled = flag_decisions.get(flag_key, user_id)
+    if enabled is not None:
+        return enabled
+
+    query = text("SELECT is_feature_enabled(:flag_key, :user_id)")
+    params = {"flag_key": flag_key, "user_id": user_id}
+    if db is None:
+        async with SessionLocal() as own_db:
+            enabled = bool((await own_db.execute(query, params)).scalar())
+    else:
+        enabled = bool((await db.execute(query, params)).scalar())
+
+    flag_decisions.set(flag_key, user_id, enabled)
+    return enabled
+
+
+def require_feature(flag_key: str):
+    """
+    Build a dependency that rejects the request when a flag is off.
+
+    It takes no request session: streamed uploads behind it hold no
+    database connection while the body arrives.
+
+    Usage: dependencies=[Depends(require_feature("chat_media_upload_enabled"))]
+    """
+    async def dependency(
+        current_user: User = Depends(get_current_user)
+    ) -> None:
+        if not await is_feature_enabled(flag_key, current_user.id):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"Feature {flag_key} is disabled"
+            )
+
+    return dependency
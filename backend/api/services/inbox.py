@@ -0,0 +1,108 @@
+"""
+Inbox Builder
+Hydrates a page of conversations with a constant number of queries
+"""
+
+from typing import Dict, List
+
+from sqlalchemy import select, true
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from ..models.chat import ConversationResponse
+from .read_receipts import read_watermarks
+from .serializers import message_row
+from .unread import conversation_unread_count
+from .user_loader import UserLoader
+
+# Import your existing models
+# from ..models import Conversation, Message
+
+
+async def load_last_messages(db: AsyncSession, conversation_ids: List) -> Dict:
+    """
+    Get the most recent message of each conversation in one query.
+
+    Uses a LATERAL join so every conversation is resolved with a LIMIT 1
+    probe on idx_messages_conversation_created_id instead of scanning its history.
+    """
+    if not conversation_ids:
+        return {}
+
+    page = (
+        select(Conversation.id.label("conversation_id"))
+        .where(Conversation.id.in_(conversation_ids))
+        .subquery("page")
+    )
+    latest = (
+        select(Message)
+        .where(Message.conversation_id == page.c.conversation_id)
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(1)
+        .lateral("latest")
+    )
+    latest_message = aliased(Message, latest)
+
+    rows = (await db.execute(
+        select(latest_message).select_from(page).join(latest, true())
+    )).scalars().all()
+    return {message.conversation_id: message for message in rows}
+
+
+async def build_inbox_rows(
+    db: AsyncSession,
+    conversations: List["Conversation"],
+    current_user_id: int,
+    users: UserLoader
+) -> List[dict]:
+    """
+    Build ConversationResponse fields (plain dicts) for a page of conversations.
+
+    Runs at most two queries regardless of page size: last messages and the
+    other participants not already in the user cache. Unread counts come from
+    the counters stored on the row.
+    """
+    conversation_ids = [conv.id for conv in conversations]
+    other_user_ids = [
+        conv.participant2_id if conv.participant1_id == current_user_id else conv.participant1_id
+        for conv in conversations
+    ]
+
+    last_messages = await load_last_messages(db, conversation_ids)
+    other_users = await users.load_many(other_user_ids)
+
+    rows = []
+    for conv, other_user_id in zip(conversations, other_user_ids):
+        is_participant1 = conv.participant1_id == current_user_id
+        last_message = last_messages.get(conv.id)
+        last_read_at, other_last_read_at = read_watermarks(conv, current_user_id)
+
+        rows.append({
+            "id": conv.id,
+            "participant1_id": conv.participant1_id,
+            "participant2_id": conv.participant2_id,
+            "created_at": conv.created_at,
+            "updated_at": conv.updated_at,
+            "last_message_at": conv.last_message_at,
+            "is_pinned": conv.participant1_pinned if is_participant1 else conv.participant2_pinned,
+            "is_muted": conv.participant1_muted if is_participant1 else conv.participant2_muted,
+            "is_archived": conv.participant1_archived if is_participant1 else conv.participant2_archived,
+            "last_message": message_row(last_message) if last_message else None,
+            "other_user": other_users.get(other_user_id),
+            "unread_count": conversation_unread_count(conv, current_user_id),
+            "last_read_at": last_read_at,
+            "other_last_read_at": other_last_read_at,
+        })
+
+    return rows
+
+
+async def build_inbox_page(
+    db: AsyncSession,
+    conversations: List["Conversation"],
+    current_user_id: int,
+    users: UserLoader
+) -> List[ConversationResponse]:
+    """Build ConversationResponse objects for a page of conversations (see build_inbox_rows)"""
+    rows = await build_inbox_rows(db, conversations, current_user_id, users)
+    return [ConversationResponse(**row) for row in rows]
@@ -0,0 +1,397 @@
+"""
+Media Processing Pipeline
+Background thumbnails, WebP size variants and video poster frames
+"""
+
+import asyncio
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# Processes rendering media (also the number of jobs processed concurrently)
+MEDIA_WORKERS = int(os.getenv("CHAT_MEDIA_WORKERS", "2"))
+# Jobs waiting for a worker; uploads beyond this are served without thumbnail
+MEDIA_QUEUE_SIZE = int(os.getenv("CHAT_MEDIA_QUEUE_SIZE", "1000"))
+MEDIA_MAX_ATTEMPTS = int(os.getenv("CHAT_MEDIA_MAX_ATTEMPTS", "3"))
+# Longest side of the chat bubble thumbnail, in pixels
+MEDIA_THUMBNAIL_SIZE = int(os.getenv("CHAT_MEDIA_THUMBNAIL_SIZE", "320"))
+# Widths of the WebP variants (only those smaller than the original are made)
+MEDIA_VARIANT_WIDTHS = tuple(
+    int(width) for width in os.getenv("CHAT_MEDIA_VARIANT_WIDTHS", "640,1280").split(",") if width
+)
+FFMPEG_PATH = os.getenv("CHAT_FFMPEG_PATH") or shutil.which("ffmpeg")
+
+
+class PermanentMediaError(Exception):
+    """Processing can never succeed for this input (do not retry)"""
+
+
+# ============================================================================
+# RENDERING (runs in worker processes - module-level functions only)
+# ============================================================================
+
+def _read_source(source: str) -> bytes:
+    if source.startswith(("http://", "https://")):
+        with urllib.request.urlopen(source, timeout=30) as response:
+            return response.read()
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def _encode_webp(image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="WEBP", quality=80, method=4)
+    return buffer.getvalue()
+
+
+def render_image_variants(
+    data: bytes,
+    thumbnail_size: int,
+    widths: Tuple[int, ...]
+) -> Dict[str, bytes]:
+    """
+    Render a WebP thumbnail and WebP width variants of an image.
+
+    Returns {"thumb": ..., "w640": ..., ...}.
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        raise PermanentMediaError("Pillow is not installed")
+
+    try:
+        with Image.open(io.BytesIO(data)) as original:
+            image = ImageOps.exif_transpose(original)
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    except (OSError, ValueError) as e:
+        raise PermanentMediaError(f"Unreadable image: {e}")
+
+    variants = {}
+
+    thumbnail = image.copy()
+    thumbnail.thumbnail((thumbnail_size, thumbnail_size), Image.LANCZOS)
+    variants["thumb"] = _encode_webp(thumbnail)
+
+    for width in widths:
+        if width >= image.width:
+            continue
+        height = max(round(image.height * width / image.width), 1)
+        variants[f"w{width}"] = _encode_webp(image.resize((width, height), Image.LANCZOS))
+
+    return variants
+
+
+def render_video_poster(source: str, ffmpeg_path: Optional[str]) -> bytes:
+    """Grab a JPEG poster frame (at 1s, or the first frame for short clips)"""
+    if not ffmpeg_path:
+        raise PermanentMediaError("ffmpeg is not available (set CHAT_FFMPEG_PATH)")
+
+    for offset in ("1", "0"):
+        result = subprocess.run(
+            [
+                ffmpeg_path, "-v", "error", "-ss", offset, "-i", source,
+                "-frames:v", "1", "-f", "image2", "-c:v", "mjpeg", "pipe:1",
+            ],
+            capture_output=True,
+            timeout=60,
+        )
+        if result.returncode == 0 and result.stdout:
+            return result.stdout
+
+    raise PermanentMediaError(f"ffmpeg could not read video: {result.stderr.decode()[-500:]}")
+
+
+def process_media(
+    source: str,
+    content_type: str,
+    ffmpeg_path: Optional[str],
+    thumbnail_size: int,
+    widths: Tuple[int, ...]
+) -> Dict[str, bytes]:
+    """Worker entry point: render every derived file for one upload"""
+    if content_type.startswith("image/"):
+        return render_image_variants(_read_source(source), thumbnail_size, widths)
+
+    if content_type.startswith("video/"):
+        poster = render_video_poster(source, ffmpeg_path)
+        variants = render_image_variants(poster, thumbnail_size, widths)
+        variants["poster"] = poster
+        return variants
+
+    raise PermanentMediaError(f"Nothing to render for {content_type}")
+
+
+# ============================================================================
+# STORAGE
+# ============================================================================
+
+class S3Storage:
+    """Read originals via presigned GET (so workers stream them) and write to S3"""
+
+    def __init__(self, s3_client, bucket: str, url_for: Callable[[str], str]):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.url_for = url_for
+
+    def source(self, key: str) -> str:
+        return self.s3_client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=600
+        )
+
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        self.s3_client.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType=content_type)
+
+    def url(self, key: str) -> str:
+        return self.url_for(key)
+
+
+class LocalStorage:
+    """Files under a local directory (offline development and tests)"""
+
+    def __init__(self, root: str, base_url: str = ""):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def source(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}" if self.base_url else self.source(key)
+
+
+# ============================================================================
+# PIPELINE
+# ============================================================================
+
+_SAVE_VARIANTS_SQL = text("""
+    INSERT INTO media_variants (media_url, content_type, status, attempts, last_error,
+                                thumbnail_url, poster_url, variants, updated_at)
+    VALUES (:media_url, :content_type, :status, :attempts, :last_error,
+            :thumbnail_url, :poster_url, CAST(:variants AS JSONB), NOW())
+    ON CONFLICT (media_url) DO UPDATE SET
+        status = EXCLUDED.status,
+        attempts = EXCLUDED.attempts,
+        last_error = EXCLUDED.last_error,
+        thumbnail_url = EXCLUDED.thumbnail_url,
+        poster_url = EXCLUDED.poster_url,
+        variants = EXCLUDED.variants,
+        updated_at = NOW()
+""")
+
+# Per-media advisory lock (namespace, hashtext(media_url)) held until commit:
+# exclusive while saving variants, shared by send_message reading them. A
+# message is thus either committed before the fill UPDATE runs, or sees the
+# ready thumbnail itself; neither misses the other.
+_MEDIA_LOCK_NAMESPACE = 0x6d656469  # "medi"
+_LOCK_MEDIA_SQL = text("SELECT pg_advisory_xact_lock(:namespace, hashtext(:media_url))")
+_LOCK_MEDIA_SHARED_SQL = text("SELECT pg_advisory_xact_lock_shared(:namespace, hashtext(:media_url))")
+
+_FILL_MESSAGES_SQL = text("""
+    UPDATE messages
+    SET media_thumbnail_url = :thumbnail_url
+    WHERE media_url = :media_url AND media_thumbnail_url IS NULL
+""")
+
+
+class MediaJob:
+    """One uploaded object waiting to be processed"""
+
+    def __init__(self, key: str, media_url: str, content_type: str):
+        self.key = key
+        self.media_url = media_url
+        self.content_type = content_type
+        self.attempts = 0
+
+
+def is_processable(content_type: str) -> bool:
+    return content_type.startswith(("image/", "video/"))
+
+
+class MediaProcessor:
+    """
+    Bounded background queue that renders derived media in a process pool.
+
+    Each job renders in a worker process, uploads the results next to the
+    original ({key}.thumb.webp, {key}.w640.webp, {key}.poster.jpg), records
+    them in media_variants and fills media_thumbnail_url of messages already
+    sent with that media. Failures are retried with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        storage,
+        session_factory=SessionLocal,
+        workers: int = MEDIA_WORKERS,
+        queue_size: int = MEDIA_QUEUE_SIZE,
+        max_attempts: int = MEDIA_MAX_ATTEMPTS,
+        retry_delay: float = 2.0,
+    ):
+        self.storage = storage
+        self.session_factory = session_factory
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._tasks = []
+        self._retries = set()
+
+    async def start(self) -> None:
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in [*self._tasks, *self._retries]:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._retries, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._queue, self._pool, self._tasks, self._retries = None, None, [], set()
+
+    async def drain(self) -> None:
+        """Wait until every queued job (including pending retries) is finished"""
+        while self._queue is not None:
+            await self._queue.join()
+            if not self._retries:
+                return
+            await asyncio.gather(*list(self._retries), return_exceptions=True)
+
+    def submit(self, key: str, media_url: str, content_type: str) -> bool:
+        """
+        Queue an upload for processing without waiting.
+
+        Returns False when there is nothing to render, the processor is not
+        running or the queue is full (the message then keeps no thumbnail).
+        """
+        if self._queue is None or not is_processable(content_type):
+            return False
+        try:
+            self._queue.put_nowait(MediaJob(key, media_url, content_type))
+            return True
+        except asyncio.QueueFull:
+            logger.warning("Media queue full, skipping thumbnails for %s", key)
+            return False
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._process(job)
+            except Exception:
+                logger.exception("Media job crashed for %s", job.key)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, job: MediaJob) -> None:
+        job.attempts += 1
+        loop = asyncio.get_running_loop()
+        try:
+            source = await asyncio.to_thread(self.storage.source, job.key)
+            rendered = await loop.run_in_executor(
+                self._pool, process_media, source, job.content_type,
+                FFMPEG_PATH, MEDIA_THUMBNAIL_SIZE, MEDIA_VARIANT_WIDTHS,
+            )
+            urls = await self._store(job, rendered)
+        except PermanentMediaError as e:
+            await self._save(job, "failed", error=str(e))
+            return
+        except Exception as e:
+            if job.attempts < self.max_attempts:
+                self._schedule_retry(job)
+            else:
+                await self._save(job, "failed", error=repr(e))
+            return
+
+        await self._save(job, "ready", urls=urls)
+
+    def _schedule_retry(self, job: MediaJob) -> None:
+        async def retry():
+            await asyncio.sleep(self.retry_delay * 2 ** (job.attempts - 1))
+            await self._queue.put(job)
+
+        task = asyncio.create_task(retry())
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _store(self, job: MediaJob, rendered: Dict[str, bytes]) -> Dict[str, str]:
+        """Upload rendered files next to the original and return their URLs"""
+        base = job.key.rsplit(".", 1)[0]
+        urls = {}
+        for name, data in rendered.items():
+            if name == "poster":
+                key, content_type = f"{base}.poster.jpg", "image/jpeg"
+            else:
+                key, content_type = f"{base}.{name}.webp", "image/webp"
+            await asyncio.to_thread(self.storage.put, key, data, content_type)
+            urls[name] = self.storage.url(key)
+        return urls
+
+    async def _save(self, job: MediaJob, status: str, urls: Optional[Dict[str, str]] = None,
+                    error: Optional[str] = None) -> None:
+        urls = urls or {}
+        thumbnail_url = urls.get("thumb")
+        async with self.session_factory() as db:
+            await db.execute(_LOCK_MEDIA_SQL, {"namespace": _MEDIA_LOCK_NAMESPACE, "media_url": job.media_url})
+            await db.execute(_SAVE_VARIANTS_SQL, {
+                "media_url": job.media_url,
+                "content_type": job.content_type,
+                "status": status,
+                "attempts": job.attempts,
+                "last_error": error,
+                "thumbnail_url": thumbnail_url,
+                "poster_url": urls.get("poster"),
+                "variants": json.dumps({
+                    name[1:]: url for name, url in urls.items() if name.startswith("w")
+                }),
+            })
+            if thumbnail_url:
+                await db.execute(_FILL_MESSAGES_SQL, {
+                    "media_url": job.media_url,
+                    "thumbnail_url": thumbnail_url,
+                })
+            await db.commit()
+
+
+async def get_ready_thumbnail(db: AsyncSession, media_url: str) -> Optional[str]:
+    """
+    Thumbnail URL of already processed media, if any.
+
+    Call it in the transaction that inserts the message: it holds the media's
+    shared lock until commit, so a thumbnail saved concurrently is either
+    returned here or filled into the message once it is committed.
+    """
+    await db.execute(_LOCK_MEDIA_SHARED_SQL, {"namespace": _MEDIA_LOCK_NAMESPACE, "media_url": media_url})
+    # Separate statement: its snapshot is taken after the lock is granted
+    return (await db.execute(
+        text("SELECT thumbnail_url FROM media_variants WHERE media_url = :media_url AND status = 'ready'"),
+        {"media_url": media_url}
+    )).scalar()
@@ -0,0 +1,271 @@
+"""
+Streaming Media Upload
+Forwards a request body to S3 multipart upload with bounded memory
+"""
+
+import asyncio
+import os
+from typing import Callable, List, Optional
+
+from botocore.exceptions import ClientError
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+
+# S3 requires every part but the last to be at least 5 MiB. This is also the
+# upper bound of what one upload keeps in memory.
+S3_PART_SIZE = max(int(os.getenv("CHAT_S3_PART_SIZE", str(5 * 1024 * 1024))), 5 * 1024 * 1024)
+
+
+class UploadRejected(Exception):
+    """Upload stopped before completion (bad type, too large, malformed body)"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class S3StreamWriter:
+    """
+    Buffer incoming bytes and ship them to S3 as multipart parts.
+
+    Small files (< one part) end up as a single put_object; larger ones use
+    create_multipart_upload / upload_part / complete_multipart_upload. boto3
+    calls run in a worker thread so the event loop is never blocked.
+    """
+
+    def __init__(self, s3_client, bucket: str, key: str, content_type: str,
+                 metadata: dict, part_size: int = S3_PART_SIZE):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self.metadata = metadata
+        self.part_size = part_size
+        self.size = 0
+        self.s3_seconds = 0.0
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: List[dict] = []
+
+    async def _call(self, method: str, **kwargs):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            return await asyncio.to_thread(getattr(self.s3_client, method), **kwargs)
+        finally:
+            self.s3_seconds += loop.time() - started
+
+    async def write(self, data: bytes) -> None:
+        self.size += len(data)
+        self._buffer += data
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            await self._upload_part(part)
+
+    async def _upload_part(self, part: bytes) -> None:
+        if self._upload_id is None:
+            response = await self._call(
+                "create_multipart_upload",
+                Bucket=self.bucket,
+                Key=self.key,
+                ContentType=self.content_type,
+                Metadata=self.metadata,
+            )
+            self._upload_id = response["UploadId"]
+
+        part_number = len(self._parts) + 1
+        response = await self._call(
+            "upload_part",
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=part,
+        )
+        self._parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+    async def complete(self) -> None:
+        """Flush the remaining buffer and finish the object"""
+        if self._upload_id is None:
+            await self._call(
+                "put_object",
+                Bucket=self.bucket,
+                Key=self.key,
+                Body=bytes(self._buffer),
+                ContentType=self.content_type,
+                Metadata=self.metadata,
+            )
+        else:
+            if self._buffer:
+                await self._upload_part(bytes(self._buffer))
+            await self._call(
+                "complete_multipart_upload",
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self._upload_id,
+                MultipartUpload={"Parts": self._parts},
+            )
+        self._buffer = bytearray()
+
+    async def abort(self) -> None:
+        """Discard uploaded parts so S3 does not keep (and bill) them"""
+        self._buffer = bytearray()
+        if self._upload_id is None:
+            return
+        try:
+            await self._call(
+                "abort_multipart_upload",
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self._upload_id,
+            )
+        except ClientError:
+            pass  # Bucket lifecycle rules clean up incomplete uploads
+
+
+class StreamedFile:
+    """Result of a streamed upload"""
+
+    def __init__(self, key: str, filename: str, content_type: str, size: int, s3_seconds: float):
+        self.key = key
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size
+        self.s3_seconds = s3_seconds
+
+
+async def stream_multipart_upload(
+    request,
+    s3_client,
+    bucket: str,
+    field_name: str,
+    allowed_types: List[str],
+    max_size_for: Callable[[str], int],
+    key_for: Callable[[str, str], str],
+    metadata: dict,
+) -> StreamedFile:
+    """
+    Stream the file field of a multipart/form-data request straight to S3.
+
+    Validates the part's content type as soon as its headers arrive and
+    enforces max_size_for(content_type) while bytes are read, aborting the
+    S3 upload on the first violation. Other form fields are ignored.
+
+    Raises:
+        UploadRejected: On a bad request, disallowed type or oversized file
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadRejected(400, "Expected a multipart/form-data body")
+
+    # Per-part parsing state filled by the (synchronous) parser callbacks
+    state = {
+        "header_field": b"",
+        "header_value": b"",
+        "headers": {},
+        "in_file": False,
+        "pending": [],
+        "done": False,
+    }
+    writer: Optional[S3StreamWriter] = None
+    file_info = {}
+
+    def on_part_begin():
+        state["headers"] = {}
+
+    def on_header_field(data, start, end):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header_field"].lower()] = state["header_value"]
+        state["header_field"] = b""
+        state["header_value"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        is_file = (
+            not state["done"]
+            and disposition.get(b"name", b"").decode("utf-8", "replace") == field_name
+            and b"filename" in disposition
+        )
+        state["in_file"] = is_file
+        if is_file:
+            file_info["filename"] = disposition[b"filename"].decode("utf-8", "replace")
+            file_info["content_type"] = state["headers"].get(
+                b"content-type", b"application/octet-stream"
+            ).decode("latin-1").strip()
+
+    def on_part_data(data, start, end):
+        if state["in_file"]:
+            state["pending"].append(data[start:end])
+
+    def on_part_end():
+        if state["in_file"]:
+            state["in_file"] = False
+            state["done"] = True
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+
+            if writer is None and file_info:
+                mime_type = file_info["content_type"]
+                if mime_type not in allowed_types:
+                    raise UploadRejected(400, f"File type {mime_type} not allowed")
+                writer = S3StreamWriter(
+                    s3_client, bucket, key_for(file_info["filename"], mime_type),
+                    mime_type, metadata,
+                )
+                max_size = max_size_for(mime_type)
+
+            if writer is not None and state["pending"]:
+                pending, state["pending"] = state["pending"], []
+                for data in pending:
+                    if writer.size + len(data) > max_size:
+                        raise UploadRejected(
+                            413, f"File too large. Max size: {max_size / (1024*1024)}MB"
+                        )
+                    await writer.write(data)
+
+            if state["done"]:
+                break  # Ignore whatever follows the file field
+
+        if not state["done"]:
+            parser.finalize()
+
+        if writer is None or not state["done"]:
+            raise UploadRejected(400, f"Missing file field '{field_name}'")
+
+        await writer.complete()
+    except BaseException:
+        if writer is not None:
+            await writer.abort()
+        raise
+
+    return StreamedFile(
+        key=writer.key,
+        filename=file_info["filename"],
+        content_type=writer.content_type,
+        size=writer.size,
+        s3_seconds=writer.s3_seconds,
+    )
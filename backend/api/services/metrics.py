@@ -0,0 +1,229 @@
+"""
+Metrics
+In-process latency histograms served in Prometheus text format at /metrics
+
+Requests are timed by MetricsRoute, so any router built with
+route_class=MetricsRoute records them whatever app includes it. Expose them
+with the router in routers/metrics.py. Metrics are per worker process:
+scrape every worker, or aggregate them in Prometheus.
+"""
+
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from starlette.exceptions import HTTPException as StarletteHTTPException
+
+from .query_profiler import QUERY_PROFILER, report_queries
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds. Long-poll requests (GET /chat/events) wait up to a minute
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+S3_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence) -> str:
+    return ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed buckets, one series per label values.
+
+    observe() is a bisect and a few increments under a lock (about a
+    microsecond); buckets are only summed up when rendered.
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Count per bucket, the +Inf bucket, then the sum
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            snapshot = [(labels, list(series)) for labels, series in self._series.items()]
+
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(snapshot, key=lambda item: tuple(map(str, item[0]))):
+            labels = _labels(self.label_names, label_values)
+            prefix = f"{labels}," if labels else ""
+            cumulative = 0
+            for upper, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{upper}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            braces = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{braces} {series[-1]}")
+            lines.append(f"{self.name}_count{braces} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Histograms plus collectors that produce gauge lines at scrape time"""
+
+    def __init__(self):
+        self._histograms: List[Histogram] = []
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        histogram = Histogram(name, documentation, label_names, buckets)
+        self._histograms.append(histogram)
+        return histogram
+
+    def register_collector(self, collector: Callable[[], List[str]]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for histogram in self._histograms:
+            lines.extend(histogram.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "Request latency by route and status",
+    ("method", "route", "status"),
+)
+REQUEST_DB_SECONDS = REGISTRY.histogram(
+    "http_request_db_seconds",
+    "Database time spent by one request",
+    ("method", "route"),
+    DB_BUCKETS,
+)
+UPLOAD_S3_SECONDS = REGISTRY.histogram(
+    "chat_upload_s3_seconds",
+    "S3 time spent by one streamed media upload",
+    (),
+    S3_BUCKETS,
+)
+
+
+def gauges(prefix: str, documentation: str, read: Callable[[], dict]) -> Callable[[], List[str]]:
+    """Collector exposing every numeric value of read() as a gauge named prefix_key"""
+    def collect() -> List[str]:
+        lines = []
+        for key, value in read().items():
+            if isinstance(value, (int, float)):
+                name = f"{prefix}_{key}"
+                lines += [f"# HELP {name} {documentation}", f"# TYPE {name} gauge", f"{name} {value}"]
+        return lines
+    return collect
+
+
+# ============================================================================
+# REQUEST TIMING
+# ============================================================================
+
+class RequestTimer:
+    """
+    Per-request accumulator filled by the database event hooks.
+
+    statements is only kept when the query profiler is on (CHAT_QUERY_PROFILER).
+    """
+
+    __slots__ = ("db_seconds", "db_queries", "statements")
+
+    def __init__(self, keep_statements: bool = False):
+        self.db_seconds = 0.0
+        self.db_queries = 0
+        self.statements: Optional[List[str]] = [] if keep_statements else None
+
+
+# Context variables follow the request into the AsyncSession greenlet and
+# into the threadpool that runs sync endpoints
+_current_timer: ContextVar[Optional[RequestTimer]] = ContextVar("request_timer", default=None)
+
+
+def current_timer() -> Optional[RequestTimer]:
+    return _current_timer.get()
+
+
+class MetricsRoute(APIRoute):
+    """
+    APIRoute that records latency and database time of every request.
+
+    The route label is the path template (/chat/conversations/{conversation_id}),
+    so series stay bounded whatever ids clients send.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        route = self.path
+
+        async def timed_handler(request: Request) -> Response:
+            timer = RequestTimer(QUERY_PROFILER)
+            token = _current_timer.set(timer)
+            started = perf_counter()
+            status_code = 500
+            response = None
+            try:
+                response = await handler(request)
+                status_code = response.status_code
+                return response
+            except StarletteHTTPException as e:
+                status_code = e.status_code
+                raise
+            except RequestValidationError:
+                status_code = 422
+                raise
+            finally:
+                _current_timer.reset(token)
+                REQUEST_SECONDS.observe(perf_counter() - started, request.method, route, status_code)
+                REQUEST_DB_SECONDS.observe(timer.db_seconds, request.method, route)
+                if timer.statements is not None:
+                    report_queries(request.method, route, status_code, timer, response)
+
+        return timed_handler
+
+
+def instrument_engine(engine) -> None:
+    """Add the statement time of engine (sync or async) to the current request"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started = perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        timer = _current_timer.get()
+        if timer is not None:
+            timer.db_seconds += perf_counter() - context._metrics_started
+            timer.db_queries += 1
+            if timer.statements is not None:
+                timer.statements.append(statement)
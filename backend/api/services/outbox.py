@@ -0,0 +1,407 @@
+"""
+Event Outbox
+Real-time events written in the same transaction as the change, delivered
+afterwards by a background dispatcher (see migration 013)
+
+Endpoints call enqueue_event() before commit, so an event exists exactly
+when its message / read receipt does and delivery never adds network
+latency to the request. OutboxDispatcher then sends pending events in
+batches to a sink (the API Gateway WebSocket connections of lambda/):
+
+- per conversation, events are delivered in the order they were written; a
+  failed event holds back the later events of its conversation until it is
+  delivered or given up
+- failures are retried with exponential backoff, up to OUTBOX_MAX_ATTEMPTS
+- every worker may run a dispatcher: batches take a transaction-level
+  advisory lock, so only one runs at a time and ordering holds
+
+Delivery is at least once: a retried event may reach some connections
+twice, clients de-duplicate by message id.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+import boto3
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import SessionLocal
+from ..models.chat import WebSocketEvent
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# API Gateway management endpoint of the WebSocket API (https://{api-id}.execute-api.{region}.amazonaws.com/{stage});
+# events are only written to the outbox when it is set
+WS_ENDPOINT_URL = os.getenv("CHAT_WS_ENDPOINT_URL")
+WS_CONNECTIONS_TABLE = os.getenv("CHAT_WS_CONNECTIONS_TABLE", "chat_connections")
+AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
+OUTBOX_ENABLED = bool(WS_ENDPOINT_URL)
+
+OUTBOX_BATCH_SIZE = int(os.getenv("CHAT_OUTBOX_BATCH_SIZE", "200"))
+# Seconds between polls when idle (commits on this worker wake it at once)
+OUTBOX_POLL_INTERVAL = float(os.getenv("CHAT_OUTBOX_POLL_INTERVAL", "0.5"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("CHAT_OUTBOX_MAX_ATTEMPTS", "8"))
+# Retry n waits OUTBOX_RETRY_DELAY * 2 ** (n - 1) seconds, at most 5 minutes
+OUTBOX_RETRY_DELAY = float(os.getenv("CHAT_OUTBOX_RETRY_DELAY", "1"))
+# Conversations delivered in parallel within a batch
+OUTBOX_CONCURRENCY = int(os.getenv("CHAT_OUTBOX_CONCURRENCY", "16"))
+# Seconds between backlog / lag refreshes for the metrics
+OUTBOX_STATS_INTERVAL = float(os.getenv("CHAT_OUTBOX_STATS_INTERVAL", "5"))
+# Ephemeral events (typing) posted directly at once; more are dropped
+WS_DIRECT_MAX_IN_FLIGHT = int(os.getenv("CHAT_WS_DIRECT_MAX_IN_FLIGHT", "64"))
+
+_LOCK_KEY = 0x63686174  # "chat"
+
+DELIVERY_LAG_SECONDS = REGISTRY.histogram(
+    "chat_outbox_delivery_lag_seconds",
+    "Time from commit to delivery of an outbox event",
+    (),
+    (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900),
+)
+
+
+# ============================================================================
+# WRITING
+# ============================================================================
+
+def _wake_dispatchers(session) -> None:
+    for dispatcher in OutboxDispatcher.running:
+        dispatcher.wake()
+
+
+async def enqueue_event(
+    db: AsyncSession,
+    recipient_ids: Iterable[int],
+    event_type: WebSocketEvent,
+    data: dict,
+    conversation_id: Optional[UUID] = None
+) -> None:
+    """
+    Add an event to the current transaction; it is only delivered if the
+    transaction commits. Events with the same conversation_id are delivered
+    in the order they were enqueued. No-op when the outbox is disabled.
+    """
+    if not OUTBOX_ENABLED:
+        return
+    await db.execute(
+        text("""
+            INSERT INTO chat_outbox (conversation_id, recipient_ids, event_type, payload)
+            VALUES (:conversation_id, :recipient_ids, :event_type, CAST(:payload AS JSONB))
+        """),
+        {
+            "conversation_id": conversation_id,
+            "recipient_ids": list(recipient_ids),
+            "event_type": event_type.value,
+            "payload": json.dumps(data, default=str, ensure_ascii=False),
+        }
+    )
+    # Deliver right after commit when this worker runs a dispatcher
+    event.listen(db.sync_session, "after_commit", _wake_dispatchers, once=True)
+
+
+# ============================================================================
+# SINKS
+# ============================================================================
+
+class OutboxEvent:
+    """One claimed row of chat_outbox"""
+
+    __slots__ = ("id", "conversation_id", "recipient_ids", "event_type", "payload", "attempts", "age")
+
+    def __init__(self, id: int, conversation_id: Optional[UUID], recipient_ids: List[int],
+                 event_type: str, payload: str, attempts: int, age: float):
+        self.id = id
+        self.conversation_id = conversation_id
+        self.recipient_ids = recipient_ids
+        self.event_type = event_type
+        # JSON text, embedded as is
+        self.payload = payload
+        self.attempts = attempts
+        # Seconds since the event was written, when it was claimed
+        self.age = age
+
+    def encode(self) -> bytes:
+        """Same format as the lambda handlers and GET /chat/events"""
+        return f'{{"type": {json.dumps(self.event_type)}, "data": {self.payload}}}'.encode("utf-8")
+
+
+class WebSocketGatewaySink:
+    """
+    Posts events to every API Gateway WebSocket connection of the recipients.
+
+    Connections come from the DynamoDB table written by lambda/connect.py
+    (UserIdIndex), cached for a few seconds so a batch looks each user up
+    once; gone connections are removed like lambda/send_message.py does.
+    Any other error fails the event, which is then retried.
+
+    post_nowait() skips the outbox for ephemeral events such as typing:
+    nothing is written, nothing is retried.
+    """
+
+    def __init__(self, endpoint_url: str, connections_table: str, cache_ttl: float = 5.0):
+        self.client = boto3.client("apigatewaymanagementapi", endpoint_url=endpoint_url, region_name=AWS_REGION)
+        self.table = boto3.resource("dynamodb", region_name=AWS_REGION).Table(connections_table)
+        self.cache_ttl = cache_ttl
+        self._connections: Dict[int, Tuple[float, List[str]]] = {}
+        self._direct: "set[asyncio.Task]" = set()
+
+    async def send(self, outbox_event: OutboxEvent) -> None:
+        await asyncio.to_thread(self._send, outbox_event.recipient_ids, outbox_event.encode())
+
+    def post_nowait(self, recipient_ids: Iterable[int], event_type: WebSocketEvent, data: dict) -> None:
+        """Best-effort delivery from the event loop; dropped on failure or when too many are in flight"""
+        if len(self._direct) >= WS_DIRECT_MAX_IN_FLIGHT:
+            return
+        payload = json.dumps({"type": event_type.value, "data": data}, ensure_ascii=False).encode("utf-8")
+        task = asyncio.get_running_loop().create_task(
+            asyncio.to_thread(self._send, list(recipient_ids), payload)
+        )
+        self._direct.add(task)
+        task.add_done_callback(self._direct_done)
+
+    def _direct_done(self, task: asyncio.Task) -> None:
+        self._direct.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug("Direct WebSocket post failed: %r", task.exception())
+
+    def _send(self, recipient_ids: List[int], data: bytes) -> None:
+        for user_id in recipient_ids:
+            for connection_id in self._connection_ids(user_id):
+                try:
+                    self.client.post_to_connection(ConnectionId=connection_id, Data=data)
+                except self.client.exceptions.GoneException:
+                    self.table.delete_item(Key={"connectionId": connection_id})
+                    self._connections.pop(user_id, None)
+
+    def _connection_ids(self, user_id: int) -> List[str]:
+        cached = self._connections.get(user_id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        response = self.table.query(
+            IndexName="UserIdIndex",
+            KeyConditionExpression="userId = :uid",
+            ExpressionAttributeValues={":uid": user_id}
+        )
+        connection_ids = [item["connectionId"] for item in response.get("Items", [])]
+        self._connections[user_id] = (time.monotonic() + self.cache_ttl, connection_ids)
+        return connection_ids
+
+
+# API Gateway connections of this worker (None when CHAT_WS_ENDPOINT_URL is unset)
+websocket_gateway = WebSocketGatewaySink(WS_ENDPOINT_URL, WS_CONNECTIONS_TABLE) if OUTBOX_ENABLED else None
+
+
+# ============================================================================
+# DISPATCHER
+# ============================================================================
+
+class OutboxDispatcher:
+    """Background task delivering chat_outbox in batches; start() / stop() with the app"""
+
+    # Dispatchers started in this process, woken by enqueue_event() commits
+    running: "set[OutboxDispatcher]" = set()
+
+    def __init__(
+        self,
+        sink,
+        session_factory=SessionLocal,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        poll_interval: float = OUTBOX_POLL_INTERVAL,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+        retry_delay: float = OUTBOX_RETRY_DELAY,
+        concurrency: int = OUTBOX_CONCURRENCY,
+    ):
+        self.sink = sink
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.concurrency = concurrency
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats_at = float("-inf")
+        self._stats = {
+            "backlog": 0,
+            "lag_seconds": 0.0,
+            "failed": 0,
+            "delivered": 0,
+            "retried": 0,
+            "given_up": 0,
+        }
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+            OutboxDispatcher.running.add(self)
+
+    async def stop(self) -> None:
+        OutboxDispatcher.running.discard(self)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def stats(self) -> dict:
+        """
+        backlog / lag_seconds (age of the oldest pending event) / failed as of
+        the last refresh, and delivered / retried / given_up since start
+        """
+        return dict(self._stats)
+
+    async def _run(self) -> None:
+        delay = 1.0
+        while True:
+            try:
+                claimed = await self.dispatch_once()
+                delay = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Chat outbox dispatch failed, retrying in %.0fs", delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+                continue
+
+            if claimed < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def dispatch_once(self) -> int:
+        """Deliver one batch; returns the number of events claimed"""
+        async with self.session_factory() as db:
+            if time.monotonic() - self._stats_at >= OUTBOX_STATS_INTERVAL:
+                await self._refresh_stats(db)
+
+            locked = (await db.execute(
+                text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _LOCK_KEY}
+            )).scalar()
+            if not locked:
+                # Another worker is delivering a batch
+                return 0
+
+            # Oldest first, skipping conversations whose earlier event waits for a retry
+            rows = (await db.execute(
+                text("""
+                    SELECT id, conversation_id, recipient_ids, event_type, payload::TEXT, attempts,
+                           EXTRACT(EPOCH FROM clock_timestamp() - created_at) AS age
+                    FROM chat_outbox pending
+                    WHERE failed_at IS NULL
+                      AND available_at <= NOW()
+                      AND NOT EXISTS (
+                          SELECT 1 FROM chat_outbox earlier
+                          WHERE earlier.conversation_id = pending.conversation_id
+                            AND earlier.id < pending.id
+                            AND earlier.failed_at IS NULL
+                            AND earlier.available_at > NOW()
+                      )
+                    ORDER BY id
+                    LIMIT :limit
+                """),
+                {"limit": self.batch_size}
+            )).all()
+            if not rows:
+                return 0
+
+            events = [OutboxEvent(*row[:6], float(row[6])) for row in rows]
+            delivered, failures = await self._deliver(events)
+
+            if delivered:
+                await db.execute(
+                    text("DELETE FROM chat_outbox WHERE id = ANY(:ids)"),
+                    {"ids": delivered}
+                )
+            for outbox_event, error in failures:
+                await self._record_failure(db, outbox_event, error)
+            await db.commit()
+            return len(events)
+
+    async def _deliver(self, events: List[OutboxEvent]) -> Tuple[List[int], List[Tuple[OutboxEvent, str]]]:
+        """Conversations in parallel, each one's events in order"""
+        sequences: Dict[object, List[OutboxEvent]] = {}
+        for outbox_event in events:
+            # Unordered events get a sequence of their own
+            key = outbox_event.conversation_id or outbox_event.id
+            sequences.setdefault(key, []).append(outbox_event)
+
+        delivered: List[int] = []
+        failures: List[Tuple[OutboxEvent, str]] = []
+        limit = asyncio.Semaphore(self.concurrency)
+        started = time.perf_counter()
+
+        async def deliver_sequence(sequence: List[OutboxEvent]) -> None:
+            async with limit:
+                for outbox_event in sequence:
+                    try:
+                        await self.sink.send(outbox_event)
+                    except Exception as e:
+                        # The rest of the conversation waits for this one
+                        failures.append((outbox_event, f"{type(e).__name__}: {e}"))
+                        return
+                    delivered.append(outbox_event.id)
+                    DELIVERY_LAG_SECONDS.observe(outbox_event.age + time.perf_counter() - started)
+
+        await asyncio.gather(*(deliver_sequence(sequence) for sequence in sequences.values()))
+        self._stats["delivered"] += len(delivered)
+        return delivered, failures
+
+    async def _record_failure(self, db: AsyncSession, outbox_event: OutboxEvent, error: str) -> None:
+        attempts = outbox_event.attempts + 1
+        if attempts >= self.max_attempts:
+            logger.error("Chat outbox event %s given up after %d attempts: %s", outbox_event.id, attempts, error)
+            self._stats["given_up"] += 1
+            await db.execute(
+                text("""
+                    UPDATE chat_outbox SET attempts = :attempts, last_error = :error, failed_at = NOW()
+                    WHERE id = :id
+                """),
+                {"id": outbox_event.id, "attempts": attempts, "error": error}
+            )
+            return
+
+        retry_in = min(self.retry_delay * 2 ** (attempts - 1), 300.0)
+        logger.warning("Chat outbox event %s failed (attempt %d), retrying in %.1fs: %s",
+                       outbox_event.id, attempts, retry_in, error)
+        self._stats["retried"] += 1
+        await db.execute(
+            text("""
+                UPDATE chat_outbox
+                SET attempts = :attempts, last_error = :error,
+                    available_at = NOW() + make_interval(secs => :retry_in)
+                WHERE id = :id
+            """),
+            {"id": outbox_event.id, "attempts": attempts, "error": error, "retry_in": retry_in}
+        )
+
+    async def _refresh_stats(self, db: AsyncSession) -> None:
+        backlog, failed, lag = (await db.execute(text("""
+            SELECT COUNT(*) FILTER (WHERE failed_at IS NULL),
+                   COUNT(*) FILTER (WHERE failed_at IS NOT NULL),
+                   EXTRACT(EPOCH FROM clock_timestamp() - MIN(created_at) FILTER (WHERE failed_at IS NULL))
+            FROM chat_outbox
+        """))).one()
+        self._stats.update(backlog=backlog, failed=failed, lag_seconds=round(float(lag or 0), 3))
+        self._stats_at = time.monotonic()
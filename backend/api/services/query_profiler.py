@@ -0,0 +1,153 @@
+"""
+Query Profiler
+Per-request SQL statement counts and N+1 detection for development and staging
+
+With CHAT_QUERY_PROFILER=1, every route timed by MetricsRoute (services/metrics.py)
+keeps the statements it ran and reports them:
+    X-Query-Count: 4
+    X-Query-Time: 2.8              (milliseconds in the database)
+    X-Query-Repeated: 1            (highest count of one statement shape)
+    Server-Timing: db;dur=2.8;desc="4 queries"
+plus one log line per request, and a warning when the route goes over its
+query budget or repeats a statement shape CHAT_QUERY_REPEAT_LIMIT times
+(the usual sign of a per-row lookup). Leave it off in production.
+"""
+
+import logging
+import os
+import re
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+QUERY_PROFILER = os.getenv("CHAT_QUERY_PROFILER", "").lower() in ("1", "true", "yes")
+# Statements a request may run before a warning is logged
+QUERY_BUDGET = int(os.getenv("CHAT_QUERY_BUDGET", "10"))
+# Per-route budgets: "GET /chat/conversations=4,POST /chat/messages=8"
+QUERY_BUDGETS: Dict[str, int] = {
+    key.strip(): int(value)
+    for key, _, value in (
+        item.rpartition("=") for item in os.getenv("CHAT_QUERY_BUDGETS", "").split(",") if "=" in item
+    )
+}
+# Runs of the same statement shape reported as a possible N+1
+QUERY_REPEAT_LIMIT = int(os.getenv("CHAT_QUERY_REPEAT_LIMIT", "3"))
+
+
+# ============================================================================
+# STATEMENT SHAPES
+# ============================================================================
+
+_WHITESPACE = re.compile(r"\s+")
+_PARAMETER = re.compile(r"\$\d+|%\(\w+\)s|%s|\?")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+# (?, ?, ?) from expanded IN lists, with or without casts
+_LIST = re.compile(r"\(\?(?:::[\w\[\]]+)?(?:, ?\?(?:::[\w\[\]]+)?)*\)")
+
+
+def statement_shape(statement: str) -> str:
+    """Statement with parameters and literals replaced, so per-row repeats compare equal"""
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    shape = _STRING.sub("?", shape)
+    shape = _PARAMETER.sub("?", shape)
+    shape = _NUMBER.sub("?", shape)
+    return _LIST.sub("(?...)", shape)
+
+
+def repeated_shapes(statements: List[str], limit: int = QUERY_REPEAT_LIMIT) -> Dict[str, int]:
+    """Shapes run at least limit times, most repeated first"""
+    counts = Counter(statement_shape(statement) for statement in statements)
+    return {shape: count for shape, count in counts.most_common() if count >= limit}
+
+
+def query_budget(method: str, route: str) -> int:
+    return QUERY_BUDGETS.get(f"{method} {route}", QUERY_BUDGET)
+
+
+# ============================================================================
+# REQUEST REPORT
+# ============================================================================
+
+def report_queries(method: str, route: str, status_code: int, timer, response=None) -> None:
+    """
+    Headers, log line and warnings for one profiled request.
+
+    timer is the request's RequestTimer (statements, db_seconds, db_queries);
+    response is None when the handler raised, then only the log is written.
+    """
+    shapes = Counter(statement_shape(statement) for statement in timer.statements)
+    max_repeats = max(shapes.values(), default=0)
+    db_ms = timer.db_seconds * 1000
+
+    if response is not None:
+        response.headers["X-Query-Count"] = str(timer.db_queries)
+        response.headers["X-Query-Time"] = f"{db_ms:.1f}"
+        response.headers["X-Query-Repeated"] = str(max_repeats)
+        response.headers.append("Server-Timing", f'db;dur={db_ms:.1f};desc="{timer.db_queries} queries"')
+
+    logger.info(
+        "%s %s %s: %d queries, %.1f ms in db, %d distinct",
+        method, route, status_code, timer.db_queries, db_ms, len(shapes)
+    )
+
+    budget = query_budget(method, route)
+    if timer.db_queries > budget:
+        logger.warning("%s %s ran %d queries, budget is %d", method, route, timer.db_queries, budget)
+    for shape, count in shapes.most_common():
+        if count < QUERY_REPEAT_LIMIT:
+            break
+        logger.warning("%s %s ran the same query %d times (possible N+1): %.200s", method, route, count, shape)
+
+
+# ============================================================================
+# TEST HELPER
+# ============================================================================
+
+@contextmanager
+def assert_max_queries(
+    engine,
+    limit: int,
+    exact: bool = False,
+    max_repeats: Optional[int] = None
+) -> Iterator[List[str]]:
+    """
+    Fail when the block runs more than limit statements on engine (sync or
+    async), or not exactly limit with exact=True. With max_repeats, also fail
+    when one statement shape runs more often than that. Works without
+    CHAT_QUERY_PROFILER and across the TestClient thread:
+
+        with assert_max_queries(engine, 4, max_repeats=1):
+            client.get("/api/v1/chat/conversations")
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+    statements: List[str] = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(sync_engine, "before_cursor_execute", _record)
+    try:
+        yield statements
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", _record)
+
+    count = len(statements)
+    repeats = repeated_shapes(statements, max_repeats + 1) if max_repeats is not None else {}
+    if count > limit or (exact and count != limit) or repeats:
+        expected = f"exactly {limit} queries" if exact else f"at most {limit} queries"
+        if max_repeats is not None:
+            expected += f", each shape at most {max_repeats} times"
+        listing = "\n".join(
+            f"  {times}x {shape}" for shape, times in Counter(map(statement_shape, statements)).most_common()
+        )
+        raise AssertionError(f"Expected {expected}, ran {count} queries:\n{listing}")
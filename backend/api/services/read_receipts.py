@@ -0,0 +1,113 @@
+"""
+Read Receipts
+Per-participant "read up to" watermarks on conversations
+"""
+
+from datetime import datetime, timezone
+from typing import NamedTuple, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import DateTime, literal, text, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .unread import remove_unread
+
+# Import your existing models
+# from ..models import Conversation, Message
+
+
+# Only ever moves forward: a stale client cannot un-read a conversation.
+# GREATEST ignores NULL, so the first call simply sets the watermark.
+_ADVANCE_WATERMARK_SQL = text("""
+    UPDATE conversations
+    SET
+        participant1_last_read_at = CASE WHEN participant1_id = :user_id
+            THEN GREATEST(participant1_last_read_at, CAST(:read_up_to AS TIMESTAMPTZ))
+            ELSE participant1_last_read_at END,
+        participant2_last_read_at = CASE WHEN participant2_id = :user_id
+            THEN GREATEST(participant2_last_read_at, CAST(:read_up_to AS TIMESTAMPTZ))
+            ELSE participant2_last_read_at END
+    WHERE id = :conversation_id
+      AND :user_id IN (participant1_id, participant2_id)
+    RETURNING
+        CASE WHEN participant1_id = :user_id THEN participant2_id ELSE participant1_id END,
+        CASE WHEN participant1_id = :user_id THEN participant1_last_read_at ELSE participant2_last_read_at END
+""")
+
+
+class ReadUpTo(NamedTuple):
+    """Outcome of mark_read_up_to"""
+    marked: int  # Messages that became read
+    other_user_id: int
+    last_read_at: datetime  # Reader's watermark after the call
+
+
+def read_watermarks(
+    conversation: "Conversation",
+    user_id: int
+) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Get (last_read_at of user_id, last_read_at of the other participant)"""
+    if conversation.participant1_id == user_id:
+        return conversation.participant1_last_read_at, conversation.participant2_last_read_at
+    return conversation.participant2_last_read_at, conversation.participant1_last_read_at
+
+
+async def mark_read_up_to(
+    db: AsyncSession,
+    conversation_id: UUID,
+    user_id: int,
+    up_to_at: datetime,
+    up_to_id: Optional[UUID] = None
+) -> Optional[ReadUpTo]:
+    """
+    Mark every message user_id received in a conversation up to a point as read.
+
+    The point is a (created_at, id) keyset position from a message cursor, or
+    just a timestamp when up_to_id is None. Advances the participant's read
+    watermark, marks the messages in one statement over
+    idx_messages_conversation_unread and moves the unread counters by the
+    number of rows changed. Does not commit.
+
+    Returns None if the conversation does not exist or user_id is not a
+    participant.
+    """
+    # created_at is TIMESTAMPTZ: compare with an aware UTC instant, since a
+    # naive one would be read in the session's (or the process's) time zone.
+    # Naive input is UTC; never read ahead of the server clock.
+    if up_to_at.tzinfo is None:
+        up_to_at = up_to_at.replace(tzinfo=timezone.utc)
+    up_to_at = min(up_to_at.astimezone(timezone.utc), datetime.now(timezone.utc))
+
+    advanced = (await db.execute(_ADVANCE_WATERMARK_SQL, {
+        "conversation_id": conversation_id,
+        "user_id": user_id,
+        "read_up_to": up_to_at,
+    })).first()
+    if advanced is None:
+        return None
+
+    # The plain created_at bound also skips the monthly partitions ahead of
+    # up_to_at (migration 011), which a row comparison alone would not
+    up_to = literal(up_to_at, DateTime(timezone=True))
+    position = [Message.created_at <= up_to]
+    if up_to_id is not None:
+        position.append(tuple_(Message.created_at, Message.id) <= tuple_(up_to, literal(up_to_id)))
+    updated = (await db.execute(
+        update(Message).where(
+            Message.conversation_id == conversation_id,
+            Message.read_at == None,
+            Message.recipient_id == user_id,
+            *position
+        ).values(
+            read_at=datetime.utcnow()
+        ).returning(
+            Message.recipient_deleted_at
+        ).execution_options(synchronize_session=False)
+    )).all()
+
+    # Messages the recipient already deleted were not counted as unread
+    await remove_unread(
+        db, conversation_id, user_id,
+        sum(1 for (recipient_deleted_at,) in updated if recipient_deleted_at is None)
+    )
+    return ReadUpTo(len(updated), advanced[0], advanced[1])
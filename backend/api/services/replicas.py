@@ -0,0 +1,300 @@
+"""
+Read Replicas
+Routes read-only requests to streaming replicas without losing read-your-writes
+
+A monitor samples the primary's WAL position every DB_REPLICA_CHECK_INTERVAL
+seconds and checks how far each replica has replayed (its LSN). When a
+replica has replayed the position sampled at time T, it holds every commit
+made before T, and now minus T is its lag.
+
+After each commit of a tracked session (WatermarkSession), the primary's
+WAL position is read once and returned to the writer in the chat_lsn
+cookie. The client sends it back on its next requests, whichever worker or
+instance serves them, and reads go to a replica only when its replayed LSN
+is at or past it. A user who just sent or read messages thus reads from
+the primary until a replica has the write. Users touched by a write who
+hold no cookie (the recipient of a message) are stamped in this worker's
+memory, best effort.
+
+Replicas that lag more than DB_REPLICA_MAX_LAG_SECONDS, cannot be reached,
+or fail a request are skipped, and every read falls back to the primary
+while none is usable (or before the monitor has run).
+"""
+
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import Response
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# Replicas further behind the primary than this are not read from
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "5"))
+# Seconds between two lag checks
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "1"))
+# Local testing: pretend replicas replay this many seconds late (the
+# replica URL may then point at the primary itself)
+DB_REPLICA_SIMULATED_LAG_SECONDS = float(os.getenv("DB_REPLICA_SIMULATED_LAG_SECONDS", "0"))
+
+# Cookie carrying the WAL position of the user's last commit
+LSN_COOKIE = "chat_lsn"
+
+# WAL position as a number of bytes; a server that is not a standby (the
+# primary itself, with the simulated lag) reports its own position
+_PRIMARY_LSN = text("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), '0/0')")
+_REPLAYED_LSN = text("""
+    SELECT pg_wal_lsn_diff(
+        CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_lsn() END,
+        '0/0'
+    )
+""")
+
+# Errors that mean the replica itself is unusable, not the query
+_CONNECTION_ERRORS = (OSError, OperationalError, InterfaceError)
+
+_WATERMARK_CALLBACKS = "wal_watermark_callbacks"
+
+
+class WatermarkSession(AsyncSession):
+    """
+    AsyncSession reading the primary's WAL position after each commit, for
+    the callbacks registered by ReadRouter.track_writes (none: no query).
+    """
+
+    async def commit(self) -> None:
+        await super().commit()
+        callbacks = self.info.get(_WATERMARK_CALLBACKS)
+        if callbacks:
+            position = int((await self.execute(_PRIMARY_LSN)).scalar())
+            await super().commit()
+            for callback in callbacks:
+                callback(position)
+
+
+class Replica:
+    """One read replica and its replication state as last measured"""
+
+    def __init__(self, name: str, engine: AsyncEngine):
+        self.name = name
+        self.engine = engine
+        self.sessions = async_sessionmaker(engine, expire_on_commit=False)
+        # None until the first check
+        self.reachable: Optional[bool] = None
+        # Monotonic time before which every primary commit is on the replica
+        self.caught_up_at = float("-inf")
+        # WAL position known to be visible on the replica
+        self.replayed = -1
+        # (sampled at, primary WAL position) not replayed yet, oldest first
+        self.samples: Deque[Tuple[float, int]] = deque(maxlen=1000)
+
+    def lag(self, now: float) -> float:
+        return now - self.caught_up_at
+
+
+class ReadRouter:
+    """
+    Picks the engine for read-only sessions; start() / stop() the lag
+    monitor with the app. Without replicas every read uses the primary.
+    """
+
+    def __init__(
+        self,
+        primary: AsyncEngine,
+        replicas: List[AsyncEngine],
+        max_lag: float = DB_REPLICA_MAX_LAG_SECONDS,
+        check_interval: float = DB_REPLICA_CHECK_INTERVAL,
+        simulated_lag: float = DB_REPLICA_SIMULATED_LAG_SECONDS,
+    ):
+        self.primary_sessions = async_sessionmaker(primary, expire_on_commit=False)
+        self.primary = primary
+        self.replicas = [Replica(f"replica{index}", engine) for index, engine in enumerate(replicas)]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.simulated_lag = simulated_lag
+        # user_id -> (WAL position, monotonic time) of commits seen by this worker
+        self._written: Dict[int, Tuple[int, float]] = {}
+        self._next = 0
+        self._task: Optional[asyncio.Task] = None
+        self.reads_primary = 0
+        self.reads_replica = 0
+
+    # ------------------------------------------------------------------------
+    # Routing
+    # ------------------------------------------------------------------------
+
+    def track_writes(self, db: AsyncSession, user_ids: Iterable[int], response: Optional[Response] = None) -> None:
+        """
+        Keep user_ids on the primary after each commit of db (a WatermarkSession)
+        until a replica has it; response gets the chat_lsn cookie for the writer.
+        """
+        if not self.replicas:
+            return
+        user_ids = tuple(user_ids)
+
+        def _committed(position: int) -> None:
+            committed_at = time.monotonic()
+            for user_id in user_ids:
+                self._written[user_id] = (position, committed_at)
+            if response is not None:
+                # Past max_lag every usable replica has the commit
+                response.set_cookie(
+                    LSN_COOKIE, str(position), max_age=math.ceil(self.max_lag) + 1, httponly=True, samesite="lax"
+                )
+
+        callbacks: List[Callable[[int], None]] = db.info.setdefault(_WATERMARK_CALLBACKS, [])
+        callbacks.append(_committed)
+
+    def choose(self, user_id: int, min_position: int = 0) -> Optional[Replica]:
+        """
+        A replica that replayed the user's last commit (min_position from the
+        chat_lsn cookie, or this worker's stamp), or None for the primary
+        """
+        if not self.replicas:
+            self.reads_primary += 1
+            return None
+
+        now = time.monotonic()
+        written = self._written.get(user_id)
+        if written is not None:
+            min_position = max(min_position, written[0])
+        usable = [
+            replica for replica in self.replicas
+            if replica.reachable
+            and replica.lag(now) <= self.max_lag
+            and replica.replayed >= min_position
+        ]
+        if not usable:
+            self.reads_primary += 1
+            return None
+
+        self._next += 1
+        self.reads_replica += 1
+        return usable[self._next % len(usable)]
+
+    @asynccontextmanager
+    async def session(self, user_id: int, lsn_cookie: Optional[str] = None) -> AsyncIterator[AsyncSession]:
+        """Read-only session for user_id, on a replica when it is safe"""
+        try:
+            min_position = int(lsn_cookie) if lsn_cookie else 0
+        except ValueError:
+            min_position = 0
+        replica = self.choose(user_id, min_position)
+        if replica is None:
+            async with self.primary_sessions() as db:
+                yield db
+            return
+
+        async with replica.sessions() as db:
+            try:
+                yield db
+            except _CONNECTION_ERRORS as e:
+                self._mark_down(replica, e)
+                raise
+            except DBAPIError as e:
+                if e.connection_invalidated:
+                    self._mark_down(replica, e)
+                raise
+
+    def _mark_down(self, replica: Replica, error: Exception) -> None:
+        """Stop reading from replica until the next successful check"""
+        if replica.reachable:
+            logger.warning("Read replica %s failed a request, using the primary: %s", replica.name, error)
+        replica.reachable = False
+
+    # ------------------------------------------------------------------------
+    # Lag monitor
+    # ------------------------------------------------------------------------
+
+    async def start(self) -> None:
+        if self.replicas and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.check()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Read replica check failed")
+            await asyncio.sleep(self.check_interval)
+
+    async def check(self) -> None:
+        """Sample the primary, then advance each replica's watermark"""
+        sampled_at = time.monotonic()
+        try:
+            async with self.primary.connect() as conn:
+                position = int((await conn.execute(_PRIMARY_LSN)).scalar())
+        except Exception as e:
+            # No new sample: replica lag keeps growing until they are skipped
+            logger.warning("Read replica check could not reach the primary: %s", e)
+        else:
+            for replica in self.replicas:
+                replica.samples.append((sampled_at, position))
+
+        await asyncio.gather(*(self._check_replica(replica) for replica in self.replicas))
+
+        # Older commits are on every usable replica (lag <= max_lag)
+        horizon = time.monotonic() - self.max_lag
+        for user_id in [user_id for user_id, (_, at) in self._written.items() if at < horizon]:
+            del self._written[user_id]
+
+    async def _check_replica(self, replica: Replica) -> None:
+        try:
+            async with replica.engine.connect() as conn:
+                replayed = int((await conn.execute(_REPLAYED_LSN)).scalar())
+        except Exception as e:
+            if replica.reachable is not False:
+                logger.warning("Read replica %s unreachable, using the primary: %s", replica.name, e)
+            replica.reachable = False
+            return
+
+        if not replica.reachable:
+            logger.info("Read replica %s reachable", replica.name)
+        replica.reachable = True
+
+        visible_before = time.monotonic() - self.simulated_lag
+        samples = replica.samples
+        while samples and samples[0][1] <= replayed and samples[0][0] <= visible_before:
+            replica.caught_up_at, position = samples.popleft()
+            if self.simulated_lag:
+                # Only what the simulated replica would have replayed
+                replica.replayed = position
+        if not self.simulated_lag:
+            replica.replayed = replayed
+
+    def stats(self) -> dict:
+        """Read counts since start, users pinned to the primary, and per replica lag / reachable"""
+        now = time.monotonic()
+        stats = {
+            "reads_primary": self.reads_primary,
+            "reads_replica": self.reads_replica,
+            "pinned_users": len(self._written),
+        }
+        for replica in self.replicas:
+            stats[f"{replica.name}_lag_seconds"] = round(replica.lag(now), 3)
+            stats[f"{replica.name}_reachable"] = int(bool(replica.reachable))
+        return stats
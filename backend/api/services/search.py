@@ -0,0 +1,108 @@
+"""
+Message Search
+Full-text search over a user's chat history (see migration 010)
+"""
+
+import html
+from typing import List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import and_, func, literal, literal_column, or_, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.chat import MessageSearchHit, MessageSearchResponse
+from .cursors import encode_cursor
+from .serializers import message_row
+
+# Import your existing models
+# from ..models import Message
+
+
+# Module constant, never user input: must match the generated column's config
+_SEARCH_CONFIG = literal_column("'chat_portuguese'::regconfig")
+
+# Private-use characters as ts_headline markers: the snippet is HTML-escaped
+# afterwards, so message text can never inject markup, then the markers
+# become <mark> tags
+_MATCH_START, _MATCH_STOP = "\ue000", "\ue001"
+_HEADLINE_OPTIONS = (
+    f'StartSel="{_MATCH_START}", StopSel="{_MATCH_STOP}", '
+    'MaxWords=24, MinWords=8, MaxFragments=2, FragmentDelimiter=" … "'
+)
+
+
+def render_snippet(headline: Optional[str]) -> str:
+    """HTML-escaped snippet with matches wrapped in <mark>"""
+    escaped = html.escape(headline or "", quote=False)
+    return escaped.replace(_MATCH_START, "<mark>").replace(_MATCH_STOP, "</mark>")
+
+
+async def search_messages(
+    db: AsyncSession,
+    user_id: int,
+    query_text: str,
+    conversation_id: Optional[UUID] = None,
+    before: Optional[Tuple] = None,
+    limit: int = 20
+) -> MessageSearchResponse:
+    """
+    Search the messages user_id can see, newest first.
+
+    query_text uses web search syntax ("exact phrase", or, -word) and is
+    stemmed like the messages, so "regar" finds "regando". Messages the user
+    deleted on their side are never returned. before is a decoded
+    next_cursor; snippets are only built for the returned page.
+    """
+    ts_query = func.websearch_to_tsquery(_SEARCH_CONFIG, query_text)
+
+    matches = select(Message.id).where(
+        Message.search_vector.bool_op("@@")(ts_query),
+        or_(
+            and_(
+                Message.sender_id == user_id,
+                Message.sender_deleted_at == None
+            ),
+            and_(
+                Message.recipient_id == user_id,
+                Message.recipient_deleted_at == None
+            )
+        )
+    )
+    if conversation_id is not None:
+        matches = matches.where(Message.conversation_id == conversation_id)
+    if before is not None:
+        # created_at bound for partition pruning (see get_messages)
+        matches = matches.where(
+            tuple_(Message.created_at, Message.id) < tuple_(*before),
+            Message.created_at <= literal(before[0])
+        )
+    matches = matches.order_by(
+        Message.created_at.desc(),
+        Message.id.desc()
+    ).limit(limit + 1).subquery("matches")
+
+    rows = (await db.execute(
+        select(
+            Message,
+            func.ts_headline(_SEARCH_CONFIG, Message.text_content, ts_query, _HEADLINE_OPTIONS)
+        ).join(
+            matches, Message.id == matches.c.id
+        ).order_by(
+            Message.created_at.desc(),
+            Message.id.desc()
+        )
+    )).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    hits: List[MessageSearchHit] = [
+        MessageSearchHit(**message_row(message), snippet=render_snippet(headline))
+        for message, headline in rows
+    ]
+    next_cursor = None
+    if has_more:
+        last = rows[-1][0]
+        next_cursor = encode_cursor(last.created_at, last.id)
+
+    return MessageSearchResponse(data=hits, has_more=has_more, next_cursor=next_cursor)
@@ -0,0 +1,58 @@
+"""
+Serializers
+Build response schemas from ORM rows without touching lazy relationships
+"""
+
+import os
+from uuid import UUID
+
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+
+from ..models.chat import ConversationsListResponse, MessageResponse, MessagesListResponse
+
+try:
+    import orjson
+except ImportError:  # pydantic-core's encoder is used instead
+    orjson = None
+
+# Column-backed fields only: reading a relationship such as Message.sender
+# would trigger a lazy load, which AsyncSession does not allow
+MESSAGE_FIELDS = [name for name in MessageResponse.model_fields if name != "sender"]
+
+# Opt-in fast path for list endpoints: rows go to plain dicts, the whole page
+# is validated once, written to JSON with orjson when installed, and FastAPI's
+# response_model pass is skipped. The JSON is the same as the default path.
+FAST_SERIALIZATION = os.getenv("CHAT_FAST_SERIALIZATION", "").lower() in ("1", "true", "yes")
+
+messages_page_adapter = TypeAdapter(MessagesListResponse)
+conversations_page_adapter = TypeAdapter(ConversationsListResponse)
+
+
+def message_row(message: "Message") -> dict:
+    """MessageResponse fields of a Message row, as a plain dict"""
+    return {name: getattr(message, name) for name in MESSAGE_FIELDS}
+
+
+def to_message_response(message: "Message") -> MessageResponse:
+    """Build MessageResponse from a Message row's column attributes"""
+    return MessageResponse(**message_row(message))
+
+
+def json_default(value):
+    # Response models have no aliases or computed fields, so a model's
+    # __dict__ is exactly its JSON object. asyncpg returns its own UUID
+    # subclass, which orjson does not recognize.
+    if isinstance(value, UUID):
+        return str(value)
+    return vars(value)
+
+
+def render_page(adapter: TypeAdapter, page: dict) -> Response:
+    """Validate a page of plain dicts in one pass and write it straight to JSON"""
+    validated = adapter.validate_python(page)
+    if orjson is not None:
+        content = orjson.dumps(validated, default=json_default, option=orjson.OPT_UTC_Z)
+    else:
+        content = adapter.dump_json(validated)
+    return Response(content=content, media_type="application/json")
@@ -0,0 +1,173 @@
+"""
+Delta Sync
+Per-user change feed over messages and conversations for polling clients
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Tuple
+from uuid import UUID
+
+from sqlalchemy import select, tuple_, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models.chat import SyncResponse
+from .cursors import decode_cursor, encode_cursor
+from .inbox import build_inbox_page
+from .serializers import to_message_response
+from .user_loader import UserLoader
+
+# Import your existing models
+# from ..models import Conversation, Message
+
+
+# Rows are stamped before their transaction commits, so a row can become
+# visible with a changed_at slightly behind rows already returned. Streams that
+# are caught up keep their position this far behind the clock and re-send
+# those rows on the next sync (clients apply changes as idempotent upserts).
+SYNC_OVERLAP = timedelta(seconds=float(os.getenv("CHAT_SYNC_OVERLAP_SECONDS", "5")))
+
+_ZERO_ID = UUID(int=0)
+
+
+def encode_sync_token(messages_position: Tuple[datetime, UUID], conversations_position: Tuple[datetime, UUID]) -> str:
+    """Encode the (changed_at, id) position of both change streams"""
+    return f"{encode_cursor(*messages_position)}.{encode_cursor(*conversations_position)}"
+
+
+def decode_sync_token(token: str) -> Tuple[Tuple[datetime, UUID], Tuple[datetime, UUID]]:
+    """
+    Decode a token produced by encode_sync_token.
+
+    Raises:
+        ValueError: If the token is malformed
+    """
+    messages_part, _, conversations_part = token.partition(".")
+    if not conversations_part:
+        raise ValueError(f"Invalid sync token: {token}")
+    return decode_cursor(messages_part), decode_cursor(conversations_part)
+
+
+async def _changed_rows(
+    db: AsyncSession,
+    model,
+    user_columns,
+    user_id: int,
+    position: Tuple[datetime, UUID],
+    limit: int
+) -> list:
+    """
+    Get up to limit + 1 rows of model changed after position, oldest change first.
+
+    Each column in user_columns (e.g. sender_id / recipient_id) is read as its
+    own range scan on a (user column, changed_at, id) index and the legs are
+    merged, so the cost follows the number of changes, not history size.
+    """
+    legs = [
+        select(model.id, model.changed_at).where(
+            column == user_id,
+            tuple_(model.changed_at, model.id) > tuple_(*position)
+        ).order_by(model.changed_at, model.id).limit(limit + 1)
+        for column in user_columns
+    ]
+    changed_ids = union_all(*[leg.subquery().select() for leg in legs]).subquery("changed_ids")
+
+    return list((await db.execute(
+        select(model).join(
+            changed_ids, model.id == changed_ids.c.id
+        ).order_by(
+            model.changed_at,
+            model.id
+        ).limit(limit + 1)
+    )).scalars().all())
+
+
+def _next_position(
+    rows: list,
+    position: Tuple[datetime, UUID],
+    limit: int,
+    now: datetime
+) -> Tuple[Tuple[datetime, UUID], bool]:
+    """Position to resume a stream from, and whether the stream was truncated"""
+    if len(rows) > limit:
+        # Exact keyset position: the rest is picked up on the next call
+        last = rows[limit - 1]
+        return (last.changed_at, last.id), True
+    if not rows:
+        return position, False
+
+    last = rows[-1]
+    horizon = now - SYNC_OVERLAP
+    if last.changed_at < horizon:
+        return (last.changed_at, last.id), False
+    return max((horizon, _ZERO_ID), position), False
+
+
+def initial_sync_token() -> str:
+    """Token for a client that has just loaded its state through the list endpoints"""
+    start = (datetime.now(timezone.utc) - SYNC_OVERLAP, _ZERO_ID)
+    return encode_sync_token(start, start)
+
+
+async def load_changes(
+    db: AsyncSession,
+    user_id: int,
+    since: Tuple[Tuple[datetime, UUID], Tuple[datetime, UUID]],
+    users: UserLoader,
+    limit: int = 200
+) -> SyncResponse:
+    """
+    Get what changed for user_id since the positions of a decoded sync token.
+
+    Messages the user deleted on their side and conversations they deleted
+    are reported as ids only.
+    """
+    messages_position, conversations_position = since
+    now = datetime.now(timezone.utc)
+
+    messages = await _changed_rows(
+        db, Message, (Message.sender_id, Message.recipient_id),
+        user_id, messages_position, limit
+    )
+    conversations = await _changed_rows(
+        db, Conversation, (Conversation.participant1_id, Conversation.participant2_id),
+        user_id, conversations_position, limit
+    )
+
+    messages_position, messages_truncated = _next_position(messages, messages_position, limit, now)
+    conversations_position, conversations_truncated = _next_position(
+        conversations, conversations_position, limit, now
+    )
+
+    visible_messages: List = []
+    deleted_message_ids: List[UUID] = []
+    for message in messages[:limit]:
+        deleted_at = (
+            message.sender_deleted_at if message.sender_id == user_id
+            else message.recipient_deleted_at
+        )
+        if deleted_at is None:
+            visible_messages.append(message)
+        else:
+            deleted_message_ids.append(message.id)
+
+    visible_conversations: List = []
+    deleted_conversation_ids: List[UUID] = []
+    for conversation in conversations[:limit]:
+        deleted_at = (
+            conversation.participant1_deleted_at if conversation.participant1_id == user_id
+            else conversation.participant2_deleted_at
+        )
+        if deleted_at is None:
+            visible_conversations.append(conversation)
+        else:
+            deleted_conversation_ids.append(conversation.id)
+
+    return SyncResponse(
+        messages=[to_message_response(message) for message in visible_messages],
+        deleted_message_ids=deleted_message_ids,
+        conversations=await build_inbox_page(db, visible_conversations, user_id, users),
+        deleted_conversation_ids=deleted_conversation_ids,
+        token=encode_sync_token(messages_position, conversations_position),
+        has_more=messages_truncated or conversations_truncated
+    )
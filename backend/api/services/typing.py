@@ -0,0 +1,135 @@
+"""
+Typing Indicators
+In-memory typing state per (conversation, user) with debounced forwarding
+
+Typing never touches the database: state lives in this worker's memory and
+only changes are published, through event_hub and, when configured,
+straight to the WebSocket gateway (best effort, not via the outbox). A
+client that sends start / stop on every keystroke burst produces at most
+one event per debounce window, and a flapping start-stop-start inside the
+window produces none.
+A user who stops sending starts is reported as stopped after the TTL.
+
+State is per worker; with several workers the events still reach every
+client through the event bridge, only the coalescing is per worker.
+"""
+
+import asyncio
+import os
+from typing import Callable, Dict, Optional, Tuple
+from uuid import UUID
+
+from ..models.chat import WebSocketEvent
+from .events import event_hub
+from .outbox import websocket_gateway
+
+
+# Seconds between two forwarded changes of the same user in a conversation
+TYPING_DEBOUNCE = float(os.getenv("CHAT_TYPING_DEBOUNCE_SECONDS", "0.5"))
+# Seconds after the last start before the user is reported as stopped
+TYPING_TTL = float(os.getenv("CHAT_TYPING_TTL_SECONDS", "6"))
+
+Key = Tuple[UUID, int]
+
+
+class _Typing:
+    """State of one user in one conversation"""
+
+    __slots__ = ("recipient_ids", "typing", "forwarded", "forwarded_at", "flush", "expire")
+
+    def __init__(self, recipient_ids: Tuple[int, ...]):
+        self.recipient_ids = recipient_ids
+        self.typing = False
+        # Last state sent to the recipients, and when
+        self.forwarded = False
+        self.forwarded_at = float("-inf")
+        self.flush: Optional[asyncio.TimerHandle] = None
+        self.expire: Optional[asyncio.TimerHandle] = None
+
+
+class TypingStore:
+    """
+    Typing state with TTL, debounced on the running event loop.
+
+    forward(conversation_id, user_id, recipient_ids, is_typing) is called
+    for each change that must reach the recipients. Not thread-safe: call
+    it from the event loop (async endpoints).
+    """
+
+    def __init__(
+        self,
+        forward: Callable[[UUID, int, Tuple[int, ...], bool], None],
+        debounce: float = TYPING_DEBOUNCE,
+        ttl: float = TYPING_TTL
+    ):
+        self.forward = forward
+        self.debounce = debounce
+        self.ttl = ttl
+        self._entries: Dict[Key, _Typing] = {}
+
+    def set(self, conversation_id: UUID, user_id: int, recipient_ids: Tuple[int, ...], is_typing: bool) -> None:
+        key = (conversation_id, user_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            if not is_typing:
+                return
+            entry = self._entries[key] = _Typing(recipient_ids)
+
+        loop = asyncio.get_running_loop()
+        entry.typing = is_typing
+        if entry.expire is not None:
+            entry.expire.cancel()
+            entry.expire = None
+        if is_typing:
+            entry.expire = loop.call_later(self.ttl, self._expire, key)
+
+        if entry.flush is None:
+            wait = entry.forwarded_at + self.debounce - loop.time()
+            if wait > 0:
+                entry.flush = loop.call_later(wait, self._flush, key)
+            else:
+                self._flush(key)
+
+    def is_typing(self, conversation_id: UUID, user_id: int) -> bool:
+        entry = self._entries.get((conversation_id, user_id))
+        return entry is not None and entry.typing
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _flush(self, key: Key) -> None:
+        entry = self._entries[key]
+        entry.flush = None
+        loop = asyncio.get_running_loop()
+        if entry.typing != entry.forwarded:
+            entry.forwarded = entry.typing
+            entry.forwarded_at = loop.time()
+            self.forward(key[0], key[1], entry.recipient_ids, entry.typing)
+
+        if not entry.typing:
+            remaining = entry.forwarded_at + self.debounce - loop.time()
+            if remaining > 0:
+                # A start inside the window is still debounced, then forget the user
+                entry.flush = loop.call_later(remaining, self._flush, key)
+            else:
+                del self._entries[key]
+
+    def _expire(self, key: Key) -> None:
+        entry = self._entries[key]
+        entry.expire = None
+        self.set(key[0], key[1], entry.recipient_ids, False)
+
+
+def _publish(conversation_id: UUID, user_id: int, recipient_ids: Tuple[int, ...], is_typing: bool) -> None:
+    data = {
+        "conversationId": str(conversation_id),
+        "userId": user_id,
+        "isTyping": is_typing
+    }
+    event_hub.publish(recipient_ids, WebSocketEvent.TYPING, data)
+    if websocket_gateway is not None:
+        websocket_gateway.post_nowait(recipient_ids, WebSocketEvent.TYPING, data)
+
+
+# Process-wide store shared by every request on this worker
+typing_store = TypingStore(_publish)
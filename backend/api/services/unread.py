@@ -0,0 +1,161 @@
+"""
+Unread Counters
+Denormalized per-conversation and per-user unread counters, maintained on write
+"""
+
+from typing import Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+# Adjusts the caller's side of the conversation and reports the value before
+# and after, so the per-user totals can be moved by the same amount.
+# A NULL delta resets the counter to zero. With unless_deleted, participants
+# who deleted the conversation are left untouched.
+_ADJUST_CONVERSATION_SQL = text("""
+    WITH previous AS (
+        SELECT
+            id,
+            CASE WHEN participant1_id = :user_id
+                THEN participant1_unread_count
+                ELSE participant2_unread_count
+            END AS unread
+        FROM conversations
+        WHERE id = :conversation_id
+          AND :user_id IN (participant1_id, participant2_id)
+          AND (
+              NOT CAST(:unless_deleted AS BOOLEAN)
+              OR CASE WHEN participant1_id = :user_id
+                  THEN participant1_deleted_at
+                  ELSE participant2_deleted_at
+              END IS NULL
+          )
+        FOR UPDATE
+    ), adjusted AS (
+        SELECT
+            id,
+            unread AS old_unread,
+            GREATEST(unread + COALESCE(CAST(:delta AS INTEGER), -unread), 0) AS new_unread
+        FROM previous
+    )
+    UPDATE conversations c
+    SET
+        participant1_unread_count = CASE WHEN c.participant1_id = :user_id
+            THEN adjusted.new_unread ELSE c.participant1_unread_count END,
+        participant2_unread_count = CASE WHEN c.participant2_id = :user_id
+            THEN adjusted.new_unread ELSE c.participant2_unread_count END
+    FROM adjusted
+    WHERE c.id = adjusted.id
+    RETURNING adjusted.old_unread, adjusted.new_unread
+""")
+
+_ADJUST_USER_SQL = text("""
+    INSERT INTO user_unread_counters (user_id, total_unread, conversations_with_unread, updated_at)
+    VALUES (:user_id, GREATEST(:total_delta, 0), GREATEST(:conversations_delta, 0), NOW())
+    ON CONFLICT (user_id) DO UPDATE SET
+        total_unread = GREATEST(user_unread_counters.total_unread + :total_delta, 0),
+        conversations_with_unread = GREATEST(
+            user_unread_counters.conversations_with_unread + :conversations_delta, 0
+        ),
+        updated_at = NOW()
+""")
+
+
+async def _adjust_unread(
+    db: AsyncSession,
+    conversation_id: UUID,
+    user_id: int,
+    delta: Optional[int],
+    unless_deleted: bool = False
+) -> None:
+    """Move a participant's conversation counter and their totals together"""
+    row = (await db.execute(_ADJUST_CONVERSATION_SQL, {
+        "conversation_id": conversation_id,
+        "user_id": user_id,
+        "delta": delta,
+        "unless_deleted": unless_deleted,
+    })).first()
+    if row is None:
+        return
+
+    old_unread, new_unread = row
+    total_delta = new_unread - old_unread
+    conversations_delta = int(new_unread > 0) - int(old_unread > 0)
+    if total_delta == 0 and conversations_delta == 0:
+        return
+
+    await db.execute(_ADJUST_USER_SQL, {
+        "user_id": user_id,
+        "total_delta": total_delta,
+        "conversations_delta": conversations_delta,
+    })
+
+
+async def add_unread(
+    db: AsyncSession,
+    conversation_id: UUID,
+    user_id: int,
+    count: int = 1,
+    unless_deleted: bool = False
+) -> None:
+    """
+    Record new unread messages for a participant (does not commit).
+
+    With unless_deleted, nothing is recorded if the participant deleted the
+    conversation, so callers don't have to load it to check.
+    """
+    if count > 0:
+        await _adjust_unread(db, conversation_id, user_id, count, unless_deleted)
+
+
+async def remove_unread(db: AsyncSession, conversation_id: UUID, user_id: int, count: int) -> None:
+    """Record messages that stopped being unread for a participant (does not commit)"""
+    if count > 0:
+        await _adjust_unread(db, conversation_id, user_id, -count)
+
+
+async def clear_unread(db: AsyncSession, conversation_id: UUID, user_id: int) -> None:
+    """Reset a participant's unread counter for a conversation (does not commit)"""
+    await _adjust_unread(db, conversation_id, user_id, None)
+
+
+def conversation_unread_count(conversation: "Conversation", user_id: int) -> int:
+    """Get the stored unread counter of a participant"""
+    if conversation.participant1_id == user_id:
+        return conversation.participant1_unread_count or 0
+    return conversation.participant2_unread_count or 0
+
+
+async def get_user_unread_totals(db: AsyncSession, user_id: int) -> Tuple[int, int]:
+    """
+    Get (total_unread, conversations_with_unread) for a user.
+
+    Single primary-key lookup; users without a row have nothing unread.
+    """
+    row = (await db.execute(text("""
+        SELECT total_unread, conversations_with_unread
+        FROM user_unread_counters
+        WHERE user_id = :user_id
+    """), {"user_id": user_id})).first()
+
+    if row is None:
+        return 0, 0
+    return row[0], row[1]
+
+
+async def reconcile_unread_counters(db: AsyncSession, user_id: Optional[int] = None) -> int:
+    """
+    Recompute unread counters from the messages table.
+
+    Repairs any drift (e.g. manual SQL edits). Pass user_id to repair a single
+    user, or None to rebuild everyone. Returns the number of conversations
+    whose counters were wrong. Commits.
+    """
+    fixed = (await db.execute(
+        text("SELECT reconcile_unread_counters(:user_id)"),
+        {"user_id": user_id}
+    )).scalar()
+    await db.commit()
+    return fixed or 0
@@ -0,0 +1,148 @@
+"""
+User Profile Loader
+Batched, cached UserInfo hydration shared by the chat endpoints
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from fastapi import Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from ..database import get_db
+from ..models.chat import UserInfo
+
+# Import your existing models
+# from ..models import User
+
+
+USER_CACHE_SIZE = int(os.getenv("CHAT_USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("CHAT_USER_CACHE_TTL", "60"))
+
+
+class UserProfileCache:
+    """Bounded, thread-safe LRU of UserInfo with a time-to-live per entry"""
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, user_ids: Iterable[int]) -> Dict[int, UserInfo]:
+        """Return the fresh cached entries among user_ids"""
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for user_id in user_ids:
+                entry = self._entries.get(user_id)
+                if entry is None:
+                    continue
+                expires_at, info = entry
+                if expires_at < now:
+                    del self._entries[user_id]
+                    continue
+                self._entries.move_to_end(user_id)
+                found[user_id] = info
+        return found
+
+    def set_many(self, infos: Iterable[UserInfo]) -> None:
+        """Store entries, evicting the least recently used beyond max_size"""
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for info in infos:
+                self._entries[info.id] = (expires_at, info)
+                self._entries.move_to_end(info.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        """Drop a user's entry (call when their profile changes)"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# Process-wide cache shared by every request on this worker
+user_profile_cache = UserProfileCache()
+
+
+def invalidate_user_profile(user_id: int) -> None:
+    """
+    Invalidate a cached profile.
+
+    Call from the Social API wherever username, name or avatar are updated.
+    Other workers pick up the change when their entry expires (CHAT_USER_CACHE_TTL).
+    """
+    user_profile_cache.invalidate(user_id)
+
+
+def to_user_info(user: "User") -> UserInfo:
+    """Build UserInfo from a User row (image must already be loaded)"""
+    return UserInfo(
+        id=user.id,
+        username=user.username,
+        name=user.name,
+        avatar_url=user.image.image if user.image else None,
+        is_online=False,  # TODO: Get from Redis/WebSocket
+        last_seen=None,  # TODO: Get from users table
+    )
+
+
+class UserLoader:
+    """
+    Per-request user batch loader.
+
+    Resolves any set of user IDs from the request memo, then the process
+    cache, then a single IN query (with the avatar eagerly joined) for the rest.
+    """
+
+    def __init__(self, db: AsyncSession, cache: UserProfileCache = user_profile_cache):
+        self.db = db
+        self.cache = cache
+        self._loaded: Dict[int, Optional[UserInfo]] = {}
+
+    async def load_many(self, user_ids: Iterable[int]) -> Dict[int, UserInfo]:
+        """Get UserInfo for each existing user in user_ids"""
+        wanted = set(user_ids)
+        missing = wanted - self._loaded.keys()
+
+        if missing:
+            cached = self.cache.get_many(missing)
+            self._loaded.update(cached)
+            missing -= cached.keys()
+
+        if missing:
+            users = (await self.db.execute(
+                select(User).options(joinedload(User.image)).where(User.id.in_(missing))
+            )).scalars().all()
+
+            infos = [to_user_info(user) for user in users]
+            self.cache.set_many(infos)
+            for info in infos:
+                self._loaded[info.id] = info
+            for user_id in missing - {info.id for info in infos}:
+                self._loaded[user_id] = None
+
+        return {
+            user_id: self._loaded[user_id]
+            for user_id in wanted
+            if self._loaded.get(user_id) is not None
+        }
+
+    async def load(self, user_id: int) -> Optional[UserInfo]:
+        """Get UserInfo for one user, or None if it does not exist"""
+        return (await self.load_many([user_id])).get(user_id)
+
+
+def get_user_loader(db: AsyncSession = Depends(get_db)) -> UserLoader:
+    """FastAPI dependency: one loader per request, sharing the request session"""
+    return UserLoader(db)
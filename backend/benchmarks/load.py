@@ -0,0 +1,289 @@
+"""
+Chat Load Test
+Concurrent virtual users driving the chat API through the app's flows,
+with latency percentiles per endpoint checked against a stored baseline
+
+Each virtual user (VU) repeats a session: load the inbox, open a
+conversation, scroll back one page, send a message, mark the conversation
+as read and refresh the unread badge. Requests are authenticated as test
+users 1..--users via X-User-Id, like local-test/main.py expects.
+
+With --reset, the database is first truncated and reloaded with the fixed
+dataset of local-test/generate_data.py (same --users and --seed,
+conversations long enough to scroll), so every run and the baseline see
+the same data. It wipes the chat tables of DATABASE_URL: only point it at
+the local-test database. Baselines are only saved from a reset run.
+
+Run from backend/ against a local-test server started with enough users,
+with the server's DATABASE_URL in the environment:
+    cd local-test && LOCAL_TEST_USERS=50 uvicorn main:app --port 8000
+    python -m benchmarks.load --reset [--vus 20] [--duration 30] [--users 50]
+    python -m benchmarks.load --reset --save-baseline     # after an intended change
+
+Exits with status 1 when an endpoint fails requests, or its p95 / p99 or
+throughput is worse than the baseline beyond --tolerance.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+
+BASELINE_PATH = Path(__file__).parent / "baselines" / "local_test.json"
+LOCAL_TEST_DIR = Path(__file__).resolve().parent.parent / "local-test"
+API = "/api/v1/chat"
+
+# Every endpoint a session can reach; a baseline must cover all of them
+FLOW_ENDPOINTS = (
+    "GET /chat/conversations",
+    "GET /chat/conversations/{id}/messages",
+    "GET /chat/conversations/{id}/messages?before",
+    "GET /chat/unread-count",
+    "POST /chat/messages",
+    "POST /chat/messages/read",
+)
+# One message page in local-test/main.py; scrolling needs a full one
+PAGE_SIZE = 50
+
+
+class Recorder:
+    """Latencies (ms) and failures per endpoint, only while measuring"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.measuring = False
+
+    async def request(self, client: httpx.AsyncClient, endpoint: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            failed = response.status_code >= 400
+        except httpx.HTTPError:
+            response, failed = None, True
+        if self.measuring:
+            self.latencies[endpoint].append((time.perf_counter() - started) * 1000)
+            if failed:
+                self.errors[endpoint] += 1
+        return None if failed else response
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+# ============================================================================
+# FLOWS
+# ============================================================================
+
+def reset_dataset(args: argparse.Namespace) -> None:
+    """
+    Truncate and reload the fixed dataset (not measured). Conversations have
+    at least two pages, so the scroll step runs in every session.
+    """
+    subprocess.run(
+        [
+            sys.executable, "generate_data.py", "--truncate",
+            "--users", str(args.users),
+            "--conversations-per-user", str(args.conversations_per_user),
+            "--min-messages", str(2 * PAGE_SIZE),
+            "--max-messages", "5000",
+            "--seed", str(args.seed),
+        ],
+        cwd=LOCAL_TEST_DIR,
+        check=True,
+    )
+
+
+async def session(client: httpx.AsyncClient, recorder: Recorder, user_id: int, users: int,
+                  rng: random.Random, think: float) -> None:
+    """One visit to the chat screen by user_id"""
+    headers = {"X-User-Id": str(user_id)}
+
+    async def pause():
+        if think:
+            await asyncio.sleep(rng.uniform(0, 2 * think))
+
+    inbox = await recorder.request(client, "GET /chat/conversations", "GET", f"{API}/conversations", headers=headers)
+    await recorder.request(client, "GET /chat/unread-count", "GET", f"{API}/unread-count", headers=headers)
+    await pause()
+
+    conversations = inbox.json()["data"] if inbox is not None else []
+    if conversations:
+        conversation = rng.choice(conversations)
+        other_id = conversation["participant2_id"] if conversation["participant1_id"] == user_id \
+            else conversation["participant1_id"]
+        messages_url = f"{API}/conversations/{conversation['id']}/messages"
+
+        page = await recorder.request(
+            client, "GET /chat/conversations/{id}/messages", "GET", messages_url, headers=headers
+        )
+        await pause()
+        rows = page.json()["data"] if page is not None else []
+        if len(rows) >= PAGE_SIZE:
+            await recorder.request(
+                client, "GET /chat/conversations/{id}/messages?before", "GET", messages_url,
+                headers=headers, params={"before": rows[-1]["created_at"]},
+            )
+            await pause()
+
+        await recorder.request(
+            client, "POST /chat/messages/read", "POST", f"{API}/messages/read",
+            headers=headers, json={"conversation_id": conversation["id"]},
+        )
+    else:
+        other_id = rng.choice([i for i in range(1, users + 1) if i != user_id])
+
+    await recorder.request(
+        client, "POST /chat/messages", "POST", f"{API}/messages", headers=headers,
+        json={"recipient_id": other_id, "content_type": "text", "text_content": f"load test {rng.random():.6f}"},
+    )
+    await pause()
+    await recorder.request(client, "GET /chat/unread-count", "GET", f"{API}/unread-count", headers=headers)
+
+
+async def virtual_user(client: httpx.AsyncClient, recorder: Recorder, vu: int, args: argparse.Namespace,
+                       deadline: float) -> None:
+    rng = random.Random(args.seed * 1000 + vu)
+    while time.perf_counter() < deadline:
+        user_id = rng.randint(1, args.users)
+        await session(client, recorder, user_id, args.users, rng, args.think_ms / 1000)
+
+
+# ============================================================================
+# REPORT
+# ============================================================================
+
+def summarize(recorder: Recorder, duration: float) -> Dict[str, dict]:
+    results = {}
+    for endpoint in sorted(recorder.latencies):
+        values = sorted(recorder.latencies[endpoint])
+        results[endpoint] = {
+            "requests": len(values),
+            "errors": recorder.errors[endpoint],
+            "rps": round(len(values) / duration, 1),
+            "p50": round(percentile(values, 0.50), 2),
+            "p95": round(percentile(values, 0.95), 2),
+            "p99": round(percentile(values, 0.99), 2),
+        }
+    return results
+
+
+def print_report(results: Dict[str, dict]) -> None:
+    print(f"{'endpoint':<48}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for endpoint, stats in results.items():
+        print(f"{endpoint:<48}{stats['requests']:>9}{stats['errors']:>8}{stats['rps']:>9.1f}"
+              f"{stats['p50']:>9.1f}{stats['p95']:>9.1f}{stats['p99']:>9.1f}")
+
+
+def regressions(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float,
+                min_delta_ms: float) -> List[str]:
+    """
+    Differences worth failing the run for. Latency must be worse by the
+    tolerance and by min_delta_ms, so sub-millisecond noise never fails it.
+    """
+    problems = []
+    for endpoint, expected in baseline.items():
+        stats = results.get(endpoint)
+        if stats is None:
+            problems.append(f"{endpoint}: not exercised")
+            continue
+        if stats["errors"]:
+            problems.append(f"{endpoint}: {stats['errors']} failed requests")
+        for key in ("p95", "p99"):
+            limit = max(expected[key] * (1 + tolerance), expected[key] + min_delta_ms)
+            if stats[key] > limit:
+                problems.append(f"{endpoint}: {key} {stats[key]:.1f} ms, baseline {expected[key]:.1f} ms")
+        if stats["rps"] < expected["rps"] * (1 - tolerance):
+            problems.append(f"{endpoint}: {stats['rps']:.1f} req/s, baseline {expected['rps']:.1f} req/s")
+    return problems
+
+
+async def main(args: argparse.Namespace) -> int:
+    if args.reset:
+        reset_dataset(args)
+
+    limits = httpx.Limits(max_connections=args.vus, max_keepalive_connections=args.vus)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+        recorder = Recorder()
+        warmup_end = time.perf_counter() + args.warmup
+        deadline = warmup_end + args.duration
+        users = [
+            asyncio.create_task(virtual_user(client, recorder, vu, args, deadline))
+            for vu in range(args.vus)
+        ]
+        await asyncio.sleep(args.warmup)
+        recorder.measuring = True
+        started = time.perf_counter()
+        await asyncio.gather(*users)
+        results = summarize(recorder, time.perf_counter() - started)
+
+    config = {
+        key: getattr(args, key) for key in ("vus", "users", "conversations_per_user", "duration", "think_ms", "seed")
+    }
+    print(f"{args.url}: {args.vus} VUs over {args.users} users, {args.duration:.0f}s (+{args.warmup:.0f}s warm-up)\n")
+    print_report(results)
+
+    if args.save_baseline:
+        missing = [endpoint for endpoint in FLOW_ENDPOINTS if endpoint not in results]
+        if missing:
+            print(f"\nNot saving a baseline without {', '.join(missing)}")
+            return 1
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps({"config": config, "endpoints": results}, indent=2) + "\n")
+        print(f"\nSaved baseline to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create it")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text())
+    if baseline["config"] != config:
+        print(f"\nWarning: baseline was recorded with {baseline['config']}")
+    problems = regressions(results, baseline["endpoints"], args.tolerance, args.min_delta_ms)
+    if problems:
+        print(f"\nREGRESSION against {args.baseline}:")
+        for problem in problems:
+            print(f"  {problem}")
+        return 1
+    print(f"\nWithin {args.tolerance:.0%} of {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--vus", type=int, default=20, help="Concurrent virtual users")
+    parser.add_argument("--users", type=int, default=50, help="Test users to act as (LOCAL_TEST_USERS)")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="Unmeasured seconds before")
+    parser.add_argument("--think-ms", type=float, default=0, help="Mean pause between steps")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--conversations-per-user", type=int, default=4, help="Dataset size (generate_data.py)")
+    parser.add_argument(
+        "--reset", action="store_true",
+        help="Truncate DATABASE_URL's chat tables and load the fixed dataset first (local-test only)"
+    )
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown")
+    parser.add_argument("--min-delta-ms", type=float, default=2, help="Ignore latency changes below this")
+    args = parser.parse_args()
+    if args.save_baseline and not args.reset:
+        parser.error("--save-baseline needs --reset: a baseline is measured on the fixed dataset")
+    sys.exit(asyncio.run(main(args)))
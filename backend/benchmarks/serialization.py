@@ -0,0 +1,200 @@
+"""
+Serialization Microbenchmark
+Default response_model path vs CHAT_FAST_SERIALIZATION vs the compact
+columnar encodings for the list endpoints
+
+All paths run as real FastAPI routes, driven in-process through ASGI so
+only routing and serialization are measured (no network, no database).
+
+Run from backend/:
+    python -m benchmarks.serialization [--rows 100] [--iterations 2000]
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from fastapi import FastAPI
+
+try:
+    # Rows carry asyncpg's UUID type, as they do when loaded from the database
+    from asyncpg.pgproto.pgproto import UUID as RowUUID
+except ImportError:
+    RowUUID = uuid.UUID
+
+from api.models.chat import ConversationsListResponse, MessagesListResponse, UserInfo
+from api.services import compact, serializers
+from api.services.compact import COMPACT_JSON, COMPACT_MSGPACK, render_compact
+from api.services.serializers import (
+    MESSAGE_FIELDS,
+    conversations_page_adapter,
+    message_row,
+    messages_page_adapter,
+    render_page,
+)
+
+
+def make_messages(count: int) -> list:
+    """Message-like rows with the attributes the endpoints read"""
+    conversation_id = RowUUID(str(uuid.uuid4()))
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for i in range(count):
+        created_at = start + timedelta(seconds=i * 37)
+        rows.append(SimpleNamespace(
+            id=RowUUID(str(uuid.uuid4())),
+            conversation_id=conversation_id,
+            sender_id=1 + i % 2,
+            recipient_id=2 - i % 2,
+            content_type="text" if i % 5 else "image",
+            text_content=f"Mensagem de teste número {i} 🌱" if i % 5 else None,
+            media_url=None if i % 5 else f"https://growzone-chat-media.s3.amazonaws.com/chat/1/{i}.jpg",
+            media_thumbnail_url=None,
+            audio_duration=None,
+            reply_to_id=None,
+            created_at=created_at,
+            sent_at=created_at,
+            delivered_at=created_at + timedelta(seconds=1),
+            read_at=created_at + timedelta(seconds=30) if i % 3 else None,
+        ))
+    return rows
+
+
+def make_conversations(count: int) -> list:
+    """Rows shaped like services.inbox.build_inbox_rows output"""
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for i, message in enumerate(make_messages(count)):
+        rows.append({
+            "id": message.conversation_id,
+            "participant1_id": 1,
+            "participant2_id": 100 + i,
+            "created_at": start,
+            "updated_at": message.created_at,
+            "last_message_at": message.created_at,
+            "is_pinned": i % 7 == 0,
+            "is_muted": False,
+            "is_archived": False,
+            "last_message": message_row(message),
+            "other_user": UserInfo(id=100 + i, username=f"grower{i}", name=f"Grower {i}",
+                                   avatar_url=f"https://cdn.growzone.co/avatars/{i}.jpg"),
+            "unread_count": i % 4,
+            "last_read_at": message.created_at,
+            "other_last_read_at": None,
+        })
+    return rows
+
+
+def build_app(messages: list, conversations: list) -> FastAPI:
+    app = FastAPI()
+
+    def messages_page() -> dict:
+        return dict(data=[message_row(msg) for msg in messages], total=None, page=1,
+                    page_size=len(messages), has_more=True, next_cursor="x", prev_cursor="y")
+
+    def conversations_page() -> dict:
+        return dict(data=conversations, total=len(conversations), page=1,
+                    page_size=len(conversations), has_more=False, next_cursor=None)
+
+    @app.get("/default/messages", response_model=MessagesListResponse)
+    async def default_messages():
+        return MessagesListResponse(**messages_page())
+
+    @app.get("/fast/messages")
+    async def fast_messages():
+        return render_page(messages_page_adapter, messages_page())
+
+    @app.get("/default/conversations", response_model=ConversationsListResponse)
+    async def default_conversations():
+        return ConversationsListResponse(**conversations_page())
+
+    @app.get("/fast/conversations")
+    async def fast_conversations():
+        return render_page(conversations_page_adapter, conversations_page())
+
+    def message_rows_page() -> dict:
+        # What get_messages hands to render_compact: the rows themselves
+        return dict(data=messages, total=None, page=1, page_size=len(messages),
+                    has_more=True, next_cursor="x", prev_cursor="y")
+
+    @app.get("/compact-json/messages")
+    async def compact_json_messages():
+        return render_compact(COMPACT_JSON, message_rows_page(), fields=MESSAGE_FIELDS)
+
+    @app.get("/compact-json/conversations")
+    async def compact_json_conversations():
+        return render_compact(COMPACT_JSON, conversations_page())
+
+    if compact.msgpack is not None:
+        @app.get("/compact-msgpack/messages")
+        async def compact_msgpack_messages():
+            return render_compact(COMPACT_MSGPACK, message_rows_page(), fields=MESSAGE_FIELDS)
+
+        @app.get("/compact-msgpack/conversations")
+        async def compact_msgpack_conversations():
+            return render_compact(COMPACT_MSGPACK, conversations_page())
+
+    return app
+
+
+async def call(app: FastAPI, path: str) -> bytes:
+    """One GET through the ASGI interface, returning the body"""
+    body = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "", "headers": [],
+        "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+    }
+    await app(scope, receive, send)
+    return b"".join(body)
+
+
+async def measure(app: FastAPI, path: str, iterations: int) -> float:
+    """Mean microseconds per request"""
+    for _ in range(min(50, iterations)):
+        await call(app, path)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await call(app, path)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+async def main(rows: int, iterations: int) -> None:
+    app = build_app(make_messages(rows), make_conversations(rows))
+
+    encoder = "orjson" if serializers.orjson is not None else "pydantic-core (orjson not installed)"
+    variants = ["fast", "compact-json"]
+    if compact.msgpack is not None:
+        variants.append("compact-msgpack")
+    print(f"{rows} rows per page, {iterations} requests per path, fast path encoder: {encoder}\n")
+    print(f"{'endpoint':<16}{'path':<18}{'µs':>8}{'speedup':>10}{'bytes':>10}{'size':>8}")
+    for name in ("messages", "conversations"):
+        default_body = await call(app, f"/default/{name}")
+        fast_body = await call(app, f"/fast/{name}")
+        default_us = await measure(app, f"/default/{name}", iterations)
+        print(f"{name:<16}{'default':<18}{default_us:>8.0f}{'1.00x':>10}{len(default_body):>10}{'100%':>8}")
+        for variant in variants:
+            body = await call(app, f"/{variant}/{name}")
+            variant_us = await measure(app, f"/{variant}/{name}", iterations)
+            print(f"{'':<16}{variant:<18}{variant_us:>8.0f}{default_us / variant_us:>9.2f}x"
+                  f"{len(body):>10}{len(body) / len(default_body):>8.0%}")
+        print(f"{'':<16}fast path emits the same JSON as default: {default_body == fast_body}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.iterations))
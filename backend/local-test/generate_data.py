@@ -0,0 +1,217 @@
+"""
+Synthetic Chat Dataset for Local Testing
+Bulk-loads users, conversations and messages into the local-test database
+
+Messages per conversation follow a power law (most conversations are short,
+a few are very long), so inbox and scroll queries see realistic skew.
+The same --seed and --end always produce the same rows.
+
+Run (database from docker-compose.yml, same DATABASE_URL as main.py):
+    python3 generate_data.py --users 10000 --conversations-per-user 20 --truncate
+    python3 generate_data.py --help
+
+Users get IDs 1..--users (LOCAL_TEST_USERS for the server and load test).
+"""
+
+import argparse
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterator, List, Tuple
+
+from psycopg2.extras import execute_values
+
+from main import Base, engine
+
+
+WORDS = (
+    "planta rega luz semente flor folha cultivo substrato adubo colheita vaso "
+    "estufa muda broto raiz poda clone germinação irrigação umidade temperatura "
+    "hoje amanhã ontem bom dia obrigado valeu show top beleza quando como onde "
+    "olha isso aqui ficou ótimo ainda não sim talvez semana crescendo rápido 🌱 🌿 🔥"
+).split()
+
+# Characters handed to COPY per read
+COPY_READ_SIZE = 1 << 20
+
+MEDIA_TYPES = (("image", "jpg"), ("image", "jpg"), ("video", "mp4"), ("audio", "m4a"))
+
+
+class RowStream:
+    """File-like object feeding COPY ... FROM STDIN from a row iterator"""
+
+    def __init__(self, rows: Iterator[str]):
+        self._rows = rows
+        self._buffer = ""
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            chunk = "".join(row for _, row in zip(range(1000), self._rows))
+            if not chunk:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _uuid(rng: random.Random) -> uuid.UUID:
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def _field(value) -> str:
+    """COPY text format field"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return str(value)
+
+
+def _line(*values) -> str:
+    return "\t".join(_field(value) for value in values) + "\n"
+
+
+def message_count(rng: random.Random, alpha: float, minimum: int, maximum: int) -> int:
+    """Pareto-distributed count: P(n > x) = (minimum / x) ** alpha"""
+    return max(min(int(minimum / (1.0 - rng.random()) ** (1.0 / alpha)), maximum), 1)
+
+
+# ============================================================================
+# GENERATION
+# ============================================================================
+
+Conversation = Tuple[uuid.UUID, int, int, datetime, datetime, int]
+
+
+def build_conversations(args: argparse.Namespace, rng: random.Random) -> List[Conversation]:
+    """(id, participant1_id, participant2_id, created_at, last_message_at, message_count)"""
+    end = args.end
+    span = args.days * 86400
+    total = args.users * args.conversations_per_user // 2
+    pairs = set()
+    conversations = []
+    while len(conversations) < total and len(pairs) < args.users * (args.users - 1) // 2:
+        a, b = rng.randint(1, args.users), rng.randint(1, args.users)
+        pair = (min(a, b), max(a, b))
+        if a == b or pair in pairs:
+            continue
+        pairs.add(pair)
+        created_at = end - timedelta(seconds=rng.random() * span)
+        last_message_at = created_at + (end - created_at) * rng.random()
+        count = message_count(rng, args.alpha, args.min_messages, args.max_messages)
+        conversations.append((_uuid(rng), pair[0], pair[1], created_at, last_message_at, count))
+    return conversations
+
+
+def conversation_rows(conversations: List[Conversation]) -> Iterator[str]:
+    for conversation_id, participant1_id, participant2_id, created_at, last_message_at, _ in conversations:
+        yield _line(conversation_id, participant1_id, participant2_id, created_at, last_message_at, last_message_at)
+
+
+def message_rows(conversations: List[Conversation], args: argparse.Namespace) -> Iterator[str]:
+    for index, (conversation_id, participant1_id, participant2_id, created_at, last_message_at, count) \
+            in enumerate(conversations):
+        # Own generator per conversation: rows do not depend on batch boundaries
+        rng = random.Random(args.seed * 1_000_003 + index)
+        span = (last_message_at - created_at).total_seconds()
+        offsets = sorted(rng.random() * span for _ in range(count - 1)) + [span]
+
+        # Unread messages are the newest of each conversation
+        unread = int(count * args.unread_ratio + rng.random())
+        for position, offset in enumerate(offsets):
+            sender_id, recipient_id = (participant1_id, participant2_id) if rng.random() < 0.5 \
+                else (participant2_id, participant1_id)
+            message_id = _uuid(rng)
+            sent_at = created_at + timedelta(seconds=offset)
+            delivered_at = sent_at + timedelta(seconds=rng.random() * 5)
+            read_at = None if position >= count - unread else delivered_at + timedelta(seconds=rng.random() * 3600)
+
+            text_content = media_url = audio_duration = None
+            if rng.random() < args.media_ratio:
+                content_type, extension = rng.choice(MEDIA_TYPES)
+                media_url = f"https://growzone-chat-media.s3.amazonaws.com/chat/{sender_id}/{message_id}.{extension}"
+                if content_type == "audio":
+                    audio_duration = rng.randint(1, 120)
+            else:
+                content_type = "text"
+                text_content = " ".join(rng.choices(WORDS, k=rng.randint(1, 20)))
+
+            yield _line(
+                message_id, conversation_id, sender_id, recipient_id, content_type, text_content,
+                media_url, audio_duration, sent_at, sent_at, delivered_at, read_at,
+            )
+
+
+# ============================================================================
+# LOADING
+# ============================================================================
+
+def load(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    Base.metadata.create_all(bind=engine)
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if args.truncate:
+            cursor.execute("TRUNCATE messages, conversations CASCADE")
+
+        started = time.perf_counter()
+        execute_values(
+            cursor,
+            "INSERT INTO users (id, username, email, name) VALUES %s ON CONFLICT (id) DO NOTHING",
+            (
+                (i, f"testuser{i}", f"test{i}@growzone.co", f"Test User {i}")
+                for i in range(1, args.users + 1)
+            ),
+            page_size=5000,
+        )
+        cursor.execute("SELECT setval(pg_get_serial_sequence('users', 'id'), (SELECT MAX(id) FROM users))")
+
+        conversations = build_conversations(args, rng)
+        cursor.copy_expert(
+            "COPY conversations (id, participant1_id, participant2_id, created_at, updated_at, last_message_at) "
+            "FROM STDIN",
+            RowStream(conversation_rows(conversations)),
+            size=COPY_READ_SIZE,
+        )
+        total = sum(conversation[-1] for conversation in conversations)
+        print(f"{args.users} users, {len(conversations)} conversations, loading {total} messages...")
+
+        cursor.copy_expert(
+            "COPY messages (id, conversation_id, sender_id, recipient_id, content_type, text_content, "
+            "media_url, audio_duration, created_at, sent_at, delivered_at, read_at) FROM STDIN",
+            RowStream(message_rows(conversations, args)),
+            size=COPY_READ_SIZE,
+        )
+        connection.commit()
+
+        cursor.execute("ANALYZE users, conversations, messages")
+        connection.commit()
+        elapsed = time.perf_counter() - started
+        longest = max((conversation[-1] for conversation in conversations), default=0)
+        print(f"✅ Loaded in {elapsed:.1f}s ({total / elapsed:,.0f} messages/s), longest conversation {longest}")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--conversations-per-user", type=int, default=10, help="Average, each counts for both users")
+    parser.add_argument("--alpha", type=float, default=1.2, help="Power-law exponent of messages per conversation")
+    parser.add_argument("--min-messages", type=int, default=1)
+    parser.add_argument("--max-messages", type=int, default=20000)
+    parser.add_argument("--media-ratio", type=float, default=0.15, help="Share of image/video/audio messages")
+    parser.add_argument("--unread-ratio", type=float, default=0.05, help="Share of messages left unread")
+    parser.add_argument("--days", type=int, default=365, help="History length")
+    # Naive UTC, like the datetime.utcnow() defaults in main.py
+    parser.add_argument(
+        "--end", type=datetime.fromisoformat, default=datetime(2025, 1, 1), help="Newest timestamp (UTC)"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--truncate", action="store_true", help="Delete conversations and messages first")
+    load(parser.parse_args())
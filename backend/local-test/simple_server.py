@@ -9,8 +9,19 @@ from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
 import uuid
+import os
+import sys
+
+# Backend package (../api) for the shared metrics
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from api.routers.metrics import router as metrics_router
+from api.services.metrics import MetricsRoute
 
 app = FastAPI(title="Growzone Chat Simple Test")
+# Latency histograms for every route below, served at GET /metrics
+app.router.route_class = MetricsRoute
+app.include_router(metrics_router)
 
 # CORS
 app.add_middleware(
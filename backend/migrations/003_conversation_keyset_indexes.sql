@@ -0,0 +1,31 @@
+-- ============================================================================
+-- GROWZONE CHAT - Conversation keyset pagination indexes
+-- Database: PostgreSQL 14+
+-- Description: Add id as tie-breaker so (updated_at, id) cursors are index-only ordered
+-- ============================================================================
+
+-- Index: Keyset pagination of participant1's conversations
+CREATE INDEX IF NOT EXISTS idx_conversation_p1_updated_id
+ON conversations(participant1_id, updated_at DESC, id DESC)
+WHERE participant1_deleted_at IS NULL;
+
+-- Index: Keyset pagination of participant2's conversations
+CREATE INDEX IF NOT EXISTS idx_conversation_p2_updated_id
+ON conversations(participant2_id, updated_at DESC, id DESC)
+WHERE participant2_deleted_at IS NULL;
+
+-- The new indexes cover every query the old ones served
+DROP INDEX IF EXISTS idx_conversation_p1_updated;
+DROP INDEX IF EXISTS idx_conversation_p2_updated;
+
+-- ============================================================================
+-- VERIFICATION QUERIES (Run after migration to verify)
+-- ============================================================================
+
+SELECT indexname FROM pg_indexes
+WHERE tablename = 'conversations'
+ORDER BY indexname;
+
+-- ============================================================================
+-- END OF MIGRATION
+-- ============================================================================
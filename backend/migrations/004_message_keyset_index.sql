@@ -0,0 +1,24 @@
+-- ============================================================================
+-- GROWZONE CHAT - Message keyset pagination index
+-- Database: PostgreSQL 14+
+-- Description: Add id as tie-breaker so (created_at, id) cursors are index ordered
+-- ============================================================================
+
+-- Index: Get messages for a conversation (most recent first, stable on ties)
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_created_id
+ON messages(conversation_id, created_at DESC, id DESC);
+
+-- The new index covers every query the old one served
+DROP INDEX IF EXISTS idx_messages_conversation_created;
+
+-- ============================================================================
+-- VERIFICATION QUERIES (Run after migration to verify)
+-- ============================================================================
+
+SELECT indexname FROM pg_indexes
+WHERE tablename = 'messages'
+ORDER BY indexname;
+
+-- ============================================================================
+-- END OF MIGRATION
+-- ============================================================================
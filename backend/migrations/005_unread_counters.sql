@@ -0,0 +1,113 @@
+-- ============================================================================
+-- GROWZONE CHAT - Denormalized unread counters
+-- Database: PostgreSQL 14+
+-- Description: Per-participant and per-user unread counters maintained on write
+-- ============================================================================
+
+-- ============================================================================
+-- COLUMNS: Per-participant unread counters on conversations
+-- ============================================================================
+ALTER TABLE conversations
+    ADD COLUMN IF NOT EXISTS participant1_unread_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS participant2_unread_count INTEGER NOT NULL DEFAULT 0;
+
+COMMENT ON COLUMN conversations.participant1_unread_count IS 'Unread messages for participant1 (maintained by the API)';
+COMMENT ON COLUMN conversations.participant2_unread_count IS 'Unread messages for participant2 (maintained by the API)';
+
+-- ============================================================================
+-- TABLE: user_unread_counters
+-- Per-user totals backing GET /chat/unread-count
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS user_unread_counters (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    total_unread INTEGER NOT NULL DEFAULT 0 CHECK (total_unread >= 0),
+    conversations_with_unread INTEGER NOT NULL DEFAULT 0 CHECK (conversations_with_unread >= 0),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+COMMENT ON TABLE user_unread_counters IS 'Unread badge totals per user (sum of conversation counters)';
+
+-- ============================================================================
+-- FUNCTION: Rebuild counters from messages
+-- A message counts as unread for its recipient while read_at and
+-- recipient_deleted_at are NULL and the recipient has not deleted the conversation
+-- ============================================================================
+CREATE OR REPLACE FUNCTION reconcile_unread_counters(
+    p_user_id INTEGER DEFAULT NULL
+) RETURNS INTEGER AS $$
+DECLARE
+    fixed INTEGER;
+BEGIN
+    WITH actual AS (
+        SELECT
+            c.id,
+            COUNT(m.id) FILTER (
+                WHERE m.recipient_id = c.participant1_id AND c.participant1_deleted_at IS NULL
+            ) AS p1_unread,
+            COUNT(m.id) FILTER (
+                WHERE m.recipient_id = c.participant2_id AND c.participant2_deleted_at IS NULL
+            ) AS p2_unread
+        FROM conversations c
+        LEFT JOIN messages m
+            ON m.conversation_id = c.id
+           AND m.read_at IS NULL
+           AND m.recipient_deleted_at IS NULL
+        WHERE p_user_id IS NULL OR p_user_id IN (c.participant1_id, c.participant2_id)
+        GROUP BY c.id
+    )
+    UPDATE conversations c
+    SET
+        participant1_unread_count = CASE WHEN p_user_id IS NULL OR c.participant1_id = p_user_id
+            THEN a.p1_unread ELSE c.participant1_unread_count END,
+        participant2_unread_count = CASE WHEN p_user_id IS NULL OR c.participant2_id = p_user_id
+            THEN a.p2_unread ELSE c.participant2_unread_count END
+    FROM actual a
+    WHERE c.id = a.id
+      AND (
+          ((p_user_id IS NULL OR c.participant1_id = p_user_id) AND c.participant1_unread_count <> a.p1_unread)
+          OR ((p_user_id IS NULL OR c.participant2_id = p_user_id) AND c.participant2_unread_count <> a.p2_unread)
+      );
+
+    GET DIAGNOSTICS fixed = ROW_COUNT;
+
+    -- Rebuild user totals from the (now correct) conversation counters
+    INSERT INTO user_unread_counters (user_id, total_unread, conversations_with_unread, updated_at)
+    SELECT
+        sides.user_id,
+        SUM(sides.unread),
+        COUNT(*) FILTER (WHERE sides.unread > 0),
+        NOW()
+    FROM (
+        SELECT participant1_id AS user_id, participant1_unread_count AS unread FROM conversations
+        UNION ALL
+        SELECT participant2_id AS user_id, participant2_unread_count AS unread FROM conversations
+    ) sides
+    WHERE p_user_id IS NULL OR sides.user_id = p_user_id
+    GROUP BY sides.user_id
+    ON CONFLICT (user_id) DO UPDATE SET
+        total_unread = EXCLUDED.total_unread,
+        conversations_with_unread = EXCLUDED.conversations_with_unread,
+        updated_at = NOW();
+
+    RETURN fixed;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION reconcile_unread_counters IS 'Recomputes unread counters from messages (all users, or one user)';
+
+-- Backfill counters for existing data
+SELECT reconcile_unread_counters();
+
+-- ============================================================================
+-- VERIFICATION QUERIES (Run after migration to verify)
+-- ============================================================================
+
+SELECT column_name FROM information_schema.columns
+WHERE table_name = 'conversations' AND column_name LIKE '%unread_count';
+
+SELECT routine_name FROM information_schema.routines
+WHERE routine_schema = 'public' AND routine_name = 'reconcile_unread_counters';
+
+-- ============================================================================
+-- END OF MIGRATION
+-- ============================================================================
@@ -0,0 +1,46 @@
+-- ============================================================================
+-- GROWZONE CHAT - Media variants
+-- Database: PostgreSQL 14+
+-- Description: Thumbnails, WebP size variants and video posters produced in the background
+-- ============================================================================
+
+-- ============================================================================
+-- TABLE: media_variants
+-- One row per uploaded media object, filled by the media processing pipeline
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS media_variants (
+    media_url TEXT PRIMARY KEY,
+    content_type VARCHAR(100) NOT NULL,
+
+    -- Processing state
+    status VARCHAR(20) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'ready', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+
+    -- Results
+    thumbnail_url TEXT,
+    poster_url TEXT,
+    variants JSONB NOT NULL DEFAULT '{}'::jsonb, -- {"320": "https://.../x.w320.webp", ...}
+
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+COMMENT ON TABLE media_variants IS 'Derived media (thumbnails, WebP variants, video posters) per uploaded object';
+COMMENT ON COLUMN media_variants.variants IS 'WebP variants keyed by width in pixels';
+
+-- Index: Fill media_thumbnail_url of messages once their media is processed
+CREATE INDEX IF NOT EXISTS idx_messages_media_url_no_thumbnail
+ON messages(media_url)
+WHERE media_url IS NOT NULL AND media_thumbnail_url IS NULL;
+
+-- ============================================================================
+-- VERIFICATION QUERIES (Run after migration to verify)
+-- ============================================================================
+
+SELECT table_name FROM information_schema.tables
+WHERE table_schema = 'public' AND table_name = 'media_variants';
+
+-- ============================================================================
+-- END OF MIGRATION
+-- ============================================================================
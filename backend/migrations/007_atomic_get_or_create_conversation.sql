@@ -0,0 +1,58 @@
+-- ============================================================================
+-- GROWZONE CHAT - Atomic get_or_create_conversation
+-- Database: PostgreSQL 14+
+-- Description: Make get_or_create_conversation safe under concurrent first messages
+-- ============================================================================
+
+-- ============================================================================
+-- FUNCTION: Get or create conversation between two users
+-- The previous version did SELECT then INSERT, so two first messages sent at
+-- the same time could both insert and one failed on idx_conversation_participants.
+-- ON CONFLICT DO NOTHING waits for the competing insert and lets us read it back.
+-- ============================================================================
+CREATE OR REPLACE FUNCTION get_or_create_conversation(
+    user1_id INTEGER,
+    user2_id INTEGER
+) RETURNS UUID AS $$
+DECLARE
+    conversation_id UUID;
+    p1_id INTEGER := LEAST(user1_id, user2_id);
+    p2_id INTEGER := GREATEST(user1_id, user2_id);
+BEGIN
+    -- Existing conversations are the common case: plain index lookup, no write
+    SELECT id INTO conversation_id
+    FROM conversations
+    WHERE participant1_id = p1_id AND participant2_id = p2_id;
+
+    IF conversation_id IS NOT NULL THEN
+        RETURN conversation_id;
+    END IF;
+
+    INSERT INTO conversations (participant1_id, participant2_id)
+    VALUES (p1_id, p2_id)
+    ON CONFLICT (participant1_id, participant2_id) DO NOTHING
+    RETURNING id INTO conversation_id;
+
+    -- Lost the race: the other transaction committed the row first
+    IF conversation_id IS NULL THEN
+        SELECT id INTO conversation_id
+        FROM conversations
+        WHERE participant1_id = p1_id AND participant2_id = p2_id;
+    END IF;
+
+    RETURN conversation_id;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION get_or_create_conversation IS 'Gets existing or creates new conversation between two users (safe under concurrent calls)';
+
+-- ============================================================================
+-- VERIFICATION QUERIES (Run after migration to verify)
+-- ============================================================================
+
+SELECT routine_name FROM information_schema.routines
+WHERE routine_schema = 'public' AND routine_name = 'get_or_create_conversation';
+
+-- ============================================================================
+-- END OF MIGRATION
+-- ============================================================================
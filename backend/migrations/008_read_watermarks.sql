@@ -0,0 +1,70 @@
+-- ============================================================================
+-- GROWZONE CHAT - Read watermarks
+-- Database: PostgreSQL 14+
+-- Description: Per-participant "read up to" timestamps on conversations
+-- ============================================================================
+
+-- ============================================================================
+-- COLUMNS: Read watermarks
+-- Every message a participant received at or before their watermark is read.
+-- Senders compare their messages' created_at against the other participant's
+-- watermark instead of looking at read_at row by row.
+-- ============================================================================
+ALTER TABLE conversations
+    ADD COLUMN IF NOT EXISTS participant1_last_read_at TIMESTAMP WITH TIME ZONE,
+    ADD COLUMN IF NOT EXISTS participant2_last_read_at TIMESTAMP WITH TIME ZONE;
+
+COMMENT ON COLUMN conversations.participant1_last_read_at IS 'participant1 has read everything received up to this time';
+COMMENT ON COLUMN conversations.participant2_last_read_at IS 'participant2 has read everything received up to this time';
+
+-- ============================================================================
+-- BACKFILL: Watermark = newest received message with no unread message before it
+-- ============================================================================
+WITH watermarks AS (
+    SELECT
+        c.id,
+        (
+            SELECT MAX(m.created_at) FROM messages m
+            WHERE m.conversation_id = c.id
+              AND m.recipient_id = c.participant1_id
+              AND m.read_at IS NOT NULL
+              AND m.created_at < COALESCE((
+                  SELECT MIN(u.created_at) FROM messages u
+                  WHERE u.conversation_id = c.id
+                    AND u.recipient_id = c.participant1_id
+                    AND u.read_at IS NULL
+              ), 'infinity')
+        ) AS p1_read_up_to,
+        (
+            SELECT MAX(m.created_at) FROM messages m
+            WHERE m.conversation_id = c.id
+              AND m.recipient_id = c.participant2_id
+              AND m.read_at IS NOT NULL
+              AND m.created_at < COALESCE((
+                  SELECT MIN(u.created_at) FROM messages u
+                  WHERE u.conversation_id = c.id
+                    AND u.recipient_id = c.participant2_id
+                    AND u.read_at IS NULL
+              ), 'infinity')
+        ) AS p2_read_up_to
+    FROM conversations c
+)
+UPDATE conversations c
+SET
+    participant1_last_read_at = w.p1_read_up_to,
+    participant2_last_read_at = w.p2_read_up_to
+FROM watermarks w
+WHERE c.id = w.id
+  AND c.participant1_last_read_at IS NULL
+  AND c.participant2_last_read_at IS NULL;
+
+-- ============================================================================
+-- VERIFICATION QUERIES (Run after migration to verify)
+-- ============================================================================
+
+SELECT column_name FROM information_schema.columns
+WHERE table_name = 'conversations' AND column_name LIKE '%last_read_at';
+
+-- ============================================================================
+-- END OF MIGRATION
+-- ============================================================================
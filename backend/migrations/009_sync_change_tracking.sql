@@ -0,0 +1,71 @@
+-- ============================================================================
+-- GROWZONE CHAT - Change tracking for delta sync
+-- Database: PostgreSQL 14+
+-- Description: changed_at on messages and conversations backing GET /chat/sync
+-- ============================================================================
+
+-- ============================================================================
+-- COLUMNS: Last change time of every row
+-- Existing rows get the migration time; clients start syncing from a fresh token.
+-- ============================================================================
+ALTER TABLE messages
+    ADD COLUMN IF NOT EXISTS changed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW();
+
+ALTER TABLE conversations
+    ADD COLUMN IF NOT EXISTS changed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW();
+
+COMMENT ON COLUMN messages.changed_at IS 'Last insert/update of the row (maintained by trigger, used by delta sync)';
+COMMENT ON COLUMN conversations.changed_at IS 'Last insert/update of the row (maintained by trigger, used by delta sync)';
+
+-- ============================================================================
+-- TRIGGER: Stamp changed_at on every write
+-- clock_timestamp() rather than NOW() keeps the stamp close to commit time.
+-- ============================================================================
+CREATE OR REPLACE FUNCTION touch_changed_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.changed_at = clock_timestamp();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION touch_changed_at() IS 'Sets changed_at on insert and update (delta sync)';
+
+DROP TRIGGER IF EXISTS trigger_messages_changed_at ON messages;
+CREATE TRIGGER trigger_messages_changed_at
+BEFORE INSERT OR UPDATE ON messages
+FOR EACH ROW
+EXECUTE FUNCTION touch_changed_at();
+
+DROP TRIGGER IF EXISTS trigger_conversations_changed_at ON conversations;
+CREATE TRIGGER trigger_conversations_changed_at
+BEFORE INSERT OR UPDATE ON conversations
+FOR EACH ROW
+EXECUTE FUNCTION touch_changed_at();
+
+-- ============================================================================
+-- INDEXES: Per-user change feeds
+-- Each side of a row is its own range scan, like the inbox keyset indexes
+-- ============================================================================
+CREATE INDEX IF NOT EXISTS idx_messages_sender_changed
+ON messages(sender_id, changed_at, id);
+
+CREATE INDEX IF NOT EXISTS idx_messages_recipient_changed
+ON messages(recipient_id, changed_at, id);
+
+CREATE INDEX IF NOT EXISTS idx_conversation_p1_changed
+ON conversations(participant1_id, changed_at, id);
+
+CREATE INDEX IF NOT EXISTS idx_conversation_p2_changed
+ON conversations(participant2_id, changed_at, id);
+
+-- ============================================================================
+-- VERIFICATION QUERIES (Run after migration to verify)
+-- ============================================================================
+
+SELECT indexname FROM pg_indexes
+WHERE tablename IN ('messages', 'conversations') AND indexname LIKE '%changed';
+
+-- ============================================================================
+-- END OF MIGRATION
+-- ============================================================================
@@ -0,0 +1,58 @@
+-- ============================================================================
+-- GROWZONE CHAT - Full-text search over messages
+-- Database: PostgreSQL 14+
+-- Description: Portuguese tsvector column and GIN index backing GET /chat/search
+-- ============================================================================
+
+-- ============================================================================
+-- TEXT SEARCH CONFIGURATION: Portuguese stemming, accent-insensitive
+-- "nao" finds "não" when the unaccent extension is available; managed
+-- databases that do not allow it get plain Portuguese stemming.
+-- ============================================================================
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'chat_portuguese') THEN
+        CREATE TEXT SEARCH CONFIGURATION chat_portuguese (COPY = portuguese);
+        BEGIN
+            CREATE EXTENSION IF NOT EXISTS unaccent;
+            ALTER TEXT SEARCH CONFIGURATION chat_portuguese
+                ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem;
+        EXCEPTION WHEN OTHERS THEN
+            RAISE NOTICE 'unaccent is not available, chat search will be accent-sensitive';
+        END;
+    END IF;
+END $$;
+
+COMMENT ON TEXT SEARCH CONFIGURATION chat_portuguese IS 'Portuguese stemming (+ unaccent when available) for chat search';
+
+-- ============================================================================
+-- COLUMN: Search document of every message
+-- Generated, so it can never drift from text_content. Adding it rewrites the
+-- table once (no triggers fire, changed_at is untouched).
+-- ============================================================================
+ALTER TABLE messages
+    ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+    GENERATED ALWAYS AS (to_tsvector('chat_portuguese'::regconfig, COALESCE(text_content, ''))) STORED;
+
+COMMENT ON COLUMN messages.search_vector IS 'Full-text search document of text_content (chat_portuguese)';
+
+-- ============================================================================
+-- INDEX: Term lookup
+-- Combined with the per-user filter through the sender / recipient indexes,
+-- or with idx_messages_conversation_created_id when scoped to one conversation
+-- ============================================================================
+CREATE INDEX IF NOT EXISTS idx_messages_search
+ON messages USING GIN (search_vector);
+
+-- ============================================================================
+-- VERIFICATION QUERIES (Run after migration to verify)
+-- ============================================================================
+
+SELECT to_tsvector('chat_portuguese', 'As plantas estão florindo, não regue demais');
+
+SELECT indexname FROM pg_indexes
+WHERE tablename = 'messages' AND indexname = 'idx_messages_search';
+
+-- ============================================================================
+-- END OF MIGRATION
+-- ============================================================================
@@ -0,0 +1,298 @@
+-- ============================================================================
+-- GROWZONE CHAT - Monthly partitions for messages
+-- Database: PostgreSQL 14+
+-- Description: Range-partitions messages on created_at (one partition per UTC
+-- month) so old months can be detached and archived instead of growing one heap
+-- ============================================================================
+--
+-- The copy runs in one transaction and holds an exclusive lock on messages
+-- for its whole duration: run it in a maintenance window. The old table is
+-- kept as messages_unpartitioned until you drop it (see the end of the file).
+--
+-- Changes for the application:
+--   - The primary key becomes (id, created_at): every unique index of a
+--     partitioned table must include the partition key. ids are random UUIDs,
+--     so id stays unique in practice and remains the ORM identity.
+--   - reply_to_id loses its foreign key (a foreign key to a partitioned table
+--     needs the whole primary key). Messages are only soft-deleted, and replies
+--     to messages in archived partitions simply no longer resolve.
+--   - created_at is NOT NULL.
+--   - Queries get partition pruning from plain created_at comparisons; a
+--     (created_at, id) row comparison alone does not prune.
+
+-- ============================================================================
+-- FUNCTION: Create the partition of one month
+-- Bounds are UTC month starts. Fails if the default partition already holds
+-- rows of that month; move them out first.
+-- ============================================================================
+CREATE OR REPLACE FUNCTION create_message_partition(p_month DATE)
+RETURNS TEXT AS $$
+DECLARE
+    month_start DATE := date_trunc('month', p_month)::DATE;
+    partition_name TEXT := 'messages_p' || to_char(p_month, 'YYYY_MM');
+BEGIN
+    -- Serializes concurrent runs of the partition tooling
+    PERFORM pg_advisory_xact_lock(hashtext('create_message_partition'));
+
+    IF to_regclass(partition_name) IS NULL THEN
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+            partition_name,
+            month_start::TIMESTAMP AT TIME ZONE 'UTC',
+            (month_start + INTERVAL '1 month')::TIMESTAMP AT TIME ZONE 'UTC'
+        );
+    END IF;
+
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION create_message_partition(DATE) IS 'Creates messages_pYYYY_MM for the month of p_month (no-op if it exists)';
+
+-- ============================================================================
+-- FUNCTION: Keep partitions ahead of the clock
+-- Run daily or monthly (scripts/message_partitions.py ensure). Rows of a month
+-- without a partition land in messages_default instead of failing.
+-- ============================================================================
+CREATE OR REPLACE FUNCTION ensure_message_partitions(p_months_ahead INTEGER DEFAULT 3)
+RETURNS INTEGER AS $$
+DECLARE
+    this_month DATE := date_trunc('month', NOW() AT TIME ZONE 'UTC')::DATE;
+    created INTEGER := 0;
+    i INTEGER;
+BEGIN
+    FOR i IN 0..p_months_ahead LOOP
+        IF to_regclass('messages_p' || to_char(this_month + make_interval(months => i), 'YYYY_MM')) IS NULL THEN
+            PERFORM create_message_partition((this_month + make_interval(months => i))::DATE);
+            created := created + 1;
+        END IF;
+    END LOOP;
+
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION ensure_message_partitions(INTEGER) IS 'Creates missing monthly partitions from the current month to p_months_ahead months ahead';
+
+-- ============================================================================
+-- FUNCTION: Detach old months
+-- Detached partitions stay as plain tables (cold data) until archived and
+-- dropped. Run reconcile_unread_counters() afterwards: unread messages in
+-- them no longer exist for the API.
+-- ============================================================================
+CREATE OR REPLACE FUNCTION detach_message_partitions(p_older_than TIMESTAMPTZ)
+RETURNS SETOF TEXT AS $$
+DECLARE
+    part RECORD;
+BEGIN
+    FOR part IN
+        SELECT child.relname
+        FROM pg_inherits inh
+        JOIN pg_class child ON child.oid = inh.inhrelid
+        WHERE inh.inhparent = 'messages'::regclass
+          AND child.relname ~ '^messages_p[0-9]{4}_[0-9]{2}$'
+        ORDER BY child.relname
+    LOOP
+        -- Only whole months that ended before p_older_than
+        IF (to_date(substr(part.relname, 11), 'YYYY_MM') + INTERVAL '1 month')::TIMESTAMP AT TIME ZONE 'UTC'
+                <= p_older_than THEN
+            EXECUTE format('ALTER TABLE messages DETACH PARTITION %I', part.relname);
+            RETURN NEXT part.relname;
+        END IF;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION detach_message_partitions(TIMESTAMPTZ) IS 'Detaches monthly message partitions that ended before p_older_than, returns their names';
+
+BEGIN;
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'messages'::regclass) THEN
+        RAISE EXCEPTION 'messages is already partitioned';
+    END IF;
+END $$;
+
+-- ============================================================================
+-- STEP 1: Move the current table aside
+-- Its indexes are renamed so the partitioned table can reuse their names;
+-- its triggers are dropped so nothing writes through it anymore
+-- ============================================================================
+ALTER TABLE messages RENAME TO messages_unpartitioned;
+
+DO $$
+DECLARE
+    idx RECORD;
+BEGIN
+    FOR idx IN
+        SELECT indexname FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = 'messages_unpartitioned'
+    LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', idx.indexname, left(idx.indexname, 59) || '_old');
+    END LOOP;
+END $$;
+
+DROP TRIGGER IF EXISTS trigger_update_conversation_timestamp ON messages_unpartitioned;
+DROP TRIGGER IF EXISTS trigger_messages_changed_at ON messages_unpartitioned;
+
+-- ============================================================================
+-- STEP 2: Partitioned table
+-- Same columns and constraints as before (001, 009, 010)
+-- ============================================================================
+CREATE TABLE messages (
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
+    conversation_id UUID NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+
+    -- Sender and recipient
+    sender_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    recipient_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+
+    -- Content type and data
+    content_type VARCHAR(20) NOT NULL CHECK (content_type IN ('text', 'image', 'video', 'audio')),
+    text_content TEXT,
+    media_url TEXT,
+    media_thumbnail_url TEXT,
+    audio_duration INTEGER, -- Duration in seconds (for audio messages)
+
+    -- Reply feature (optional, no foreign key: see the header)
+    reply_to_id UUID,
+
+    -- Status tracking
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    sent_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    delivered_at TIMESTAMP WITH TIME ZONE,
+    read_at TIMESTAMP WITH TIME ZONE,
+
+    -- Soft delete (per user)
+    sender_deleted_at TIMESTAMP WITH TIME ZONE,
+    recipient_deleted_at TIMESTAMP WITH TIME ZONE,
+
+    -- Delta sync and search
+    changed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    search_vector TSVECTOR
+        GENERATED ALWAYS AS (to_tsvector('chat_portuguese'::regconfig, COALESCE(text_content, ''))) STORED,
+
+    PRIMARY KEY (id, created_at),
+
+    -- Ensure content is valid based on type
+    CONSTRAINT valid_content CHECK (
+        (content_type = 'text' AND text_content IS NOT NULL) OR
+        (content_type != 'text' AND media_url IS NOT NULL)
+    )
+) PARTITION BY RANGE (created_at);
+
+COMMENT ON TABLE messages IS 'All messages (text, image, video, audio), partitioned by month of created_at';
+COMMENT ON COLUMN messages.content_type IS 'Type: text, image, video, audio';
+COMMENT ON COLUMN messages.reply_to_id IS 'Optional reference to replied message';
+COMMENT ON COLUMN messages.audio_duration IS 'Duration in seconds for audio messages';
+COMMENT ON COLUMN messages.changed_at IS 'Last insert/update of the row (maintained by trigger, used by delta sync)';
+COMMENT ON COLUMN messages.search_vector IS 'Full-text search document of text_content (chat_portuguese)';
+
+-- Safety net for months without a partition; should stay empty
+CREATE TABLE messages_default PARTITION OF messages DEFAULT;
+
+-- One partition per month of existing data, plus the months ahead
+DO $$
+DECLARE
+    month_start DATE;
+BEGIN
+    SELECT date_trunc('month', MIN(created_at) AT TIME ZONE 'UTC')::DATE
+    INTO month_start
+    FROM messages_unpartitioned;
+
+    WHILE month_start IS NOT NULL AND month_start < date_trunc('month', NOW() AT TIME ZONE 'UTC') LOOP
+        PERFORM create_message_partition(month_start);
+        month_start := (month_start + INTERVAL '1 month')::DATE;
+    END LOOP;
+
+    PERFORM ensure_message_partitions(3);
+END $$;
+
+-- ============================================================================
+-- STEP 3: Copy the data
+-- Before the triggers exist, so changed_at and conversations are left as they are
+-- ============================================================================
+INSERT INTO messages (
+    id, conversation_id, sender_id, recipient_id,
+    content_type, text_content, media_url, media_thumbnail_url, audio_duration,
+    reply_to_id, created_at, sent_at, delivered_at, read_at,
+    sender_deleted_at, recipient_deleted_at, changed_at
+)
+SELECT
+    id, conversation_id, sender_id, recipient_id,
+    content_type, text_content, media_url, media_thumbnail_url, audio_duration,
+    reply_to_id, COALESCE(created_at, sent_at, changed_at), sent_at, delivered_at, read_at,
+    sender_deleted_at, recipient_deleted_at, changed_at
+FROM messages_unpartitioned;
+
+-- ============================================================================
+-- STEP 4: Indexes (created on every partition, present and future)
+-- Same definitions as 001, 004, 006, 009 and 010
+-- ============================================================================
+CREATE INDEX idx_messages_conversation_created_id
+ON messages(conversation_id, created_at DESC, id DESC);
+
+CREATE INDEX idx_messages_sender
+ON messages(sender_id, created_at DESC);
+
+CREATE INDEX idx_messages_recipient_unread
+ON messages(recipient_id, read_at)
+WHERE read_at IS NULL AND recipient_deleted_at IS NULL;
+
+CREATE INDEX idx_messages_conversation_unread
+ON messages(conversation_id, read_at)
+WHERE read_at IS NULL;
+
+CREATE INDEX idx_messages_media_url_no_thumbnail
+ON messages(media_url)
+WHERE media_url IS NOT NULL AND media_thumbnail_url IS NULL;
+
+CREATE INDEX idx_messages_sender_changed
+ON messages(sender_id, changed_at, id);
+
+CREATE INDEX idx_messages_recipient_changed
+ON messages(recipient_id, changed_at, id);
+
+CREATE INDEX idx_messages_search
+ON messages USING GIN (search_vector);
+
+-- ============================================================================
+-- STEP 5: Triggers (cloned to every partition)
+-- ============================================================================
+CREATE TRIGGER trigger_update_conversation_timestamp
+AFTER INSERT ON messages
+FOR EACH ROW
+EXECUTE FUNCTION update_conversation_timestamp();
+
+CREATE TRIGGER trigger_messages_changed_at
+BEFORE INSERT OR UPDATE ON messages
+FOR EACH ROW
+EXECUTE FUNCTION touch_changed_at();
+
+COMMIT;
+
+ANALYZE messages;
+
+-- ============================================================================
+-- VERIFICATION QUERIES (Run after migration to verify)
+-- ============================================================================
+
+-- Same number of rows in both tables
+SELECT
+    (SELECT COUNT(*) FROM messages) AS partitioned,
+    (SELECT COUNT(*) FROM messages_unpartitioned) AS unpartitioned;
+
+-- Partitions and their sizes (messages_default should be empty)
+SELECT child.relname, pg_size_pretty(pg_total_relation_size(child.oid))
+FROM pg_inherits inh
+JOIN pg_class child ON child.oid = inh.inhrelid
+WHERE inh.inhparent = 'messages'::regclass
+ORDER BY child.relname;
+
+-- Once verified, drop the old table:
+-- DROP TABLE messages_unpartitioned;
+
+-- ============================================================================
+-- END OF MIGRATION
+-- ============================================================================
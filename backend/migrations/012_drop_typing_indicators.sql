@@ -0,0 +1,23 @@
+-- ============================================================================
+-- GROWZONE CHAT - Drop the typing_indicators table
+-- Database: PostgreSQL 14+
+-- Description: Typing state is kept in memory by the API (api/services/typing.py)
+-- ============================================================================
+
+-- ============================================================================
+-- TABLE: typing_indicators
+-- Never read or written by the API. Typing changes several times per second
+-- per user; storing it would turn keystrokes into row writes, dead tuples and
+-- WAL. It is ephemeral, so nothing is lost by dropping it.
+-- ============================================================================
+DROP TABLE IF EXISTS typing_indicators;
+
+-- ============================================================================
+-- VERIFICATION QUERIES (Run after migration to verify)
+-- ============================================================================
+
+SELECT to_regclass('typing_indicators') IS NULL AS typing_indicators_dropped;
+
+-- ============================================================================
+-- END OF MIGRATION
+-- ============================================================================
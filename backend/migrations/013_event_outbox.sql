@@ -0,0 +1,58 @@
+-- ============================================================================
+-- GROWZONE CHAT - Transactional outbox for real-time events
+-- Database: PostgreSQL 14+
+-- Description: Events written in the same transaction as the change they
+--              describe, delivered afterwards by api/services/outbox.py
+-- ============================================================================
+
+-- ============================================================================
+-- TABLE: chat_outbox
+-- A row exists until its event was delivered (then it is deleted) or gave up
+-- after the maximum attempts (failed_at is set and the row is kept for
+-- inspection). Events of one conversation are delivered in id order.
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS chat_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    conversation_id UUID,
+    recipient_ids INTEGER[] NOT NULL,
+    event_type VARCHAR(30) NOT NULL,
+    payload JSONB NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    last_error TEXT,
+    failed_at TIMESTAMP WITH TIME ZONE
+);
+
+COMMENT ON TABLE chat_outbox IS 'Chat events waiting for delivery to the WebSocket gateway';
+COMMENT ON COLUMN chat_outbox.conversation_id IS 'Ordering key: events of a conversation are delivered in id order (NULL = unordered)';
+COMMENT ON COLUMN chat_outbox.available_at IS 'Not delivered before this time (retry backoff)';
+COMMENT ON COLUMN chat_outbox.failed_at IS 'Set when delivery gave up; the event no longer blocks its conversation';
+
+-- ============================================================================
+-- INDEXES: Pending events in order, and the earlier events of a conversation
+-- (checked so a later event never overtakes one waiting for a retry)
+-- ============================================================================
+CREATE INDEX IF NOT EXISTS idx_chat_outbox_pending
+ON chat_outbox (id)
+WHERE failed_at IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_chat_outbox_conversation_pending
+ON chat_outbox (conversation_id, id)
+WHERE failed_at IS NULL;
+
+-- ============================================================================
+-- VERIFICATION QUERIES (Run after migration to verify)
+-- ============================================================================
+
+SELECT indexname FROM pg_indexes WHERE tablename = 'chat_outbox';
+
+-- Backlog and lag
+SELECT COUNT(*) AS pending, NOW() - MIN(created_at) AS oldest
+FROM chat_outbox
+WHERE failed_at IS NULL;
+
+-- ============================================================================
+-- END OF MIGRATION
+-- ============================================================================
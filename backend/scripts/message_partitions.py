@@ -0,0 +1,142 @@
+"""
+Message Partitions
+Maintenance of the monthly messages partitions (migration 011)
+
+Run from backend/ (DATABASE_URL as for the API):
+    python -m scripts.message_partitions list
+    python -m scripts.message_partitions ensure [--months-ahead 3]
+    python -m scripts.message_partitions detach --keep-months 24
+    python -m scripts.message_partitions archive --keep-months 24 --bucket growzone-chat-archive [--drop]
+
+Schedule ensure daily. detach takes months older than --keep-months out of
+the messages table (the API no longer sees them); archive also copies every
+detached month to S3 as gzipped CSV and, with --drop, drops it afterwards.
+"""
+
+import argparse
+import asyncio
+import gzip
+import os
+import tempfile
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import asyncpg
+import boto3
+
+from api.database import DATABASE_URL
+
+
+ARCHIVE_BUCKET = os.getenv("CHAT_ARCHIVE_BUCKET")
+ARCHIVE_PREFIX = os.getenv("CHAT_ARCHIVE_PREFIX", "messages/")
+S3_REGION = os.getenv("AWS_REGION", "us-east-1")
+S3_ENDPOINT_URL = os.getenv("CHAT_S3_ENDPOINT_URL") or None
+
+_PARTITION_NAME = r"^messages_p[0-9]{4}_[0-9]{2}$"
+
+
+def _dsn(url: str) -> str:
+    """asyncpg takes plain postgresql:// URLs"""
+    return url.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+
+def cutoff(keep_months: int, now: Optional[datetime] = None) -> datetime:
+    """Start of the oldest month to keep (UTC)"""
+    now = now or datetime.now(timezone.utc)
+    months = now.year * 12 + now.month - 1 - keep_months
+    return datetime(months // 12, months % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+async def list_partitions(connection: asyncpg.Connection) -> None:
+    rows = await connection.fetch("""
+        SELECT child.relname, child.reltuples::BIGINT AS estimated_rows,
+               pg_size_pretty(pg_total_relation_size(child.oid)) AS size
+        FROM pg_inherits inh
+        JOIN pg_class child ON child.oid = inh.inhrelid
+        WHERE inh.inhparent = 'messages'::regclass
+        ORDER BY child.relname
+    """)
+    for row in rows:
+        print(f"{row['relname']:<24}{max(row['estimated_rows'], 0):>12} rows  {row['size']}")
+
+    for name in await detached_partitions(connection):
+        print(f"{name:<24}{'detached':>17}")
+
+
+async def detached_partitions(connection: asyncpg.Connection) -> List[str]:
+    """Monthly tables taken out of messages and not dropped yet"""
+    rows = await connection.fetch("""
+        SELECT relname FROM pg_class
+        WHERE relname ~ $1 AND relkind = 'r' AND NOT relispartition
+        ORDER BY relname
+    """, _PARTITION_NAME)
+    return [row["relname"] for row in rows]
+
+
+async def detach(connection: asyncpg.Connection, keep_months: int) -> List[str]:
+    """Detach whole months older than keep_months and fix the unread counters"""
+    async with connection.transaction():
+        names = [
+            row[0] for row in await connection.fetch(
+                "SELECT * FROM detach_message_partitions($1)", cutoff(keep_months)
+            )
+        ]
+        if names:
+            # Unread messages in detached months no longer exist for the API
+            await connection.execute("SELECT reconcile_unread_counters()")
+    for name in names:
+        print(f"detached {name}")
+    return names
+
+
+async def archive(connection: asyncpg.Connection, bucket: str, drop: bool) -> None:
+    """Copy every detached month to S3 (gzipped CSV with header), then optionally drop it"""
+    s3 = boto3.client("s3", region_name=S3_REGION, endpoint_url=S3_ENDPOINT_URL)
+    for name in await detached_partitions(connection):
+        key = f"{ARCHIVE_PREFIX}{name}.csv.gz"
+        with tempfile.NamedTemporaryFile(suffix=".csv.gz") as spool:
+            with gzip.open(spool.name, "wb") as output:
+                await connection.copy_from_table(name, output=output, format="csv", header=True)
+            await asyncio.to_thread(s3.upload_file, spool.name, bucket, key)
+        print(f"archived {name} to s3://{bucket}/{key}")
+
+        if drop:
+            await connection.execute(f'DROP TABLE "{name}"')
+            print(f"dropped {name}")
+
+
+async def main(args: argparse.Namespace) -> None:
+    connection = await asyncpg.connect(_dsn(DATABASE_URL))
+    try:
+        if args.command == "list":
+            await list_partitions(connection)
+        elif args.command == "ensure":
+            created = await connection.fetchval("SELECT ensure_message_partitions($1)", args.months_ahead)
+            print(f"created {created} partition(s)")
+        elif args.command == "detach":
+            await detach(connection, args.keep_months)
+        elif args.command == "archive":
+            await detach(connection, args.keep_months)
+            await archive(connection, args.bucket, args.drop)
+    finally:
+        await connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="Partitions with estimated rows and size, and detached months")
+
+    ensure_parser = commands.add_parser("ensure", help="Create partitions for the coming months")
+    ensure_parser.add_argument("--months-ahead", type=int, default=3)
+
+    detach_parser = commands.add_parser("detach", help="Detach months older than --keep-months")
+    detach_parser.add_argument("--keep-months", type=int, required=True)
+
+    archive_parser = commands.add_parser("archive", help="Detach, then copy detached months to S3")
+    archive_parser.add_argument("--keep-months", type=int, required=True)
+    archive_parser.add_argument("--bucket", default=ARCHIVE_BUCKET, required=ARCHIVE_BUCKET is None)
+    archive_parser.add_argument("--drop", action="store_true", help="Drop each month once uploaded")
+
+    asyncio.run(main(parser.parse_args()))